@@ -0,0 +1,120 @@
+'''Generates reproducible corpora of synthetic ELB and S3 access logs to benchmark against.
+
+Keys are named like those written by AWS (so time ranges and sub-prefix listing behave as they would
+for real logs) and the content of each is drawn from a seeded random generator, so a corpus of the
+same scenario, scale, and seed is always the same.
+'''
+from builtins import range
+from builtins import object
+
+import os
+import gzip
+import random
+import logging
+
+from datetime import datetime, timedelta
+
+_logger = logging.getLogger(__name__)
+
+START = datetime(2016, 8, 4)
+'''Describes the time of the first line in every corpus.'''
+
+class Scenario(object):
+    '''Describes a corpus of keys to generate.
+
+    :param name: the name of the scenario (also the prefix of its keys)
+    :param kind: the kind of log written (``elb`` or ``s3``)
+    :param keys: the number of keys to write
+    :param lines: the number of lines written to each key (before scaling)
+    :param compressed: write the keys gzipped
+    '''
+
+    def __init__(self, name, kind, keys, lines, compressed):
+        self.name = name
+        self.kind = kind
+        self.keys = keys
+        self.lines = lines
+        self.compressed = compressed
+
+SCENARIOS = [
+    Scenario('elb-small-plain', 'elb', 200, 2000, False),
+    Scenario('elb-small-gzip', 'elb', 200, 2000, True),
+    Scenario('elb-huge-plain', 'elb', 2, 200000, False),
+    Scenario('elb-huge-gzip', 'elb', 2, 200000, True),
+    Scenario('s3-small-plain', 's3', 200, 2000, False),
+    Scenario('s3-huge-gzip', 's3', 2, 200000, True),
+]
+'''Describes the scenarios benchmarked by default: many small keys versus a few huge ones.'''
+
+def find_scenario(name):
+    for scenario in SCENARIOS:
+        if scenario.name == name:
+            return scenario
+    raise ValueError('Unknown scenario: ' + name)
+
+def generate(path, scenario, scale=1.0, seed=0):
+    '''Write the keys of a `scenario` into the directory at `path` (unless already written).
+
+    Returns the prefix of the keys written.
+    '''
+    prefix = scenario.name + '/'
+    done_pn = os.path.join(path, '.%s-%s-%s.done' % (scenario.name, scale, seed))
+    if os.path.exists(done_pn):
+        return prefix
+    rng = random.Random('%s:%s' % (scenario.name, seed))
+    lines = max(1, int(scenario.lines * scale))
+    # spread the keys over a day, with each key covering an equal share of it
+    span = timedelta(days=1) // scenario.keys
+    for i in range(scenario.keys):
+        when = START + span * i
+        pn = os.path.join(path, *(prefix + _key_name(scenario, when, i)).split('/'))
+        if not os.path.isdir(os.path.dirname(pn)):
+            os.makedirs(os.path.dirname(pn))
+        step = span // lines
+        data = b''.join(_LINES[scenario.kind](rng, when + step * n) for n in range(lines))
+        if scenario.compressed:
+            with gzip.open(pn, 'wb') as out:
+                out.write(data)
+        else:
+            with open(pn, 'wb') as out:
+                out.write(data)
+    open(done_pn, 'w').close()
+    _logger.info('Generated %d keys of %d lines for %s', scenario.keys, lines, scenario.name)
+    return prefix
+
+######################################################################
+# private
+
+_PATHS = ['/', '/index.html', '/api/v1/users', '/api/v1/orders', '/static/app.js', '/health']
+_AGENTS = ['curl/7.38.0', 'Mozilla/5.0 (X11; Linux x86_64)', 'python-requests/2.12.4']
+_STATUSES = [200] * 90 + [301] * 3 + [404] * 4 + [500] * 2 + [503]
+
+def _key_name(scenario, when, i):
+    suffix = '.gz' if scenario.compressed else ''
+    if scenario.kind == 'elb':
+        return ('AWSLogs/123456789012/elasticloadbalancing/us-west-2/%s'
+                '123456789012_elasticloadbalancing_us-west-2_my-lb_%s_10.0.0.%d_%08x.log%s' %
+                (when.strftime('%Y/%m/%d/'), when.strftime('%Y%m%dT%H%MZ'), i % 4 + 1, i, suffix))
+    return 'access-%s-%016X%s' % (when.strftime('%Y-%m-%d-%H-%M-%S'), i, suffix)
+
+def _elb_line(rng, when):
+    status = rng.choice(_STATUSES)
+    return ('%s my-lb 192.168.%d.%d:%d 10.0.0.%d:80 %.6f %.6f %.6f %d %d 0 %d '
+            '"GET http://www.example.com:80%s HTTP/1.1" "%s" - -\n' % (
+                when.strftime('%Y-%m-%dT%H:%M:%S.%fZ'), rng.randint(0, 255), rng.randint(0, 255),
+                rng.randint(1024, 65535), rng.randint(1, 8), rng.random() / 1000,
+                rng.expovariate(20), rng.random() / 1000, status, status, rng.randint(0, 50000),
+                rng.choice(_PATHS), rng.choice(_AGENTS))).encode('utf-8')
+
+def _s3_line(rng, when):
+    status = rng.choice(_STATUSES)
+    key = 'logs/%08x' % rng.randint(0, 1 << 32)
+    return ('79a59df900b949e55d96a1e698fbacedfd6e09d98eacf8f8d5218e7cd47ef2be my-bucket [%s] '
+            '192.0.2.%d - %016X REST.GET.OBJECT %s "GET /my-bucket/%s HTTP/1.1" %d - %d %d %d %d '
+            '"-" "%s" -\n' % (
+                when.strftime('%d/%b/%Y:%H:%M:%S +0000'), rng.randint(1, 254),
+                rng.randint(0, 1 << 64), key, key, status, rng.randint(0, 50000),
+                rng.randint(0, 50000), rng.randint(1, 200), rng.randint(1, 100),
+                rng.choice(_AGENTS))).encode('utf-8')
+
+_LINES = {'elb': _elb_line, 's3': _s3_line}
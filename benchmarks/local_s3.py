@@ -0,0 +1,150 @@
+'''A local stand-in for S3, serving the files in a directory as the keys of a bucket.
+
+Only what :class:`s3tail.S3Tail` uses is provided: listing (with markers and delimiters), keys with
+a name, size, and etag, and reading a key (optionally from a byte range). Requests for a key's
+content may be slowed by a fixed latency and a fraction of them refused as throttled, as S3 does
+under load, to exercise concurrent fetching and retries.
+'''
+from builtins import object
+
+import os
+import time
+import random
+import logging
+
+from itertools import islice
+
+from boto.s3.prefix import Prefix
+from boto.exception import S3ResponseError
+
+_logger = logging.getLogger(__name__)
+
+SLOW_DOWN_BODY = ('<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>SlowDown</Code>'
+                  '<Message>Please reduce your request rate.</Message></Error>')
+'''Describes the body of the response S3 sends when throttling requests.'''
+
+class LocalConnection(object):
+    '''Connects to buckets held in the directories under `root`.
+
+    :param root: the directory holding a directory for each bucket
+    :param latency: the number of seconds each request for a key's content waits before it is served
+    :param slow_down: the fraction of requests for a key's content refused with ``503 SlowDown``
+    '''
+
+    def __init__(self, root, latency=0, slow_down=0):
+        self._root = root
+        self._latency = latency
+        self._slow_down = slow_down
+
+    def get_bucket(self, bucket_name):
+        return LocalBucket(bucket_name, os.path.join(self._root, bucket_name),
+                           latency=self._latency, slow_down=self._slow_down)
+
+class LocalBucket(object):
+    '''Lists the files under a directory in the same order S3 would list them.
+
+    The directory is scanned once when created, so files added later are not found.
+
+    :param name: the name of the bucket
+    :param path: the directory holding the files (with ``/`` separating key name directories)
+    :param latency: the number of seconds each request for a key's content waits before it is served
+    :param slow_down: the fraction of requests for a key's content refused with ``503 SlowDown``
+    '''
+
+    def __init__(self, name, path, latency=0, slow_down=0):
+        self.name = name
+        self.latency = latency
+        self.slow_down = slow_down
+        self._path = path
+        names = []
+        for dirpath, _, filenames in os.walk(path):
+            relative = os.path.relpath(dirpath, path)
+            for filename in filenames:
+                pn = filename if relative == os.curdir else os.path.join(relative, filename)
+                names.append(pn.replace(os.sep, '/'))
+        self._names = sorted(names)
+
+    def list(self, prefix='', delimiter='', marker=''):
+        last_prefix = None
+        for name in self._names:
+            if not name.startswith(prefix) or (marker and name <= marker):
+                continue
+            if delimiter:
+                found = name.find(delimiter, len(prefix))
+                if found > -1:
+                    common = name[:found + len(delimiter)]
+                    if common != last_prefix:
+                        last_prefix = common
+                        yield Prefix(self, common)
+                    continue
+            yield self.new_key(name)
+
+    def get_all_keys(self, prefix='', marker='', delimiter='', max_keys=1000):
+        '''Get a page of keys, listing all those in it before any prefixes (as S3 does).'''
+        items = (item for item in self.list(prefix=prefix, delimiter=delimiter, marker=marker)
+                 if item.name != marker) # (a prefix is not listed again after being the marker)
+        items = list(islice(items, max_keys + 1))
+        page = LocalPage(item for item in items[:max_keys] if not isinstance(item, Prefix))
+        page += [item for item in items[:max_keys] if isinstance(item, Prefix)]
+        page.is_truncated = len(items) > max_keys
+        page.next_marker = items[max_keys - 1].name if page.is_truncated and delimiter else None
+        return page
+
+    def get_key(self, name):
+        return self.new_key(name) if name in self._names else None
+
+    def new_key(self, name):
+        return LocalKey(self, name, os.path.join(self._path, *name.split('/')))
+
+class LocalPage(list):
+    '''Holds a page of listed keys, like boto's result set.'''
+
+    is_truncated = False
+    next_marker = None
+
+class LocalKey(object):
+    '''Reads a file as the content of a key.
+
+    The etag is made from the file's modification time and size (rather than its MD5), which is
+    enough to tell when a cached copy is out of date.
+    '''
+
+    def __init__(self, bucket, name, pn):
+        self.bucket = bucket
+        self.name = name
+        self._pn = pn
+        self._file = None
+        self._end = None
+        if os.path.exists(pn):
+            stat = os.stat(pn)
+            self.size = stat.st_size
+            self.etag = '"%x-%x"' % (int(stat.st_mtime * 1000), stat.st_size)
+        else:
+            self.size = None
+            self.etag = None
+
+    def open(self, headers=None):
+        self.close()
+        if self.bucket.latency:
+            time.sleep(self.bucket.latency)
+        if self.bucket.slow_down and random.random() < self.bucket.slow_down:
+            raise S3ResponseError(503, 'Slow Down', SLOW_DOWN_BODY)
+        self._file = open(self._pn, 'rb')
+        self._end = None
+        if headers and 'Range' in headers:
+            start, end = headers['Range'][len('bytes='):].split('-')
+            self._file.seek(int(start))
+            self._end = int(end) + 1 if end else None
+
+    def read(self, size=-1):
+        if not self._file:
+            self.open()
+        if self._end is not None:
+            remaining = max(self._end - self._file.tell(), 0)
+            size = remaining if size is None or size < 0 else min(size, remaining)
+        return self._file.read(size)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,59 @@
+'''Measures how long the s3tail command takes to start, failing when it takes longer than a target.
+
+Each command is run in a new interpreter a number of times and the median time is reported (the
+cost of starting the interpreter itself is measured too, for comparison). Run it from the top of the
+repository::
+
+    $ python -m benchmarks.startup
+    $ python -m benchmarks.startup --target 100  # exits non-zero when any command is slower
+'''
+from __future__ import division
+from builtins import range
+
+import os
+import sys
+import time
+import subprocess
+import click
+
+COMMANDS = [
+    ('interpreter', ['-c', 'pass']),
+    ('import', ['-c', 'import s3tail.cli']),
+    ('help', ['-m', 's3tail.cli', '--help']),
+]
+'''Describes the commands timed (as arguments to the Python interpreter).'''
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+@click.option('--repeat', type=int, default=10, show_default=True,
+              help='Number of times to run each command')
+@click.option('--target', type=float, default=150, show_default=True, metavar='MILLISECONDS',
+              help='Most milliseconds (beyond starting the interpreter) a command may take')
+def main(repeat, target):
+    '''Benchmark starting the s3tail command.'''
+    baseline = None
+    failures = 0
+    click.echo('command\tmedian_ms\tbeyond_interpreter_ms')
+    for name, args in COMMANDS:
+        times = sorted(_run(args) for _ in range(max(repeat, 1)))
+        median = times[len(times) // 2] * 1000
+        if baseline is None:
+            baseline = median
+        beyond = median - baseline
+        line = '%s\t%.1f\t%.1f' % (name, median, beyond)
+        if beyond > target:
+            line += '\tSLOWER THAN %d' % target
+            failures += 1
+        click.echo(line)
+    sys.exit(1 if failures else 0)
+
+######################################################################
+# private
+
+def _run(args):
+    started = time.time()
+    with open(os.devnull, 'wb') as devnull:
+        subprocess.check_call([sys.executable] + args, stdout=devnull)
+    return time.time() - started
+
+if __name__ == '__main__':
+    main()
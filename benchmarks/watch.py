@@ -0,0 +1,200 @@
+'''Measures the throughput of :func:`s3tail.S3Tail.watch` against a local stand-in for S3.
+
+Each scenario (see :mod:`benchmarks.corpus`) is read without a cache, then with a cold cache (every
+key downloaded) and a warm one (every key found in the cache). Each run happens in its own process
+so that its peak memory use is measured on its own. Run it from the top of the repository::
+
+    $ python -m benchmarks.watch --scale 0.1 --repeat 1
+    $ python -m benchmarks.watch --json results.json
+    $ python -m benchmarks.watch --baseline results.json  # exits non-zero on a regression
+    $ python -m benchmarks.watch --latency 0.05 --slow-down 0.1 --prefetch 200 --async-fetch
+'''
+from __future__ import division
+from builtins import range
+from builtins import object
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import resource
+import tempfile
+import click
+
+from multiprocessing import Process, Queue
+
+from s3tail import S3Tail
+
+from .corpus import SCENARIOS, find_scenario, generate
+from .local_s3 import LocalConnection
+
+BUCKET = 'bench'
+'''Describes the name of the local bucket holding the corpora.'''
+
+PHASES = ['nocache', 'cold', 'warm']
+'''Describes the runs made of each scenario (in order, as warm relies on cold filling the cache).'''
+
+COLUMNS = ['lines_per_sec', 'mb_per_sec', 'seconds', 'peak_rss_mb', 'hits', 'hit_seconds', 'misses',
+           'miss_seconds']
+'''Describes the results reported for each run.'''
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+@click.option('--work-dir', type=click.Path(file_okay=False),
+              default=os.path.join(tempfile.gettempdir(), 's3tail-bench'), show_default=True,
+              help='Where corpora (kept between runs) and caches are written')
+@click.option('-s', '--scenario', 'names', multiple=True, metavar='NAME',
+              help='Scenario to run (may be repeated; defaults to all of: %s)' %
+              ', '.join(s.name for s in SCENARIOS))
+@click.option('--scale', type=float, default=1.0, show_default=True,
+              help='Multiplier for the number of lines in each key')
+@click.option('--seed', type=int, default=0, show_default=True,
+              help='Seed for generating the corpora')
+@click.option('--repeat', type=int, default=3, show_default=True,
+              help='Number of times to make each run, reporting the fastest')
+@click.option('--prefetch', type=int, default=0, show_default=True,
+              help='Number of upcoming keys to download in the background')
+@click.option('--async-fetch', is_flag=True,
+              help='Prefetch keys from an asyncio event loop, retrying throttled requests')
+@click.option('--latency', type=float, default=0, show_default=True,
+              help='Seconds each request for a key waits before it is served')
+@click.option('--slow-down', type=float, default=0, show_default=True,
+              help='Fraction of requests for keys refused as throttled (503 SlowDown)')
+@click.option('--cache-compress', is_flag=True, help='Store files in the cache compressed')
+@click.option('--chunks', is_flag=True,
+              help='Handle runs of whole lines (as the CLI does) instead of each line')
+@click.option('--json', 'json_pn', type=click.Path(dir_okay=False, writable=True),
+              help='Write the results to a JSON file (e.g. for use as a later baseline)')
+@click.option('--baseline', type=click.File(), metavar='FILENAME',
+              help='Results from a previous run to compare with')
+@click.option('--tolerance', type=float, default=0.1, show_default=True,
+              help='Fraction of the baseline lines/sec a run may fall below before it is reported '
+              'as a regression')
+def main(work_dir, names, scale, seed, repeat, prefetch, async_fetch, latency, slow_down,
+         cache_compress, chunks, json_pn, baseline, tolerance):
+    '''Benchmark reading synthetic logs from a local stand-in for S3.'''
+    logging.basicConfig(level=logging.WARNING)
+    scenarios = [find_scenario(name) for name in names] if names else SCENARIOS
+    root = os.path.join(work_dir, 'buckets')
+    bucket_path = os.path.join(root, BUCKET)
+    if not os.path.isdir(bucket_path):
+        os.makedirs(bucket_path)
+    options = dict(prefetch=prefetch, async_fetch=async_fetch, cache_compress=cache_compress)
+    stand_in = dict(latency=latency, slow_down=slow_down)
+    baseline = json.load(baseline)['results'] if baseline else {}
+    results = {}
+    regressions = 0
+    click.echo('\t'.join(['scenario', 'phase'] + COLUMNS))
+    for scenario in scenarios:
+        prefix = generate(bucket_path, scenario, scale, seed)
+        cache_path = os.path.join(work_dir, 'cache')
+        for phase in PHASES:
+            result = None
+            for _ in range(max(repeat, 1)):
+                if phase == 'cold':
+                    shutil.rmtree(cache_path, ignore_errors=True)
+                run = _run(root, prefix, None if phase == 'nocache' else cache_path, chunks,
+                           options, stand_in)
+                if result is None or run['seconds'] < result['seconds']:
+                    result = run
+            name = '%s/%s' % (scenario.name, phase)
+            results[name] = result
+            line = '\t'.join([scenario.name, phase] + [_text(result[c]) for c in COLUMNS])
+            expected = baseline.get(name, {}).get('lines_per_sec')
+            if expected:
+                change = result['lines_per_sec'] / expected - 1
+                line += '\t%+.1f%%' % (change * 100)
+                if change < -tolerance:
+                    line += ' REGRESSION'
+                    regressions += 1
+            click.echo(line)
+        shutil.rmtree(cache_path, ignore_errors=True)
+    if json_pn:
+        with open(json_pn, 'w') as out:
+            json.dump(dict(scale=scale, seed=seed, options=options, stand_in=stand_in,
+                           chunks=chunks, results=results), out, indent=2, sort_keys=True)
+    sys.exit(1 if regressions else 0)
+
+######################################################################
+# private
+
+def _text(value):
+    return '%.2f' % value if isinstance(value, float) else str(value)
+
+def _run(root, prefix, cache_path, chunks, options, stand_in):
+    '''Watch the keys under `prefix` in a new process, returning what was measured.'''
+    results = Queue()
+    process = Process(target=_watch, args=(results, root, prefix, cache_path, chunks, options,
+                                           stand_in))
+    process.start()
+    result = results.get()
+    process.join()
+    if 'error' in result:
+        raise click.ClickException(result['error'])
+    return result
+
+def _watch(results, root, prefix, cache_path, chunks, options, stand_in):
+    try:
+        results.put(_Measured(root, prefix, cache_path, chunks, options, stand_in).run())
+    except Exception as exc:
+        results.put(dict(error='%s: %s' % (type(exc).__name__, exc)))
+
+class _Measured(object):
+    def __init__(self, root, prefix, cache_path, chunks, options, stand_in):
+        self.lines = 0
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self.hit_seconds = self.miss_seconds = 0.0
+        self._key_started = None
+        self._key_cached = None
+        handlers = dict(chunk_handler=self._handle_chunk) if chunks else {}
+        self._tail = S3Tail(None, BUCKET, prefix, self._handle_line, key_handler=self._handle_key,
+                            cache_path=cache_path, hours=1 if cache_path else 0,
+                            connection=LocalConnection(root, **stand_in),
+                            **dict(options, **handlers))
+
+    def run(self):
+        started = time.time()
+        self._tail.watch()
+        self._end_key()
+        self._tail.cleanup()
+        seconds = time.time() - started
+        return dict(lines=self.lines, bytes=self.bytes, seconds=seconds,
+                    lines_per_sec=self.lines / seconds, mb_per_sec=self.bytes / seconds / 1e6,
+                    peak_rss_mb=_peak_rss_mb(), hits=self.hits, hit_seconds=self.hit_seconds,
+                    misses=self.misses, miss_seconds=self.miss_seconds)
+
+    def _handle_key(self, name, cache_pn, cached):
+        self._end_key()
+        self._key_started = time.time()
+        self._key_cached = cached
+        return True
+
+    def _end_key(self):
+        if self._key_started is None:
+            return
+        elapsed = time.time() - self._key_started
+        if self._key_cached:
+            self.hits += 1
+            self.hit_seconds += elapsed
+        else:
+            self.misses += 1
+            self.miss_seconds += elapsed
+        self._key_started = None
+
+    def _handle_line(self, num, line):
+        self.lines += 1
+        self.bytes += len(line) + 1
+
+    def _handle_chunk(self, num, data):
+        self.lines += data.count(b'\n')
+        self.bytes += len(data)
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in kilobytes on Linux, but bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+if __name__ == '__main__':
+    main()
@@ -2,4 +2,14 @@ __author__ = 'Brad Robel-Forrest'
 __email__ = 'brad@bitpony.com'
 __version__ = '0.2.1'
 
-from .s3tail import S3Tail
+import sys
+
+if sys.version_info < (3, 7):
+    from .s3tail import S3Tail
+else:
+    def __getattr__(name):
+        # import S3Tail (and boto along with it) only when used, keeping the CLI quick to start
+        if name == 'S3Tail':
+            from .s3tail import S3Tail
+            return S3Tail
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
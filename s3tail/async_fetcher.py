@@ -0,0 +1,138 @@
+'''Fetches keys concurrently from an asyncio event loop, retrying requests S3 throttles.
+
+Requires Python 3.7 or later.
+'''
+from builtins import object
+
+import random
+import asyncio
+import logging
+
+from collections import deque
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+
+_logger = logging.getLogger(__name__)
+
+class AsyncFetcher(object):
+    '''Fetches upcoming keys from an event loop while earlier keys are being processed.
+
+    Iterating over a fetcher yields ``(key, result)`` tuples in exactly the order the keys were
+    provided, just like a :class:`.prefetcher.Prefetcher`, but the fetches are scheduled on an
+    asyncio event loop running in a background thread. The requests made by `fetch` block, so each
+    attempt runs on one of `count` executor threads, sharing the connection's pool of keep-alive
+    HTTP connections. When a fetch fails because S3 is throttling requests (e.g. ``503 SlowDown``),
+    it is retried after an exponential backoff (with jitter) waited out on the event loop, leaving
+    its thread free for other keys in the meantime. This allows one process to keep hundreds of
+    requests in flight.
+
+    Each retry is counted as ``fetch_retries`` (and the time waited as ``fetch_backoff_seconds``) in
+    the `stats`, when provided.
+
+    :param keys: an iterable of keys to fetch
+    :param fetch: a function called from an executor thread with a key, returning its result
+    :param count: the number of keys to fetch ahead (and the most requests made at once)
+    :param retries: the number of times to retry a throttled fetch before giving up
+    :param backoff: the number of seconds to wait before the first retry (doubled for each retry)
+    :param stats: a :class:`.run_stats.RunStats` counting the retries
+    '''
+
+    RETRIES = 5
+    '''Describes the default number of times to retry a throttled fetch.'''
+
+    BACKOFF = 0.1
+    '''Describes the default number of seconds to wait before the first retry.'''
+
+    MAX_BACKOFF = 20
+    '''Describes the most seconds to wait between retries, no matter how many were made.'''
+
+    THROTTLED_STATUSES = (500, 503)
+    '''Describes the HTTP statuses of failed requests that are worth retrying.'''
+
+    THROTTLED_CODES = ('SlowDown', 'ServiceUnavailable', 'InternalError', 'RequestTimeout')
+    '''Describes the S3 error codes of failed requests that are worth retrying.'''
+
+    def __init__(self, keys, fetch, count, retries=RETRIES, backoff=BACKOFF, stats=None):
+        self._keys = iter(keys)
+        self._fetch = fetch
+        self._count = count
+        self._retries = retries
+        self._backoff = backoff
+        self._stats = stats
+        self._pending = deque()
+        self._exhausted = False
+        self._loop = None
+        self._thread = None
+        self._executor = None
+
+    def __iter__(self):
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(self._count, thread_name_prefix='fetch')
+        self._thread = Thread(target=self._run, name='fetch-loop')
+        self._thread.daemon = True # never hold up process exit on a slow download
+        self._thread.start()
+        try:
+            self._fill()
+            while self._pending:
+                key, future = self._pending.popleft()
+                self._fill()
+                yield key, future.result()
+        finally:
+            self.stop()
+
+    def stop(self):
+        '''Cancel any keys not yet fetched and let the event loop and executor threads exit.'''
+        while self._pending:
+            self._pending.popleft()[1].cancel()
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._executor.shutdown(wait=False)
+            self._loop = None
+
+    @classmethod
+    def throttled(cls, exc):
+        '''Report if an error raised by a fetch shows S3 is asking for requests to slow down.'''
+        return (getattr(exc, 'status', None) in cls.THROTTLED_STATUSES or
+                getattr(exc, 'error_code', None) in cls.THROTTLED_CODES)
+
+    ######################################################################
+    # private
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    def _fill(self):
+        while not self._exhausted and len(self._pending) < self._count:
+            try:
+                key = next(self._keys)
+            except StopIteration:
+                self._exhausted = True
+                return
+            future = asyncio.run_coroutine_threadsafe(self._fetch_with_retries(key), self._loop)
+            self._pending.append((key, future))
+
+    async def _fetch_with_retries(self, key):
+        delay = self._backoff
+        attempt = 0
+        while True:
+            try:
+                return await self._loop.run_in_executor(self._executor, self._fetch, key)
+            except Exception as exc:
+                if attempt >= self._retries or not self.throttled(exc):
+                    raise
+                attempt += 1
+                wait = delay / 2 + random.uniform(0, delay / 2)
+                _logger.info('Retrying %s in %.2f seconds (attempt %d of %d): %s',
+                             getattr(key, 'name', key), wait, attempt, self._retries, exc)
+                if self._stats:
+                    self._stats.count('fetch_retries')
+                    self._stats.count('fetch_backoff_seconds', wait)
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, self.MAX_BACKOFF)
@@ -1,7 +1,8 @@
+import time
 import logging
 
-from queue import Queue
-from threading import Thread
+from collections import deque
+from threading import Thread, Condition
 
 _logger = logging.getLogger(__name__)
 
@@ -9,45 +10,122 @@ class BackgroundWriter(Thread):
     class WriteAfterDone(Exception):
         '''Indicates when an action is taken after requested to stop.'''
 
-    def __init__(self, writer, done_callback=None):
+    HIGH_WATER = 8 * (1024*1024) # MiB
+    '''Describes the number of bytes allowed to be queued before callers of write are blocked.'''
+
+    COALESCE_SIZE = 1 * (1024*1024) # MiB
+    '''Describes the number of bytes of queued chunks that may be combined into a single write.'''
+
+    def __init__(self, writer, done_callback=None, high_water=HIGH_WATER,
+                 coalesce_size=COALESCE_SIZE):
         '''Wraps a writer I/O object with background write calls.
 
         Optionally, will call the done_callback just before the thread stops (to allow caller to
-        close/operate on the writer)
+        close/operate on the writer), even when writing failed.
+
+        If a write fails, the error is kept in :attr:`error` and raised by any later call to write
+        (or by join).
+
+        Once `high_water` bytes are waiting to be written, calls to write will block until the
+        writer catches up, keeping memory use flat no matter how much data passes through. Queued
+        chunks are combined into writes of up to `coalesce_size` bytes (0 disables coalescing).
+
+        The following are tracked for reporting on how well the writer is keeping up:
+        ``max_depth`` (most chunks queued), ``max_queued_bytes``, ``stalls`` (number of writes that
+        had to wait), ``stall_time`` (seconds spent waiting) and ``writes`` (calls to the writer).
         '''
         super(BackgroundWriter, self).__init__()
-        _logger = logging.getLogger('s3tail.writer')
         self._done = False
         self._done_callback = done_callback
-        self._queue = Queue()
+        self._high_water = high_water
+        self._coalesce_size = coalesce_size
+        self._cond = Condition()
+        self._chunks = deque()
+        self._queued = 0
+        self._finished = False
+        self.error = None
         self._writer = writer
         self.name = writer.name
+        self.max_depth = 0
+        self.max_queued_bytes = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.writes = 0
 
     def write(self, data):
         if self._done:
             raise self.WriteAfterDone('Refusing to write when stopping ' + self.name)
-        self._queue.put(data)
+        if not data:
+            return
+        with self._cond:
+            if self._queued >= self._high_water and not self._finished:
+                self.stalls += 1
+                started = time.time()
+                while self._queued >= self._high_water and not self._finished:
+                    self._cond.wait()
+                self.stall_time += time.time() - started
+            if self.error:
+                raise self.error
+            self._chunks.append(data)
+            self._queued += len(data)
+            self.max_depth = max(self.max_depth, len(self._chunks))
+            self.max_queued_bytes = max(self.max_queued_bytes, self._queued)
+            self._cond.notify_all()
 
     def mark_done(self):
         if not self._done:
             self._done = True
             _logger.debug('Asked to stop writing to %s', self.name)
-            self._queue.put(True)
+            with self._cond:
+                self._cond.notify_all()
 
     def join(self, timeout=None):
         _logger.debug('Joining %s', self.name)
         self.mark_done()
-        self._queue.join()
         super(BackgroundWriter, self).join(timeout)
+        if self.error:
+            raise self.error
 
     def run(self):
-        while True:
-            data = self._queue.get()
-            if data is True:
-                _logger.debug('Stopping %s', self.name)
-                self._queue.task_done()
-                if self._done_callback:
-                    self._done_callback(self._writer)
-                return
-            self._writer.write(data)
-            self._queue.task_done()
+        try:
+            while True:
+                with self._cond:
+                    while not self._chunks and not self._done:
+                        self._cond.wait()
+                    if not self._chunks:
+                        break
+                    data = self._take()
+                self._writer.write(data)
+                self.writes += 1
+                with self._cond:
+                    self._queued -= len(data)
+                    self._cond.notify_all()
+        except Exception as exc:
+            _logger.warning('Unable to write to %s: %s', self.name, exc)
+            self.error = exc
+        finally:
+            with self._cond:
+                self._finished = True # never leave a caller blocked on a writer that has died
+                self._chunks.clear()
+                self._queued = 0
+                self._cond.notify_all()
+        _logger.debug('Stopping %s (writes=%d max_depth=%d max_queued_bytes=%d stalls=%d '
+                      'stall_time=%.3f)', self.name, self.writes, self.max_depth,
+                      self.max_queued_bytes, self.stalls, self.stall_time)
+        if self._done_callback:
+            self._done_callback(self._writer)
+
+    ######################################################################
+    # private
+
+    def _take(self):
+        data = self._chunks.popleft()
+        if len(data) >= self._coalesce_size or not self._chunks:
+            return data
+        parts = [data]
+        size = len(data)
+        while self._chunks and size + len(self._chunks[0]) <= self._coalesce_size:
+            data = self._chunks.popleft()
+            parts.append(data)
+            size += len(data)
+        return b''.join(parts)
@@ -3,26 +3,52 @@ from builtins import range
 from builtins import object
 
 import os
+import time
+import errno
 import logging
 import zlib
 
+from io import BytesIO
+from functools import partial
+
 from hashlib import sha256
 from tempfile import NamedTemporaryFile
 
+from . import compression
 from .background_writer import BackgroundWriter
+from .cache_index import CacheIndex
+from .gzip_index import GzipIndex, CheckpointCompressor
 from .old_file_cleaner import OldFileCleaner
+from .parallel_decompressor import ParallelDecompressor
+from .run_stats import RunStats
 
 _logger = logging.getLogger(__name__)
 
 class Cache(object):
     readers = []
 
-    def __init__(self, path, hours):
+    COMPRESS_LEVEL = 1
+    '''Describes the zlib level used when compressing files that were not already compressed.'''
+
+    PARTIAL_SUFFIX = '.partial'
+    '''Describes the suffix of a file holding only the first part of an object read from S3.'''
+
+    FETCH_SIZE = 1024 * 1024
+    '''Describes the number of bytes read at once when storing an object ahead of it being read.'''
+
+    def __init__(self, path, hours, clean=True, compress=False, max_bytes=0, checkpoint_bytes=0,
+                 decompress_threads=0, stats=None):
         self.path = path
+        self.stats = stats or RunStats()
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.checkpoint_bytes = checkpoint_bytes
+        self.decompress_threads = decompress_threads
         self.enabled = True
         if not self.path or hours < 1:
             self.enabled = False
             return
+        self._index = CacheIndex(path)
         if not os.path.isdir(path):
             os.mkdir(path)
             # create shard buckets for sha hexstring names
@@ -30,85 +56,410 @@ class Cache(object):
             for i in chars:
                 for j in chars:
                     os.mkdir(os.path.join(path, chr(i)+chr(j)))
-        else:
-            cleaner = OldFileCleaner(path, hours)
+        elif clean:
+            cleaner = OldFileCleaner(self._index, hours)
             cleaner.start()
 
-    def lookup(self, name):
+    def lookup(self, name, etag=None, size=None):
         if self.enabled:
-            cache_pn = self._cache_path_for(name)
-            cached = os.path.exists(cache_pn)
+            cache_pn = self._cache_path_for(name, etag, size)
+            cached = self._index.lookup(cache_pn)
             return (cache_pn, cached)
         return (None, False)
 
-    def open(self, name, reader):
+    def open(self, name, reader, etag=None, size=None, bucket=None, cached=None):
+        '''Open a reader of an object, from the cache when stored or storing it as it is read.
+
+        When `cached` is given (as just reported by :func:`lookup`), it is not looked up again.
+        '''
+        reader = self.stats.timed(reader, 'fetch')
         if not self.enabled:
-            return self._open_reader(name, reader)
+            return self._open_reader(reader)
 
-        cache_pn, cached = self.lookup(name)
+        cache_pn, cached = self._looked_up(name, etag, size, cached)
         if cached:
-            if _logger.isEnabledFor(logging.DEBUG):
-                _logger.debug('Found %s in cache: %s', name, cache_pn)
-            else:
-                _logger.info('Found %s in cache', name)
-                return open(cache_pn)
+            cached = self._found(name, cache_pn, bucket)
+            if cached:
+                return cached
+        reader, codec = self._storing(name, reader, cache_pn, etag, size, bucket)
+        if codec:
+            reader = self._Decompressor(reader, codec, stats=self.stats)
+        return reader
+
+    def fetch(self, name, reader, etag=None, size=None, bucket=None, cached=None):
+        '''Store an object in the cache ahead of it being read, returning a reader of the file.
+
+        Unlike :func:`open`, nothing is returned until the whole object is stored, and none of it is
+        held in memory. Returns ``None`` when the cache is disabled or the object was not stored.
+        '''
+        if not self.enabled:
+            return None
+        cache_pn, cached = self._looked_up(name, etag, size, cached)
+        if not cached:
+            stored, _ = self._storing(name, self.stats.timed(reader, 'fetch'), cache_pn, etag, size,
+                                      bucket)
+            try:
+                while stored.read(self.FETCH_SIZE):
+                    pass
+            finally:
+                stored.close()
+                stored.cleanup() # (wait for the file to be placed)
+        return self._found(name, cache_pn, bucket)
 
-        return self._Reader(name, self._open_reader(name, reader), cache_pn)
+    def open_at(self, name, reader, offset, etag=None, size=None, bucket=None, cached=None):
+        '''Open a reader already positioned `offset` bytes into the (decompressed) content.
+
+        Returns ``None`` if this is not possible without first reading everything before `offset`
+        (i.e. when the content must be decompressed and was not stored with checkpoints).
+        '''
+        if self.enabled:
+            cache_pn, cached = self._looked_up(name, etag, size, cached)
+            if cached:
+                try:
+                    cached = self._open_cached(cache_pn)
+                except (IOError, OSError) as exc:
+                    if exc.errno != errno.ENOENT: raise
+                    return None
+                if isinstance(cached, (self._Decompressor, ParallelDecompressor)):
+                    cached.close()
+                    return self._open_checkpoint(name, cache_pn, offset, bucket)
+                cached.seek(offset)
+                self._index.touch(cache_pn, name, bucket)
+                self.stats.count('cache_bytes', max(os.path.getsize(cache_pn) - offset, 0))
+                _logger.info('Found %s in cache (starting at byte %d)', name, offset)
+                return cached
+        if size is None or self._peek(reader, size):
+            return None # (without a size, even a ranged request for the start might be refused)
+        _logger.info('Starting %s at byte %d', name, offset)
+        # (not cached, as the start is never read)
+        return self._Ranged(self.stats.timed(reader, 'fetch'), offset, size)
 
     def cleanup(self):
-        for reader in self.readers:
+        for reader in list(self.readers): # readers remove themselves once placed
             reader.cleanup()
+        if self.enabled:
+            self._index.close()
 
     ######################################################################
     # private
 
-    def _cache_path_for(self, name):
-        safe_name = sha256(name).hexdigest()
+    def _cache_path_for(self, name, etag, size):
+        if etag:
+            # address by content so the same object under any key (or bucket) shares one file and a
+            # rewritten key is never served stale
+            name = 'etag:%s:%s' % (etag.strip('"'), size)
+        # (the content decides its codec, but the options decide how it is stored)
+        name += ':' + self._storage_form()
+        safe_name = sha256(name.encode('utf-8')).hexdigest()
         return os.path.join(self.path, safe_name[0:2], safe_name)
 
-    def _open_reader(self, name, reader):
-        reader.open()
-        if name.endswith('.gz'): # TODO: lame! use header magic numbers for decompression algorithm
-            # return GzipFile(fileobj=reader)
-            return self._Decompressor(reader)
+    def _looked_up(self, name, etag, size, cached):
+        if cached is None:
+            return self.lookup(name, etag, size)
+        return self._cache_path_for(name, etag, size), cached
+
+    def _found(self, name, cache_pn, bucket):
+        '''Open a file found in the cache (or return ``None`` when it has gone missing).'''
+        try:
+            cached = self._open_cached(cache_pn)
+        except (IOError, OSError) as exc:
+            if exc.errno != errno.ENOENT: raise
+            _logger.warning('Missing %s from cache: %s', name, cache_pn)
+            self._index.discard(cache_pn)
+            return None
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('Found %s in cache: %s', name, cache_pn)
+        else:
+            _logger.info('Found %s in cache', name)
+        self._index.touch(cache_pn, name, bucket)
+        self.stats.count('cache_bytes', os.path.getsize(cache_pn))
+        return cached
+
+    def _storing(self, name, reader, cache_pn, etag, size, bucket):
+        '''Get a reader storing an object in the cache as it is read, along with any codec left to
+        decompress what it returns.'''
+        placed = partial(self._placed, bucket, name, etag)
+        # (without an ETag, the file is addressed by name, so its start might be of an older object)
+        resume_pn, offset = self._claim_partial(cache_pn, size) if etag else (None, 0)
+        if resume_pn:
+            # a partial file holds the start of the object, so it shows how the object is compressed
+            with open(resume_pn, 'rb') as saved:
+                codec = compression.detect(saved.read(compression.magic_size()))
+            if not self._stores_raw(codec):
+                self._discard_temporary(resume_pn) # kept with different options; start over
+                resume_pn = None
+        if not resume_pn:
+            reader = self._Peeked(reader)
+            codec = reader.codec
+        raw = self._stores_raw(codec)
+
+        # only the raw bytes of an object can be continued later with a ranged request
+        if resume_pn:
+            _logger.info('Resuming %s from byte %d', name, offset)
+            reader = self._Ranged(reader, offset, size)
+        elif codec and not raw:
+            reader = self._Decompressor(reader, codec, stats=self.stats)
+        compressor = self._compressor() if self.compress and not raw else None
+        # write to a tempfile in case of failure; moved into place when writing is complete
+        tempfile = open(resume_pn, 'ab') if resume_pn else self._temporary(cache_pn)
+        try:
+            reader = self._Reader(name, reader, cache_pn, tempfile, placed, self._index.release,
+                                  compressor, keep_partial=raw and bool(etag), stats=self.stats)
+        except:
+            tempfile.close()
+            self._discard_temporary(tempfile.name)
+            raise
+        if resume_pn:
+            reader = self._Stitched(resume_pn, offset, reader)
+        return reader, codec if raw else None
+
+    def _placed(self, bucket, name, etag, cache_pn):
+        self._index.add(cache_pn, os.path.getsize(cache_pn), name, etag, bucket)
+        if self.max_bytes > 0:
+            self._index.evict(self.max_bytes)
+
+    def _storage_form(self):
+        '''Describe how files are stored with the current options (e.g. with checkpoints).'''
+        if not self.compress:
+            return 'plain'
+        return 'checkpoints' if self.checkpoint_bytes > 0 else 'compressed'
+
+    def _stores_raw(self, codec):
+        '''Report if an object's bytes are stored in the cache exactly as they are found in S3.'''
+        if self.compress:
+            # store what is compressed as-is and compress the rest, decompressing only for the
+            # caller (unless building checkpoints, which requires compressing everything ourselves)
+            return codec is not None and self.checkpoint_bytes < 1
+        return codec is None
+
+    def _claim_partial(self, cache_pn, size):
+        '''Take ownership of any partial file left from a previous read, returning its name and
+        size.'''
+        partial_pn = cache_pn + self.PARTIAL_SUFFIX
+        if not self._index.lookup(partial_pn):
+            return (None, 0)
+        self._index.discard(partial_pn)
+        claimed = self._temporary(cache_pn)
+        claimed.close()
+        try:
+            os.rename(partial_pn, claimed.name) # so no other reader will also append to it
+        except OSError as exc:
+            self._discard_temporary(claimed.name)
+            if exc.errno != errno.ENOENT: raise
+            return (None, 0)
+        offset = os.path.getsize(claimed.name)
+        if size is not None and offset > size:
+            self._discard_temporary(claimed.name)
+            return (None, 0)
+        return (claimed.name, offset)
+
+    def _temporary(self, cache_pn):
+        '''Create a temporary file beside where a file will be placed, recorded in the index until
+        released (so it is removed if abandoned).'''
+        head, tail = os.path.split(cache_pn)
+        tempfile = NamedTemporaryFile(dir=head, prefix=tail+'_', delete=False)
+        self._index.hold(tempfile.name)
+        return tempfile
+
+    def _discard_temporary(self, temp_pn):
+        os.remove(temp_pn)
+        self._index.release(temp_pn)
+
+    def _compressor(self):
+        if self.checkpoint_bytes > 0:
+            return CheckpointCompressor(self.COMPRESS_LEVEL, self.checkpoint_bytes)
+        return zlib.compressobj(self.COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def _open_checkpoint(self, name, cache_pn, offset, bucket):
+        index = GzipIndex.load(cache_pn + GzipIndex.SUFFIX)
+        checkpoint = index and index.find(offset)
+        if not checkpoint:
+            return None
+        cached = open(cache_pn, 'rb')
+        cached.seek(checkpoint[1])
+        self._index.touch(cache_pn, name, bucket)
+        _logger.info('Found %s in cache (starting at byte %d from checkpoint at %d)',
+                     name, offset, checkpoint[0])
+        return self._Decompressor(cached, compression.DEFLATE, offset - checkpoint[0], self.stats)
+
+    def _open_reader(self, reader):
+        reader = self._Peeked(reader)
+        if reader.codec:
+            return self._Decompressor(reader, reader.codec, stats=self.stats)
         return reader
 
+    def _peek(self, key, size):
+        '''Get the codec of an object without reading more than its first few bytes.'''
+        if size == 0:
+            return None
+        key.open(headers={'Range': 'bytes=0-%d' % (compression.magic_size() - 1)})
+        try:
+            return compression.detect(key.read(compression.magic_size()))
+        finally:
+            key.close()
+
+    def _open_cached(self, cache_pn):
+        cached = open(cache_pn, 'rb')
+        codec = compression.detect(cached.read(compression.magic_size()))
+        cached.seek(0)
+        if not codec:
+            return cached
+        if codec is compression.GZIP and self.decompress_threads > 0:
+            return ParallelDecompressor(cached, self.decompress_threads,
+                                        GzipIndex.load(cache_pn + GzipIndex.SUFFIX))
+        return self._Decompressor(cached, codec, stats=self.stats)
+
     class _Decompressor(object):
-        def __init__(self, reader):
+        def __init__(self, reader, codec=compression.GZIP, skip=0, stats=None):
+            self.name = getattr(reader, 'name', None)
             self._reader = reader
-            self._decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+            self._stats = stats
+            self._codec = codec
+            self._decompressor = codec.decompressor()
+            self._skip = skip
 
         def read(self, size=-1):
-            data = self._reader.read(size)
-            return self._decompressor.decompress(data)
+            while True:
+                data = self._reader.read(size)
+                if not data:
+                    flush = getattr(self._decompressor, 'flush', None)
+                    return self._skipped(flush() if flush else b'')
+                data = self._skipped(self._inflate(data))
+                if data: # an empty result (e.g. only a header was read) must not look like EOF
+                    return data
+
+        def _inflate(self, data):
+            started = time.time()
+            if self._codec.multi_stream and getattr(self._decompressor, 'eof', False):
+                # the last stream ended exactly at the end of the previous read
+                self._decompressor = self._codec.decompressor()
+            data = self._decompressor.decompress(data)
+            # continue with any following streams (e.g. the members of a multi-member gzip)
+            while self._codec.multi_stream and self._decompressor.unused_data:
+                rest = self._decompressor.unused_data
+                self._decompressor = self._codec.decompressor()
+                data += self._decompressor.decompress(rest)
+            if self._stats:
+                self._stats.count('decompress_seconds', time.time() - started)
+                self._stats.count('decompress_bytes', len(data))
+            return data
+
+        def _skipped(self, data):
+            if self._skip > 0:
+                skipped = min(self._skip, len(data))
+                self._skip -= skipped
+                data = data[skipped:]
+            return data
 
         def close(self):
             self._reader.close()
 
+    class _Peeked(object):
+        '''Opens a key and reads enough of it to detect its codec, returning those bytes first.'''
+
+        def __init__(self, key):
+            self.name = key.name
+            self._key = key
+            self._key.open()
+            self._head = b''
+            while len(self._head) < compression.magic_size():
+                data = self._key.read(compression.magic_size() - len(self._head))
+                if not data:
+                    break
+                self._head += data
+            self.codec = compression.detect(self._head)
+
+        def read(self, size=-1):
+            if self._head:
+                head, self._head = self._head, b''
+                if size < 1:
+                    return head + self._key.read(size)
+                if size < len(head):
+                    head, self._head = head[:size], head[size:]
+                    return head
+                return head + self._key.read(size - len(head)) if size > len(head) else head
+            return self._key.read(size)
+
+        def close(self):
+            self._key.close()
+
+    class _Ranged(object):
+        '''Reads the remainder of a key from an offset (not requested from S3 until first read).'''
+
+        def __init__(self, key, offset, size):
+            self.name = key.name
+            self._key = key
+            self._offset = offset
+            self._size = size
+            self._opened = False
+
+        def read(self, size=-1):
+            if not self._opened:
+                self._opened = True
+                if self._size is not None and self._offset >= self._size:
+                    self._key = BytesIO() # everything was already read
+                else:
+                    self._key.open(headers={'Range': 'bytes=%d-' % self._offset})
+            return self._key.read(size)
+
+        def close(self):
+            self._key.close()
+
+    class _Stitched(object):
+        '''Reads the first `offset` bytes from a saved file, then continues with the `rest`.'''
+
+        def __init__(self, saved_pn, offset, rest):
+            self.name = rest.name
+            self._saved = open(saved_pn, 'rb')
+            self._remaining = offset
+            self._rest = rest
+
+        def read(self, size=-1):
+            if self._remaining > 0:
+                data = self._saved.read(self._remaining if size < 1 else min(size, self._remaining))
+                self._remaining -= len(data)
+                if data:
+                    return data
+                self._remaining = 0
+            return self._rest.read(size)
+
+        def close(self):
+            self._saved.close()
+            self._rest.close()
+
+        def cleanup(self):
+            self._rest.cleanup()
+
     class _Reader(object):
-        def __init__(self, name, reader, cache_pn):
+        def __init__(self, name, reader, cache_pn, tempfile, placed_callback, released_callback,
+                     compressor=None, keep_partial=False, stats=None):
             self.name = name
             self.closed = False
+            self._stats = stats
             self._logger = logging.getLogger(__name__ + 'reader')
             self._reader = reader
+            self._compressor = compressor
             self._at_eof = False
             self._cache_pn = cache_pn
-            # write to a tempfile in case of failure; move into place when writing is complete
-            head, tail = os.path.split(cache_pn)
-            self._tempfile = NamedTemporaryFile(dir=head, prefix=tail+'_')
+            self._placed_callback = placed_callback
+            self._released_callback = released_callback
+            self._keep_partial = keep_partial
+            self._tempfile = tempfile
             self._writer = BackgroundWriter(self._tempfile, self._move_into_place)
             self._writer.start()
             Cache.readers.append(self)
 
         def read(self, size=-1):
             data = self._reader.read(size)
-            if size < 1 or len(data) < size:
+            if size < 1 or not data: # a short read is not the end (e.g. when decompressing)
                 self._at_eof = True
-            self._writer.write(data)
+            self._writer.write(self._compressor.compress(data) if self._compressor else data)
             return data
 
         def close(self):
             self._reader.close()
+            if self._compressor and not self._writer.error:
+                self._writer.write(self._compressor.flush())
             self._writer.mark_done() # allow writer to finish async, not requiring caller to wait
             self.closed = True
 
@@ -116,13 +467,29 @@ class Cache(object):
             self._writer.join()
 
         def _move_into_place(self, _):
-            self._tempfile.delete = False # prevent removal on close
             self._tempfile.close()
-            if self._at_eof:
+            if self._stats:
+                self._stats.count('cache_write_stalls', self._writer.stalls)
+                self._stats.count('cache_write_stall_seconds', self._writer.stall_time)
+                self._stats.peak('cache_write_max_queued_bytes', self._writer.max_queued_bytes)
+            if self._writer.error:
+                os.remove(self._tempfile.name) # (holding who knows what of the object)
+            elif self._at_eof:
+                index = getattr(self._compressor, 'index', None)
+                if index:
+                    index.save(self._cache_pn + GzipIndex.SUFFIX)
                 os.rename(self._tempfile.name, self._cache_pn)
-                Cache.readers.remove(self)
                 self._logger.debug('Placed: %s', self._cache_pn)
+                self._placed_callback(self._cache_pn)
+            elif self._keep_partial and os.path.getsize(self._tempfile.name) > 0:
+                # keep what was read so a later read can request only the remainder
+                partial_pn = self._cache_pn + Cache.PARTIAL_SUFFIX
+                os.rename(self._tempfile.name, partial_pn)
+                self._logger.debug('Placed partial: %s', partial_pn)
+                self._placed_callback(partial_pn)
             else:
                 os.remove(self._tempfile.name)
                 self._logger.debug('Not keeping in cache (did not read all data): %s',
                                    self._tempfile.name)
+            self._released_callback(self._tempfile.name)
+            Cache.readers.remove(self)
@@ -0,0 +1,268 @@
+from builtins import object
+
+import os
+import time
+import errno
+import logging
+import sqlite3
+
+from threading import Lock
+from contextlib import contextmanager
+
+from .gzip_index import GzipIndex
+
+_logger = logging.getLogger(__name__)
+
+class CacheIndex(object):
+    '''Tracks every file stored in the cache, allowing lookups without touching the file system.
+
+    The index is kept in a small SQLite database in the root of the cache so that it persists
+    between runs and can be safely shared by several processes using the same cache. For each file
+    it records the file's path relative to the cache, its size, the key's ETag, and when the file
+    was created and last accessed. As files are addressed by content, the same file may be stored
+    for several keys, so the bucket and name of each key are recorded separately. The database is
+    not opened until first used.
+
+    Recording that files were used is deferred until :attr:`TOUCH_BATCH` files have been (or until
+    closed), so reading many cached keys does not commit to the database for each one.
+
+    Temporary files are recorded while they are written, so any abandoned by a process that died
+    are removed when expiring old files (again without walking the cache).
+
+    :param path: the root directory of the cache
+    '''
+
+    FILENAME = 'index.sqlite'
+    '''Describes the name of the database file kept in the root of the cache.'''
+
+    COLUMNS = (
+        ('path', 'TEXT PRIMARY KEY'),
+        ('size', 'INTEGER'),
+        ('accessed', 'REAL'),
+        ('name', 'TEXT'), # (no longer recorded: see the names table)
+        ('etag', 'TEXT'),
+        ('created', 'REAL'),
+    )
+    '''Describes the columns of the entries table (newer columns are added to older databases).'''
+
+    NAMES = 'bucket TEXT, name TEXT, path TEXT, PRIMARY KEY (bucket, name)'
+    '''Describes the table of the file stored for each key (the last one placed or found).'''
+
+    TEMPS = 'path TEXT PRIMARY KEY, created REAL'
+    '''Describes the table of temporary files being written (until placed or removed).'''
+
+    ABANDONED_HOURS = 6
+    '''Describes the number of hours after which a temporary file still recorded as being written
+    is taken to have been abandoned.'''
+
+    TOUCH_BATCH = 100
+    '''Describes the number of used files recorded together.'''
+
+    VERSION = 1
+    '''Describes how cached files are named: files named by an older version are never looked up
+    again, so they are removed when the index is opened.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.pathname = os.path.join(path, self.FILENAME)
+        self._lock = Lock()
+        self._db = None
+        self._touched = {} # (path, name, bucket) => accessed
+
+    def lookup(self, cache_pn):
+        '''Report if a file is stored in the cache.'''
+        with self._locked() as db:
+            row = db.execute('SELECT 1 FROM entries WHERE path = ?',
+                             (self._relative(cache_pn),)).fetchone()
+            return row is not None
+
+    def find(self, bucket, prefix):
+        '''Get the ``(name, cache_pn)`` of each file stored for a key in the `bucket` with a name
+        beginning with `prefix`.
+
+        Partial files (those holding only the start of an object) are not included. Results are
+        ordered by key name.
+        '''
+        with self._locked() as db:
+            self._record_touched(db)
+            rows = db.execute('SELECT names.name, names.path FROM names '
+                              'JOIN entries ON entries.path = names.path '
+                              'WHERE names.bucket = ? AND substr(names.name, 1, ?) = ? '
+                              'ORDER BY names.name', (bucket or '', len(prefix), prefix)).fetchall()
+        return [(name, os.path.join(self.path, path)) for name, path in rows
+                if not path.endswith('.partial')]
+
+    def add(self, cache_pn, size, name=None, etag=None, bucket=None):
+        '''Record a newly placed file in the cache (stored for the key `name` in the `bucket`).'''
+        now = time.time()
+        path = self._relative(cache_pn)
+        with self._locked() as db:
+            db.execute('INSERT OR REPLACE INTO entries (path, size, accessed, etag, created) '
+                       'VALUES (?, ?, ?, ?, ?)', (path, size, now, etag, now))
+            if name:
+                self._name(db, bucket, name, path)
+
+    def touch(self, cache_pn, name=None, bucket=None):
+        '''Record that a file in the cache was just used (for the key `name` in the `bucket`).'''
+        with self._lock:
+            self._touched[(self._relative(cache_pn), name, bucket)] = time.time()
+            if len(self._touched) < self.TOUCH_BATCH:
+                return
+        with self._locked() as db:
+            self._record_touched(db)
+
+    def discard(self, cache_pn):
+        '''Forget about a file that is no longer in the cache.'''
+        with self._locked() as db:
+            self._delete(db, self._relative(cache_pn))
+
+    def hold(self, cache_pn):
+        '''Record a temporary file about to be written (until :meth:`release` is called).'''
+        with self._locked() as db:
+            db.execute('INSERT OR REPLACE INTO temps (path, created) VALUES (?, ?)',
+                       (self._relative(cache_pn), time.time()))
+
+    def release(self, cache_pn):
+        '''Forget about a temporary file that was placed or removed.'''
+        with self._locked() as db:
+            db.execute('DELETE FROM temps WHERE path = ?', (self._relative(cache_pn),))
+
+    def expire(self, hours):
+        '''Remove files that have not been accessed within the last number of `hours` (and any
+        temporary files abandoned for :attr:`ABANDONED_HOURS`).'''
+        now = time.time()
+        with self._locked() as db:
+            self._record_touched(db)
+            paths = [path for path, in db.execute('SELECT path FROM entries WHERE accessed < ?',
+                                                  (now - hours * 3600,))]
+            for path in paths:
+                self._delete(db, path)
+            abandoned = [path for path, in db.execute('SELECT path FROM temps WHERE created < ?',
+                                                      (now - self.ABANDONED_HOURS * 3600,))]
+            db.executemany('DELETE FROM temps WHERE path = ?', [(path,) for path in abandoned])
+        self._remove_all(paths + abandoned)
+        if paths:
+            _logger.info('Cleaned up %d files', len(paths))
+        if abandoned:
+            _logger.info('Cleaned up %d abandoned temporary files', len(abandoned))
+        return len(paths)
+
+    def evict(self, max_bytes):
+        '''Remove the least recently used files until the cache holds no more than `max_bytes`.'''
+        with self._locked() as db:
+            self._record_touched(db)
+            excess = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            excess -= max_bytes
+            if excess <= 0:
+                return 0
+            paths = []
+            rows = db.execute('SELECT path, size FROM entries ORDER BY accessed')
+            for path, size in rows:
+                if excess <= 0:
+                    break
+                paths.append(path)
+                excess -= size
+            rows.close()
+            for path in paths:
+                self._delete(db, path)
+        self._remove_all(paths)
+        _logger.info('Evicted %d files from cache', len(paths))
+        return len(paths)
+
+    def close(self):
+        '''Record the files used so far and close the database.'''
+        if self._touched:
+            with self._locked() as db:
+                self._record_touched(db)
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+
+    ######################################################################
+    # private
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            db = self._connect()
+            try:
+                yield db
+                db.commit()
+            except:
+                db.rollback()
+                raise
+
+    def _connect(self):
+        if self._db:
+            return self._db
+        self._db = sqlite3.connect(self.pathname, timeout=30, check_same_thread=False)
+        # (readers and writers need not wait for each other, and commits need not wait on the disk)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.execute('BEGIN IMMEDIATE') # (so only one process removes old files)
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries (%s)' %
+                         ', '.join(' '.join(column) for column in self.COLUMNS))
+        known = set(row[1] for row in self._db.execute('PRAGMA table_info(entries)'))
+        for column, kind in self.COLUMNS:
+            if column not in known:
+                self._db.execute('ALTER TABLE entries ADD COLUMN %s %s' % (column, kind))
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS names (%s)' % self.NAMES)
+        self._db.execute('CREATE INDEX IF NOT EXISTS names_path ON names (path)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS temps (%s)' % self.TEMPS)
+        if self._db.execute('PRAGMA user_version').fetchone()[0] < self.VERSION:
+            self._remove_outdated()
+            self._db.execute('PRAGMA user_version = %d' % self.VERSION)
+        self._db.commit()
+        return self._db
+
+    def _remove_outdated(self):
+        '''Remove the files named by an older version (including any from before the index).'''
+        count = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            if dirpath == self.path:
+                continue # only the shard directories hold cached files
+            for ent in filenames:
+                if '_' in ent:
+                    continue # a temporary file still being written (or abandoned)
+                self._remove(os.path.join(dirpath, ent))
+                count += 1
+        self._db.execute('DELETE FROM entries')
+        self._db.execute('DELETE FROM names')
+        if count > 0:
+            _logger.info('Removed %d files cached by an older version', count)
+
+    def _record_touched(self, db):
+        for (path, name, bucket), accessed in self._touched.items():
+            db.execute('UPDATE entries SET accessed = ? WHERE path = ?', (accessed, path))
+            if name:
+                self._name(db, bucket, name, path)
+        self._touched.clear()
+
+    def _name(self, db, bucket, name, path):
+        db.execute('INSERT OR REPLACE INTO names (bucket, name, path) VALUES (?, ?, ?)',
+                   (bucket or '', name, path)) # (as NULLs would never replace each other)
+
+    def _delete(self, db, path):
+        for touched in [touched for touched in self._touched if touched[0] == path]:
+            del self._touched[touched]
+        db.execute('DELETE FROM entries WHERE path = ?', (path,))
+        db.execute('DELETE FROM names WHERE path = ?', (path,))
+
+    def _remove_all(self, paths):
+        '''Remove files already forgotten by the index (without holding the lock, so others using
+        the index need not wait on the file system).'''
+        for path in paths:
+            self._remove(os.path.join(self.path, path))
+
+    def _relative(self, cache_pn):
+        return os.path.relpath(cache_pn, self.path)
+
+    def _remove(self, pathname):
+        for curpath in (pathname, pathname + GzipIndex.SUFFIX):
+            try:
+                os.remove(curpath)
+                _logger.debug('Removed %s', curpath)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT: raise
@@ -6,57 +6,186 @@ from builtins import object
 
 import os
 import sys
+import json
 import signal
 import errno
 import logging
 import re
 import click
 
-from boto import s3
-from configstruct import ConfigStruct
+from datetime import timedelta
 
-from .s3tail import S3Tail
+from .line_reader import Excluding, FixedString, Regex
+from .line_writer import LineWriter
+from .time_range import parse_time
+from .log_parser import find_format, record_formatter
 
-# TODO:
-# * consider support for reading from multiple buckets?
+# NOTE: heavier dependencies (boto, configstruct, and the S3Tail stack) are imported only once they
+#       are needed, so that running for help or only looking in the cache starts quickly
 
 DEFAULTS = {
     'log_level': 'info',
     'log_file': 'STDERR',
     'cache_path': os.path.join(os.path.expanduser('~'), '.s3tailcache'),
     'cache_hours': 24,
+    'cache_compress': False,
+    'cache_max_bytes': 0,
+    'cache_checkpoint_bytes': 0,
+    'decompress_threads': 0,
+    'prefetch': 0,
+    'async_fetch': False,
+    'list_threads': 1,
 }
 
+def _parse_time(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_time(value)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc))
+
+def _split_fields(ctx, param, value):
+    if value is None:
+        return None
+    return [name for name in value.split(',') if name]
+
+def _check_region(region):
+    from boto import s3
+    if region and region not in [r.name for r in s3.regions()]:
+        raise click.BadParameter('Unknown region: ' + region, param_hint='--region')
+
+def _stat_text(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '%.6g' % value
+    return str(value)
+
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 @click.command(context_settings=CONTEXT_SETTINGS)
 @click.version_option()
 @click.option('-c', '--config-file', type=click.Path(dir_okay=False, writable=True),
               default=os.path.join(os.path.expanduser('~'), '.s3tailrc'),
               help='Configuration file', show_default=True)
-@click.option('-r', '--region', type=click.Choice(r.name for r in s3.regions()),
-              help='AWS region to use when connecting')
+@click.option('-r', '--region', metavar='REGION',
+              help='AWS region to use when connecting (e.g. us-west-2)')
 @click.option('-b', '--bookmark', help='Bookmark to start at (key:line or a named bookmark)')
 @click.option('-l', '--log-level', type=click.Choice(['debug','info','warning','error','critical']),
               help='set logging level')
 @click.option('--log-file', metavar='FILENAME', help='write logs to FILENAME')
 @click.option('--cache-hours', type=int,
-              help='Number of hours to keep in cache before removing on next run (0 disables caching)')
+              help='Number of hours to keep in cache before removing on next run '
+              '(0 disables caching)')
+@click.option('--cache-compress/--no-cache-compress', default=None,
+              help='Store files in the cache compressed (decompressing when read)')
+@click.option('--cache-max-bytes', type=int, metavar='BYTES',
+              help='Most bytes to keep in cache, removing least recently used first '
+              '(0 is unlimited)')
+@click.option('--cache-checkpoint-bytes', type=int, metavar='BYTES',
+              help='Bytes between checkpoints allowing compressed cache files to be read from the '
+              'middle (0 disables checkpoints)')
 @click.option('--cache-lookup', is_flag=True,
               help='Report if s3_uri keys are cached (showing pathnames if found)')
-@click.argument('s3_uri')
-def main(config_file, region, bookmark, log_level, log_file, cache_hours, cache_lookup, s3_uri):
+@click.option('--offline', is_flag=True,
+              help='With --cache-lookup, report only the cached keys found in the cache index, '
+              'without connecting to S3')
+@click.option('--decompress-threads', type=int, metavar='COUNT',
+              help='Threads used to decompress multi-member gzip files read from cache '
+              '(0 uses one)')
+@click.option('--prefetch', type=int, metavar='COUNT',
+              help='Number of upcoming keys to download in the background (0 disables prefetching)')
+@click.option('--async-fetch/--no-async-fetch', default=None,
+              help='Prefetch keys from an asyncio event loop, retrying throttled requests with '
+              'backoff (allows a --prefetch COUNT in the hundreds)')
+@click.option('--list-threads', type=int, metavar='COUNT',
+              help='Concurrent list calls to make, splitting keys by sub-prefix (i.e. by "/")')
+@click.option('--unordered', is_flag=True,
+              help='Search keys concurrently, reporting lines in any order (tagged with the '
+              'key:line holding each, which is not a bookmark)')
+@click.option('-j', '--jobs', type=int, metavar='COUNT',
+              help='Number of worker processes to use when unordered (defaults to CPU count)')
+@click.option('-g', '--grep', '--regex', metavar='PATTERN',
+              help='Only show lines matching the regular expression PATTERN')
+@click.option('-F', '--fixed-string', is_flag=True,
+              help='Interpret the grep PATTERN as a literal string instead of a regular expression')
+@click.option('-v', '--invert-match', is_flag=True,
+              help='Only show lines NOT matching the grep PATTERN')
+@click.option('--since', metavar='TIME', callback=_parse_time,
+              help='Only read keys named with a UTC time at or after TIME '
+              '(e.g. 2016-08-04T10:30, 2016-08-04, or 15m, 2h, 1d ago)')
+@click.option('--until', metavar='TIME', callback=_parse_time,
+              help='Only read keys named with a UTC time before TIME')
+@click.option('-f', '--follow', is_flag=True,
+              help='Keep watching for new keys after reading all those found')
+@click.option('--follow-queue', metavar='QUEUE',
+              help='Name of an SQS queue receiving S3 event notifications to find new keys when '
+              'following (instead of listing)')
+@click.option('--merge', is_flag=True,
+              help='Read the keys of every S3_URI together, merging their lines into one stream '
+              'ordered by the time of each line (parsed as ELB, ALB, or S3 access logs)')
+@click.option('--merge-window', type=float, metavar='MINUTES', default=5, show_default=True,
+              help='Minutes before the time in its name that a key may hold lines when merging')
+@click.option('-o', '--output', metavar='STYLE',
+              help='Parse lines as ELB, ALB, or S3 access logs, writing each as json, tsv, or '
+              'fields=NAME,... (only the named fields, tab separated)')
+@click.option('--log-format', type=click.Choice(['auto', 'elb', 'alb', 's3']), default='auto',
+              help='Format of the lines parsed for --output or --stats (auto detects it)',
+              show_default=True)
+@click.option('--stats', metavar='FIELDS', callback=_split_fields,
+              help='Parse lines as ELB, ALB, or S3 access logs, reporting the count of records and '
+              'the mean, max, and percentiles of the numeric FIELDS (comma separated) at the end')
+@click.option('--group-by', metavar='FIELDS', callback=_split_fields,
+              help='Report --stats for each group of records with the same values of FIELDS '
+              '(e.g. time:minute,elb_status_code)')
+@click.option('--run-stats', is_flag=True,
+              help='Report counters and timers of each phase of the run (listing, fetching, '
+              'decompressing, reading, and writing output) on exit')
+@click.option('--run-stats-json', metavar='FILENAME',
+              type=click.Path(dir_okay=False, writable=True),
+              help='Write the counters and timers of the run to FILENAME as JSON on exit')
+@click.option('--progress', 'progress_seconds', type=float, metavar='SECONDS',
+              help='Log a line describing the progress of the run every number of SECONDS')
+@click.option('--profile', metavar='FILENAME', type=click.Path(dir_okay=False, writable=True),
+              help='Profile the run (in the main thread) with cProfile, writing the results to '
+              'FILENAME (for reading with pstats or a viewer like snakeviz)')
+@click.argument('s3_uri', nargs=-1, required=True)
+def main(config_file, region, bookmark, log_level, log_file, cache_hours, cache_compress,
+         cache_max_bytes, cache_checkpoint_bytes, cache_lookup, offline, decompress_threads,
+         prefetch, async_fetch, list_threads, unordered, jobs, grep, fixed_string, invert_match,
+         since, until, follow, follow_queue, merge, merge_window, output, log_format, stats,
+         group_by, run_stats, run_stats_json, progress_seconds, profile, s3_uri):
     '''Begins tailing files found at [s3://]BUCKET[/PREFIX]
-    (automatically decompressing any ending in ".gz")
+    (automatically decompressing gzip, bzip2, xz, or zstd content)
+
+    More than one S3_URI may be given with --merge (all are read with the same --region).
     '''
 
+    from configstruct import ConfigStruct
+
+    if offline and not cache_lookup:
+        raise click.BadParameter('Only cache lookups may be made offline', param_hint='--offline')
+    if invert_match and not grep:
+        raise click.BadParameter('Requires a --grep PATTERN', param_hint='--invert-match')
+    if len(s3_uri) > 1 and not merge:
+        raise click.BadParameter('Only one S3_URI may be read unless merging', param_hint='s3_uri')
+    if merge and (unordered or follow or bookmark):
+        raise click.BadParameter('Unable to merge along with --unordered, --follow, or --bookmark',
+                                 param_hint='--merge')
+
     config = ConfigStruct(config_file, options=DEFAULTS)
     opts = config.options
 
     # let command line options have temporary precedence if provided values
-    opts.might_prefer(region=region, log_level=log_level, log_file=log_file, cache_hours=cache_hours)
+    opts.might_prefer(region=region, log_level=log_level, log_file=log_file,
+                      cache_hours=cache_hours, cache_compress=cache_compress,
+                      cache_max_bytes=cache_max_bytes,
+                      cache_checkpoint_bytes=cache_checkpoint_bytes,
+                      decompress_threads=decompress_threads, prefetch=prefetch,
+                      async_fetch=async_fetch, list_threads=list_threads)
 
-    s3_uri = re.sub(r'^(s3:)?/+', '', s3_uri)
-    bucket, prefix = s3_uri.split('/', 1)
+    sources = [tuple(re.sub(r'^(s3:)?/+', '', uri).split('/', 1)) for uri in s3_uri]
+    bucket, prefix = sources[0]
 
     log_kwargs = {
         'level': getattr(logging, opts.log_level.upper()),
@@ -75,7 +204,6 @@ def main(config_file, region, bookmark, log_level, log_file, cache_hours, cache_
         show_pick_up = bookmark != None
 
     def progress(key, cache_pn, cached):
-        Track.last_key = key
         if cache_lookup:
             prefix = '  => '
             click.echo(key)
@@ -84,27 +212,135 @@ def main(config_file, region, bookmark, log_level, log_file, cache_hours, cache_
             else:
                 click.echo(prefix + click.style(cache_pn, fg='green'))
             return False
-        else:
-            logger.info('Starting %s', key)
-            return True
+        return True
+
+    def started(key):
+        Track.last_key = key
+        logger.info('Starting %s', key)
+
+    formatter = None
+    if output:
+        try:
+            formatter = record_formatter(output, find_format(log_format))
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint='--output')
+
+    if log_format != 'auto' and not output and stats is None and group_by is None:
+        raise click.BadParameter('Only used along with --output, --stats, or --group-by',
+                                 param_hint='--log-format')
+
+    group_stats = None
+    if stats is not None or group_by is not None:
+        if output:
+            raise click.BadParameter('Unable to report stats along with --output',
+                                     param_hint='--stats')
+        from .record_batch import GroupStats
+        try:
+            group_stats = GroupStats(group_by or [], stats or [],
+                                     log_format=find_format(log_format))
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint=['--group-by', '--stats'])
+
+    def render(line):
+        return formatter(line).encode('utf-8') if formatter else line
+
+    writer = LineWriter(getattr(sys.stdout, 'buffer', sys.stdout)) # (binary on Python 2 and 3)
 
     def dump(num, line):
         Track.last_num = num
         if Track.show_pick_up:
             logger.info('Picked up at line %s', num)
             Track.show_pick_up = False
-        click.echo(line)
+        writer.write_line(render(line))
+
+    def dump_chunk(num, data):
+        Track.last_num = num
+        if Track.show_pick_up:
+            logger.info('Picked up at line %s', num - data.count(b'\n') + 1)
+            Track.show_pick_up = False
+        writer.write_lines(data)
+
+    def dump_tagged(location, line):
+        writer.write_line(location.encode('utf-8') + b': ' + render(line))
+
+    def dump_merged(_, line):
+        writer.write_line(render(line))
+
+    if not unordered or cache_lookup:
+        jobs = 0
+    elif not jobs:
+        from multiprocessing import cpu_count
+        jobs = cpu_count()
+
+    pattern = None
+    line_filter = None
+    if grep:
+        grep = grep.encode('utf-8')
+        pattern = FixedString(grep) if fixed_string else Regex(grep)
+        if invert_match:
+            line_filter, pattern = Excluding(pattern), None # (every line must then be split out)
+
+    if offline:
+        for source_bucket, source_prefix in sources:
+            _lookup_offline(opts.cache_path, source_bucket, source_prefix)
+        sys.exit(0)
+
+    from .s3tail import S3Tail
+    from .record_batch import Batcher
+    from .run_stats import Progress
+
+    _check_region(opts.region)
+
+    queue = None
+    if follow_queue:
+        from boto import sqs
+        queue = sqs.connect_to_region(opts.region or 'us-east-1').get_queue(follow_queue)
+        if not queue:
+            raise click.BadParameter('Unable to find queue: ' + follow_queue,
+                                     param_hint='--follow-queue')
 
-    tail = S3Tail(config, bucket, prefix, dump,
-                  key_handler=progress, bookmark=bookmark,
-                  region=opts.region, cache_path=opts.cache_path, hours=opts.cache_hours)
+    line_handler = dump_tagged if jobs else dump_merged if merge else dump
+    if group_stats:
+        line_handler = lambda _, batch: group_stats(batch)
+
+    tail = S3Tail(config, bucket, prefix, line_handler,
+                  key_handler=progress, start_handler=started, bookmark=bookmark,
+                  region=opts.region, cache_path=opts.cache_path, hours=opts.cache_hours,
+                  cache_compress=opts.cache_compress, cache_max_bytes=opts.cache_max_bytes,
+                  cache_checkpoint_bytes=opts.cache_checkpoint_bytes,
+                  decompress_threads=opts.decompress_threads,
+                  prefetch=0 if cache_lookup else opts.prefetch, async_fetch=opts.async_fetch,
+                  jobs=jobs, line_filter=line_filter, pattern=pattern,
+                  since=since, until=until, follow=follow and not cache_lookup,
+                  idle_handler=writer.flush, # (output must not wait on new keys when following)
+                  follow_queue=queue, list_threads=opts.list_threads,
+                  merge=merge, sources=sources[1:], merge_window=timedelta(minutes=merge_window),
+                  log_format=find_format(log_format) if formatter or group_stats else None,
+                  batch_size=Batcher.SIZE if group_stats else 0,
+                  chunk_handler=None if formatter or group_stats else dump_chunk)
+
+    writer.stats = tail.stats
+    reporter = None
+    if progress_seconds:
+        reporter = Progress(tail.stats, progress_seconds)
+        reporter.start()
 
     signal.signal(signal.SIGINT, tail.stop)
     signal.signal(signal.SIGTERM, tail.stop)
     signal.signal(signal.SIGPIPE, tail.stop)
 
     try:
-        tail.watch()
+        if profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(tail.watch)
+            finally:
+                profiler.dump_stats(profile)
+                logger.info('Wrote profile to %s', profile)
+        else:
+            tail.watch()
+        writer.flush()
     except KeyboardInterrupt:
         signal_handler(signal.SIGINT, _)
     except IOError as exc:
@@ -112,6 +348,24 @@ def main(config_file, region, bookmark, log_level, log_file, cache_hours, cache_
         # just exit if piped to something that has terminated (i.e. head or tail)
     finally:
         tail.cleanup()
+        if reporter:
+            reporter.stop()
+
+    unparsed = tail.stats.to_dict().get('lines_unparsed')
+    if unparsed:
+        logger.warning('Skipped %d lines not in the log format', unparsed)
+
+    if group_stats and not cache_lookup:
+        click.echo('\t'.join(group_stats.header()))
+        for row in group_stats.report():
+            click.echo('\t'.join(_stat_text(value) for value in row))
+
+    if run_stats:
+        for line in tail.stats.summary():
+            click.echo(line, err=True)
+    if run_stats_json:
+        with open(run_stats_json, 'w') as out:
+            json.dump(tail.stats.to_dict(), out, indent=2, sort_keys=True)
 
     if Track.last_key and Track.last_num:
         logger.info('Stopped processing at %s:%d', Track.last_key, Track.last_num)
@@ -120,5 +374,17 @@ def main(config_file, region, bookmark, log_level, log_file, cache_hours, cache_
 
     sys.exit(0)
 
+def _lookup_offline(cache_path, bucket, prefix):
+    from .cache_index import CacheIndex
+    index = CacheIndex(cache_path)
+    if not os.path.exists(index.pathname):
+        raise click.ClickException('No cache index found: ' + index.pathname)
+    try:
+        for name, cache_pn in index.find(bucket, prefix):
+            click.echo(name)
+            click.echo('  => ' + click.style(cache_pn, fg='green'))
+    finally:
+        index.close()
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,93 @@
+from builtins import object
+
+import bz2
+import zlib
+import logging
+
+try:
+    import lzma
+except ImportError: # not part of Python 2 (provided by the backports.lzma package)
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_logger = logging.getLogger(__name__)
+
+class Codec(object):
+    '''Describes a compression format, detected by the "magic number" found at the start of content.
+
+    Decompressors must provide ``decompress(data)`` returning whatever output is ready and
+    ``unused_data`` holding any bytes found after the end of a stream (``flush()`` is called at the
+    end when provided). This is the interface of the decompressors in the ``zlib``, ``bz2``, and
+    ``lzma`` modules.
+
+    :param name: a short name of the format used in log messages
+    :param magic: the leading bytes identifying content in this format (or ``None`` if the format
+           is never detected, only used explicitly)
+    :param factory: a function returning a new decompressor for a single stream
+    :param multi_stream: if data remaining after the end of a stream is the start of another stream
+           in the same format (e.g. concatenated gzip members)
+    '''
+
+    def __init__(self, name, magic, factory, multi_stream=True):
+        self.name = name
+        self.magic = magic
+        self.multi_stream = multi_stream
+        self._factory = factory
+
+    def decompressor(self):
+        return self._factory()
+
+    def __repr__(self):
+        return 'Codec(%s)' % self.name
+
+class MissingCodecError(IOError):
+    '''Raised when content is in a format that requires a package that is not installed.'''
+    pass
+
+def register(codec):
+    '''Add a codec to those detected (checked before any codec registered earlier).'''
+    _codecs.insert(0, codec)
+
+def detect(head):
+    '''Get the codec for content beginning with the `head` bytes (or ``None`` if not compressed).'''
+    for codec in _codecs:
+        if codec.magic and head.startswith(codec.magic):
+            return codec
+    return None
+
+def magic_size():
+    '''Get the number of leading bytes needed to detect any registered codec.'''
+    return max(len(codec.magic) for codec in _codecs if codec.magic)
+
+######################################################################
+# private
+
+def _requires(package):
+    def factory():
+        raise MissingCodecError('The %s package is required to decompress this content' % package)
+    return factory
+
+def _zstd_decompressor():
+    return zstandard.ZstdDecompressor().decompressobj()
+
+_codecs = []
+
+register(Codec('zstd', b'\x28\xb5\x2f\xfd',
+               _zstd_decompressor if zstandard else _requires('zstandard')))
+register(Codec('xz', b'\xfd7zXZ\x00',
+               lzma.LZMADecompressor if lzma else _requires('backports.lzma')))
+register(Codec('bzip2', b'BZh', bz2.BZ2Decompressor))
+register(Codec('gzip', b'\x1f\x8b', lambda: zlib.decompressobj(32 + zlib.MAX_WBITS)))
+
+GZIP = detect(b'\x1f\x8b')
+'''Describes the gzip format.'''
+
+DEFLATE = Codec('deflate', None, lambda: zlib.decompressobj(-zlib.MAX_WBITS), multi_stream=False)
+'''Describes a raw deflate stream (with no header), as found after a gzip checkpoint.'''
@@ -0,0 +1,195 @@
+from builtins import object
+
+import json
+import logging
+
+from collections import deque
+from threading import Event
+
+try:
+    from urllib.parse import unquote_plus
+except ImportError:
+    from urllib import unquote_plus
+
+_logger = logging.getLogger(__name__)
+
+class Follower(object):
+    '''Repeatedly finds keys added after those already found, like ``tail -f`` for a prefix.
+
+    The first pass lists everything after the initial `marker`. Each later pass lists only the keys
+    after the last one found (never from the beginning again), or when `notifications` are
+    provided, receives the keys announced since the last pass instead of listing at all. Listed
+    keys are those named after the last one found (like S3 listing with a marker), while announced
+    keys are reported in any order, once each (skipping any of the last :attr:`SEEN_SIZE` found).
+    Passes are separated by an interval starting at `min_interval` that doubles each time nothing
+    new is found, up to `max_interval`, and resets once something is.
+
+    :param list_keys: a function called with a marker, returning an iterable of the keys after it
+    :param marker: the key name to begin listing after (or ``None`` to list from the beginning)
+    :param min_interval: the fewest seconds to wait between passes
+    :param max_interval: the most seconds to wait between passes
+    :param notifications: an :class:`S3EventQueue` (or similar) to receive new keys from
+    '''
+
+    MIN_INTERVAL = 5
+    '''Describes the default fewest seconds to wait between passes.'''
+
+    MAX_INTERVAL = 60
+    '''Describes the default most seconds to wait between passes.'''
+
+    SEEN_SIZE = 10000
+    '''Describes the number of key names found recently that are remembered, so announced keys
+    that were already found are skipped.'''
+
+    def __init__(self, list_keys, marker=None, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL, notifications=None):
+        self.marker = marker
+        self._list_keys = list_keys
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._notifications = notifications
+        self._stop = Event()
+        self._seen = set()
+        self._seen_order = deque()
+
+    def __iter__(self):
+        for keys in self.passes():
+            for key in keys:
+                yield key
+
+    def passes(self):
+        '''Generate an iterable of the keys found for each pass, waiting between them.'''
+        interval = self._min_interval
+        first = True
+        while not self._stop.is_set():
+            if first or not self._notifications:
+                if not first:
+                    self._stop.wait(interval)
+                    if self._stop.is_set():
+                        return
+                keys = self._list_keys(self.marker)
+            else:
+                keys = self._notifications.receive(interval, self._stop.is_set)
+            found = self._Found(self, keys, listed=first or not self._notifications)
+            first = False
+            yield found
+            if self._notifications:
+                self._notifications.acknowledge() # (the keys of the pass were all handled)
+            if found.count > 0:
+                interval = self._min_interval
+            else:
+                interval = min(interval * 2, self._max_interval)
+                _logger.debug('Nothing new found, next looking in %d seconds', interval)
+
+    def stop(self):
+        '''Stop looking for new keys (including waking up from any wait in progress).'''
+        self._stop.set()
+
+    ######################################################################
+    # private
+
+    def _found(self, name):
+        '''Remember a key as found, reporting if it was found before.'''
+        if name in self._seen:
+            return True
+        self._seen.add(name)
+        self._seen_order.append(name)
+        if len(self._seen_order) > self.SEEN_SIZE:
+            self._seen.discard(self._seen_order.popleft())
+        return False
+
+    class _Found(object):
+        '''Tracks the keys yielded from a pass, advancing the follower's marker as it goes.
+
+        Listed keys are always after the marker. Announced keys may arrive in any order (e.g. from
+        several load balancers), so they are only skipped when found before (e.g. listed by the
+        first pass, or announced again).
+        '''
+
+        def __init__(self, follower, keys, listed):
+            self.count = 0
+            self._follower = follower
+            self._keys = keys
+            self._listed = listed
+
+        def __iter__(self):
+            follower = self._follower
+            for key in self._keys:
+                if follower._found(key.name) and not self._listed:
+                    continue
+                self.count += 1
+                if not follower.marker or key.name > follower.marker:
+                    follower.marker = key.name
+                yield key
+
+class S3EventQueue(object):
+    '''Receives the keys announced by S3 event notifications delivered to an SQS queue.
+
+    Only keys created in the named bucket under the prefix are reported. Messages are deleted from
+    the queue once acknowledged (after their keys are handled), so those of keys never handled are
+    delivered again. Any object with the ``get_messages`` and ``delete_message`` methods of a
+    :class:`boto.sqs.queue.Queue` may be used as the queue (e.g. a local stand-in for testing).
+
+    :param queue: the queue receiving the notifications
+    :param bucket: the bucket holding the keys
+    :param prefix: what keys in the bucket should be reported
+    '''
+
+    MAX_WAIT = 5
+    '''Describes the most seconds each request waits for messages to arrive (SQS allows up to 20),
+    so that stopping is noticed soon.'''
+
+    def __init__(self, queue, bucket, prefix):
+        self._queue = queue
+        self._bucket = bucket
+        self._prefix = prefix
+        self._received = []
+
+    def receive(self, wait, stopped=lambda: False):
+        '''Get the keys announced within the next `wait` seconds (sooner if any arrive, or once
+        `stopped` reports true).'''
+        remaining = wait
+        while True:
+            polled = min(remaining, self.MAX_WAIT)
+            messages = self._queue.get_messages(num_messages=10, wait_time_seconds=int(polled))
+            remaining -= polled # (SQS waits the whole time unless messages arrive)
+            if messages or stopped() or remaining <= 0:
+                break
+        keys = []
+        for message in messages:
+            keys.extend(self._keys_from(message.get_body()))
+        self._received.extend(messages)
+        keys.sort(key=lambda key: key.name)
+        return keys
+
+    def acknowledge(self):
+        '''Delete the messages received so far (once their keys were handled).'''
+        for message in self._received:
+            self._queue.delete_message(message)
+        del self._received[:]
+
+    ######################################################################
+    # private
+
+    def _keys_from(self, body):
+        try:
+            records = json.loads(body).get('Records', [])
+        except ValueError:
+            _logger.warning('Ignoring unexpected message: %s', body)
+            return []
+        keys = []
+        for record in records:
+            if not record.get('eventName', '').startswith('ObjectCreated:'):
+                continue
+            s3 = record['s3']
+            if s3['bucket']['name'] != self._bucket.name:
+                continue
+            name = unquote_plus(s3['object']['key'])
+            if not name.startswith(self._prefix):
+                continue
+            key = self._bucket.new_key(name)
+            key.size = s3['object'].get('size')
+            etag = s3['object'].get('eTag')
+            key.etag = '"%s"' % etag if etag else None
+            keys.append(key)
+        return keys
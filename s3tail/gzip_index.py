@@ -0,0 +1,93 @@
+from builtins import object
+
+import zlib
+import bisect
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class GzipIndex(object):
+    '''Records points in a gzip file where decompression can begin without reading what is before.
+
+    Each checkpoint is an ``(offset, compressed_offset)`` pair describing where a raw deflate stream
+    can be started (with no preset dictionary) at `compressed_offset` in the file to produce the
+    decompressed content from `offset` onward. The segments between checkpoints are independent of
+    one another, so they may be decompressed in any order (or concurrently).
+
+    :param checkpoints: a list of ``(offset, compressed_offset)`` pairs in increasing order
+    '''
+
+    SUFFIX = '.gzidx'
+    '''Describes the suffix of the file kept beside a cached file to hold its index.'''
+
+    def __init__(self, checkpoints=None):
+        self.checkpoints = checkpoints or []
+
+    def add(self, offset, compressed_offset):
+        self.checkpoints.append((offset, compressed_offset))
+
+    def find(self, offset):
+        '''Get the last checkpoint at or before the decompressed `offset` (or ``None``).'''
+        i = bisect.bisect_right(self.checkpoints, (offset, float('inf')))
+        if i > 0:
+            return self.checkpoints[i - 1]
+        return None
+
+    def save(self, pathname):
+        with open(pathname, 'w') as out:
+            for offset, compressed_offset in self.checkpoints:
+                out.write('%d %d\n' % (offset, compressed_offset))
+
+    @classmethod
+    def load(cls, pathname):
+        '''Read an index from `pathname`, returning ``None`` if there is not one.'''
+        try:
+            with open(pathname) as src:
+                return cls([tuple(int(v) for v in line.split()) for line in src if line.strip()])
+        except (IOError, OSError):
+            return None
+
+class CheckpointCompressor(object):
+    '''Compresses into the gzip format, recording a checkpoint in an index every `interval` bytes.
+
+    At each checkpoint the compressor is fully flushed, which byte-aligns the output and discards
+    the history used for back-references so that decompression can start again from that point.
+
+    :param level: the zlib compression level
+    :param interval: the number of (decompressed) bytes between checkpoints
+    '''
+
+    def __init__(self, level, interval):
+        self.index = GzipIndex()
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._interval = interval
+        self._pending = 0
+        self._offset = 0
+        self._compressed_offset = 0
+
+    def compress(self, data):
+        view = memoryview(data)
+        parts = []
+        while len(view) > 0:
+            part = view[:self._interval - self._pending]
+            view = view[len(part):]
+            self._emit(parts, self._compressor.compress(part))
+            self._pending += len(part)
+            self._offset += len(part)
+            if self._pending >= self._interval:
+                self._emit(parts, self._compressor.flush(zlib.Z_FULL_FLUSH))
+                self._pending = 0
+                self.index.add(self._offset, self._compressed_offset)
+        return b''.join(parts)
+
+    def flush(self):
+        parts = []
+        self._emit(parts, self._compressor.flush())
+        return parts[0]
+
+    ######################################################################
+    # private
+
+    def _emit(self, parts, data):
+        parts.append(data)
+        self._compressed_offset += len(data)
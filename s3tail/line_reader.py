@@ -0,0 +1,207 @@
+from builtins import object
+
+import re
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class LineReader(object):
+    '''Iterates over the lines read from a reader, yielding ``(line_num, line)`` tuples.
+
+    Data is read in `buffer_size` chunks into a single bytearray that is scanned once for newlines
+    using an offset cursor. Lines are copied out of the buffer exactly once and the unconsumed
+    remainder is only compacted when the next chunk is appended, keeping the cost linear in the
+    size of the input.
+
+    When a `pattern` is provided, each chunk is searched as a whole and only the lines containing a
+    match are copied out and yielded. Lines in between are counted (so line numbers remain accurate)
+    but never materialized.
+
+    :param reader: an object with ``read(size)`` and ``close()`` methods (and optionally ``name``)
+    :param buffer_size: the number of bytes to request from the reader on each read
+    :param max_buffer_size: the number of bytes to hold without finding a newline before giving up
+           and reporting the partial line
+    :param skip: line numbers less than this value are counted but not materialized
+    :param pattern: a :class:`FixedString` or :class:`Regex` that lines must match to be yielded
+    :param line_num: the number of lines already passed when the reader starts partway through
+    :param offset: the number of bytes already passed when the reader starts partway through
+
+    After each line is yielded, :attr:`offset` holds the byte offset of the start of that line,
+    allowing a later read to seek directly back to it.
+    '''
+
+    NEWLINE = b'\n'
+
+    def __init__(self, reader, buffer_size, max_buffer_size, skip=0, pattern=None, line_num=0,
+                 offset=0):
+        self.line_num = line_num
+        self.offset = offset
+        self._consumed = offset # the offset of the start of the buffer
+        self._reader = reader
+        self._buffer_size = buffer_size
+        self._max_buffer_size = max_buffer_size
+        self._skip = skip
+        self._pattern = pattern
+
+    def __iter__(self):
+        buf = bytearray()
+        while True:
+            data = self._reader.read(self._buffer_size)
+            if not data:
+                self._reader.close()
+                if buf:
+                    self._warn_partial(buf)
+                    self.line_num += 1
+                    if self.line_num >= self._skip and self._matches(buf, 0, len(buf)):
+                        self.offset = self._consumed
+                        yield self.line_num, bytes(buf)
+                return
+            scan = len(buf) # remainder already known not to contain a newline
+            buf += data
+            start = self._skip_lines(buf, scan)
+            view = memoryview(buf) # (dropped before resizing: a view holds the buffer's size)
+            try:
+                if self._pattern:
+                    end = buf.rfind(self.NEWLINE, max(start, scan))
+                    while end > -1:
+                        found = self._pattern.search(buf, start, end)
+                        if found < 0:
+                            self.line_num += buf.count(self.NEWLINE, start, end + 1)
+                            start = end + 1
+                            break
+                        line_start = buf.rfind(self.NEWLINE, start, found) + 1 or start
+                        line_end = buf.find(self.NEWLINE, found)
+                        self.line_num += buf.count(self.NEWLINE, start, line_start) + 1
+                        start = line_end + 1
+                        if self._matches(buf, line_start, line_end):
+                            self.offset = self._consumed + line_start
+                            yield self.line_num, view[line_start:line_end].tobytes()
+                else:
+                    newline = buf.find(self.NEWLINE, max(start, scan))
+                    while newline > -1:
+                        self.line_num += 1
+                        self.offset = self._consumed + start
+                        yield self.line_num, view[start:newline].tobytes()
+                        start = newline + 1
+                        newline = buf.find(self.NEWLINE, start)
+            finally:
+                del view # (rather than release, which Python 2 lacks)
+            del buf[:start]
+            self._consumed += start
+            if len(buf) + self._buffer_size > self._max_buffer_size:
+                self._warn_partial(buf)
+                self.line_num += 1
+                if self.line_num >= self._skip and self._matches(buf, 0, len(buf)):
+                    self.offset = self._consumed
+                    yield self.line_num, bytes(buf)
+                self._consumed += len(buf)
+                del buf[:]
+
+    def chunks(self):
+        '''Iterate over runs of whole lines, yielding ``(line_num, data)`` tuples.
+
+        Rather than splitting out each line, all the complete lines in a chunk read are yielded at
+        once (each including its newline, even a final partial line) along with the number of the
+        last of them. Useful when lines are passed along untouched. Any `pattern` is ignored.
+
+        After each run is yielded, :attr:`offset` holds the byte offset of the start of its last
+        line.
+        '''
+        buf = bytearray()
+        while True:
+            data = self._reader.read(self._buffer_size)
+            if not data:
+                self._reader.close()
+                if buf:
+                    self._warn_partial(buf)
+                    self.line_num += 1
+                    if self.line_num >= self._skip:
+                        self.offset = self._consumed
+                        yield self.line_num, bytes(buf) + self.NEWLINE
+                return
+            scan = len(buf) # remainder already known not to contain a newline
+            buf += data
+            start = self._skip_lines(buf, scan)
+            end = buf.rfind(self.NEWLINE, max(start, scan))
+            if end > -1:
+                self.line_num += buf.count(self.NEWLINE, start, end + 1)
+                self.offset = self._consumed + (buf.rfind(self.NEWLINE, start, end) + 1 or start)
+                view = memoryview(buf)
+                run = view[start:end + 1].tobytes()
+                del view
+                yield self.line_num, run
+                start = end + 1
+            del buf[:start]
+            self._consumed += start
+            if len(buf) + self._buffer_size > self._max_buffer_size:
+                self._warn_partial(buf)
+                self.line_num += 1
+                if self.line_num >= self._skip:
+                    self.offset = self._consumed
+                    yield self.line_num, bytes(buf) + self.NEWLINE
+                self._consumed += len(buf)
+                del buf[:]
+
+    ######################################################################
+    # private
+
+    def _matches(self, buf, start, end):
+        '''Confirm a match lies within a single line (a pattern found in a chunk may span lines).'''
+        return not self._pattern or self._pattern.search(buf, start, end) > -1
+
+    def _skip_lines(self, buf, scan):
+        '''Count (without copying) any complete lines that are still before the skip point.'''
+        start = 0
+        while self.line_num + 1 < self._skip:
+            newline = buf.find(self.NEWLINE, max(start, scan))
+            if newline < 0:
+                break
+            self.line_num += 1
+            start = newline + 1
+        return start
+
+    def _warn_partial(self, buf):
+        _logger.warn('Unable to locate newline in %s after line %d',
+                     getattr(self._reader, 'name', self._reader), self.line_num)
+
+class FixedString(object):
+    '''Matches lines containing an exact sequence of bytes.
+
+    :param needle: the bytes to search for
+    '''
+
+    def __init__(self, needle):
+        self._needle = needle
+
+    def search(self, buf, start, end):
+        '''Return the index of the first match in ``buf[start:end]`` (or -1 if not found).'''
+        return buf.find(self._needle, start, end)
+
+class Regex(object):
+    '''Matches lines using a regular expression (``^`` and ``$`` match at each line's boundaries).
+
+    :param pattern: the bytes regular expression to search for
+    :param flags: any additional flags to compile the expression with
+    '''
+
+    def __init__(self, pattern, flags=0):
+        self._regex = re.compile(pattern, flags | re.MULTILINE)
+
+    def search(self, buf, start, end):
+        '''Return the index of the first match in ``buf[start:end]`` (or -1 if not found).'''
+        match = self._regex.search(buf, start, end)
+        return match.start() if match else -1
+
+class Excluding(object):
+    '''A line filter accepting only the lines that do not match a pattern (e.g. ``grep -v``).
+
+    Unlike a pattern, this is checked against each line after it is split out.
+
+    :param pattern: the :class:`FixedString` or :class:`Regex` that lines must not match
+    '''
+
+    def __init__(self, pattern):
+        self._pattern = pattern
+
+    def __call__(self, line):
+        return self._pattern.search(line, 0, len(line)) < 0
@@ -0,0 +1,73 @@
+from builtins import object
+
+import time
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class LineWriter(object):
+    '''Buffers lines written to a binary stream, passing them along in large chunks.
+
+    Writing each line to a stream on its own (e.g. with ``click.echo``) costs far more than the
+    line itself when there are millions of them. Instead, lines are collected until at least
+    `buffer_size` bytes are waiting and are then joined into a single write. Runs of lines that
+    already end with newlines (see :func:`.line_reader.LineReader.chunks`) are passed along as they
+    are. Errors from the stream (e.g. ``EPIPE``) are raised from the write that flushes.
+
+    :param stream: a binary stream with ``write`` and ``flush`` methods (e.g. standard output)
+    :param buffer_size: the number of bytes to collect before writing them to the stream
+    :param stats: a :class:`.run_stats.RunStats` to count the bytes written (and time taken) in
+    '''
+
+    NEWLINE = b'\n'
+
+    BUFFER_SIZE = 1 * (1024*1024) # MiB
+    '''Describes the default number of bytes collected before writing to the stream.'''
+
+    def __init__(self, stream, buffer_size=BUFFER_SIZE, stats=None):
+        self.stats = stats
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._pending = []
+        self._size = 0
+
+    def write_line(self, line):
+        '''Write the bytes of a `line` (a newline is added).'''
+        pending = self._pending
+        pending.append(line)
+        pending.append(self.NEWLINE)
+        self._size += len(line) + 1
+        if self._size >= self._buffer_size:
+            self._write()
+
+    def write_lines(self, data):
+        '''Write bytes holding any number of whole lines (including their newlines).'''
+        if not self._pending and len(data) >= self._buffer_size:
+            self._send(data) # already large enough, so avoid copying it
+            return
+        self._pending.append(data)
+        self._size += len(data)
+        if self._size >= self._buffer_size:
+            self._write()
+
+    def flush(self):
+        '''Write anything collected so far, flushing the stream.'''
+        if self._pending:
+            self._write()
+        self._stream.flush()
+
+    ######################################################################
+    # private
+
+    def _write(self):
+        data = b''.join(self._pending)
+        self._pending = []
+        self._size = 0
+        self._send(data)
+
+    def _send(self, data):
+        started = time.time()
+        self._stream.write(data)
+        if self.stats:
+            self.stats.count('output_seconds', time.time() - started)
+            self.stats.count('output_bytes', len(data))
@@ -0,0 +1,179 @@
+from builtins import object
+
+import logging
+
+from collections import deque
+from queue import Queue, Full
+from threading import Thread, Event
+
+from boto.s3.prefix import Prefix
+
+_logger = logging.getLogger(__name__)
+
+class KeyQueue(object):
+    '''Draws keys from an iterable in a background thread, holding at most `size` of them.
+
+    Iterating over the queue yields the keys in their original order. Listing S3 requests a page of
+    keys at a time, so drawing them ahead in the background keeps the consumer from stalling at each
+    page boundary. Any error raised while listing is raised again from the iteration.
+
+    :param keys: an iterable of keys (e.g. a bucket listing)
+    :param size: the most keys to hold before waiting for some to be consumed
+    '''
+
+    _END = object()
+
+    def __init__(self, keys, size):
+        self._queue = Queue(size)
+        self._stopped = Event()
+        thread = Thread(target=self._run, args=(keys,), name='key-queue')
+        thread.daemon = True # never hold up process exit on a slow listing
+        thread.start()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._END:
+                return
+            if isinstance(item, self._Failure):
+                raise item.error
+            yield item
+
+    def stop(self):
+        '''Stop drawing keys, letting the background thread exit.'''
+        self._stopped.set()
+
+    ######################################################################
+    # private
+
+    class _Failure(object):
+        def __init__(self, error):
+            self.error = error
+
+    def _run(self, keys):
+        try:
+            for key in keys:
+                if not self._put(key):
+                    return
+        except Exception as exc:
+            self._put(self._Failure(exc))
+        self._put(self._END)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+class Lister(object):
+    '''Lists the keys under a prefix in background threads, yielding them in order.
+
+    With a single thread, the listing simply runs in the background (see :class:`KeyQueue`). With
+    more, the keys are split by the sub-prefixes found using the `delimiter` (e.g. the daily
+    directories of ELB logs) and up to `threads` sub-prefixes are listed concurrently. Sub-prefixes
+    never overlap, so yielding each one's keys in turn keeps the overall order S3 would list them.
+    (S3 returns the keys of each page before its sub-prefixes, so each page of sub-prefixes and keys
+    is put back in order by name.)
+
+    :param bucket: the bucket to list
+    :param prefix: what keys in the bucket should be listed
+    :param marker: the key name to begin listing after (or ``None`` to list from the beginning)
+    :param threads: the number of list calls to run concurrently
+    :param delimiter: the character separating sub-prefixes to split the listing by
+    :param queue_size: the most keys to hold from each list call before waiting
+    '''
+
+    QUEUE_SIZE = 10000
+    '''Describes the default most keys held from each list call (ten pages from S3).'''
+
+    def __init__(self, bucket, prefix, marker=None, threads=1, delimiter='/',
+                 queue_size=QUEUE_SIZE):
+        self._bucket = bucket
+        self._prefix = prefix
+        self._marker = marker
+        self._threads = threads
+        self._delimiter = delimiter
+        self._queue_size = queue_size
+
+    def __iter__(self):
+        if self._threads < 2:
+            return self._single()
+        return self._split()
+
+    ######################################################################
+    # private
+
+    def _list(self, prefix, marker, delimiter=''):
+        return KeyQueue(self._bucket.list(prefix=prefix, marker=marker, delimiter=delimiter),
+                        self._queue_size)
+
+    def _single(self):
+        queue = self._list(self._prefix, self._marker)
+        try:
+            for key in queue:
+                yield key
+        finally:
+            queue.stop()
+
+    def _level(self):
+        '''List the sub-prefixes and keys directly under the prefix, a page at a time.'''
+        marker = ''
+        while True:
+            page = self._bucket.get_all_keys(prefix=self._prefix, marker=marker,
+                                             delimiter=self._delimiter)
+            for item in sorted(page, key=lambda item: item.name):
+                yield item
+            if not page or not page.is_truncated:
+                return
+            marker = page.next_marker or max(item.name for item in page)
+
+    def _split(self):
+        level = KeyQueue(self._level(), self._queue_size)
+        items = iter(level)
+        pending = deque()
+        running = 0
+        exhausted = False
+        try:
+            while True:
+                # keep up to `threads` sub-prefixes listing ahead (one thread lists this level)
+                while not exhausted and running < self._threads - 1 and \
+                      len(pending) < self._queue_size:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if isinstance(item, Prefix):
+                        queue = self._start(item)
+                        if queue:
+                            pending.append(queue)
+                            running += 1
+                    elif not self._marker or item.name > self._marker:
+                        pending.append(item)
+                if not pending:
+                    return
+                item = pending.popleft()
+                if isinstance(item, KeyQueue):
+                    running -= 1
+                    for key in item:
+                        yield key
+                else:
+                    yield item
+        finally:
+            level.stop()
+            for item in pending:
+                if isinstance(item, KeyQueue):
+                    item.stop()
+
+    def _start(self, item):
+        '''Begin listing a sub-prefix (or ``None`` if it is entirely before the marker).'''
+        marker = self._marker
+        if marker and not marker.startswith(item.name):
+            if marker > item.name:
+                return None # everything in this sub-prefix is before the marker
+            marker = None
+        _logger.debug('Listing %s', item.name)
+        return self._list(item.name, marker)
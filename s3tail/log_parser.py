@@ -0,0 +1,230 @@
+from builtins import object
+
+import re
+import json
+import logging
+
+from collections import namedtuple
+
+_logger = logging.getLogger(__name__)
+
+class LogFormat(object):
+    '''Describes the fields of a log format, parsing lines into compact records.
+
+    Each format is parsed with a single regular expression compiled from its fields, so that a
+    line is split, unquoted, and typed in one pass. Records are instances of a ``namedtuple`` class
+    (:attr:`Record`) with a field for each of those described. Fields beyond the `required` count
+    may be missing (formats tend to gain fields over time) and are ``None`` when they are. Numeric
+    fields logged as ``-`` are also ``None``. The names of the numeric fields are listed in
+    :attr:`numeric`, and each record class refers back to its format as ``Record.log_format``.
+    Every format has a ``time`` field, which :func:`LogFormat.time_key` makes comparable across
+    formats.
+
+    :param name: a short name of the format
+    :param fields: a list of ``(name, kind, type)`` tuples where `kind` is one of ``token`` (no
+           spaces), ``quoted`` (surrounded by double quotes), or ``bracketed`` (surrounded by square
+           brackets) and `type` is a function converting the text (or ``None`` to keep it as text)
+    :param required: the number of leading fields that must be present
+    :param time_key: a function converting the text of the ``time`` field into a UTC time of the
+           form ``YYYY-MM-DDTHH:MM:SS[.ffffff]``, which sorts in time order
+    '''
+
+    PATTERNS = {
+        'token': r'(\S+)',
+        'quoted': r'"((?:[^"\\]|\\.)*)"',
+        'bracketed': r'\[([^\]]*)\]',
+    }
+    '''Describes the regular expression used for each kind of field.'''
+
+    def __init__(self, name, fields, required=None, time_key=None):
+        self.name = name
+        self._time_key = time_key
+        self.fields = [field[0] for field in fields]
+        self.numeric = set(field[0] for field in fields if field[2] in (int, float))
+        self.Record = namedtuple(name.upper() + 'Record', self.fields)
+        self.Record.log_format = self
+        required = len(fields) if required is None else required
+        pattern = ' '.join(self.PATTERNS[kind] for _, kind, _ in fields[:required])
+        for _, kind, _ in fields[required:]:
+            pattern += '(?: ' + self.PATTERNS[kind] + ')?'
+        self._regex = re.compile(pattern)
+        self._converters = [(i, convert) for i, (_, _, convert) in enumerate(fields) if convert]
+
+    def parse(self, line):
+        '''Get a record for the `line` (or ``None`` if it is not in this format).'''
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        match = self._regex.match(line)
+        if not match:
+            return None
+        values = list(match.groups())
+        try:
+            for i, convert in self._converters:
+                value = values[i]
+                if value is not None:
+                    values[i] = None if value == '-' else convert(value)
+        except ValueError:
+            return None
+        return self.Record._make(values)
+
+    def time_key(self, record):
+        '''Get the time of a `record` as text that sorts in time order (across all formats).'''
+        if self._time_key:
+            return self._time_key(record.time)
+        return _iso_time(record.time)
+
+ELB = LogFormat('elb', [
+    ('time', 'token', None),
+    ('elb', 'token', None),
+    ('client', 'token', None),
+    ('backend', 'token', None),
+    ('request_processing_time', 'token', float),
+    ('backend_processing_time', 'token', float),
+    ('response_processing_time', 'token', float),
+    ('elb_status_code', 'token', int),
+    ('backend_status_code', 'token', int),
+    ('received_bytes', 'token', int),
+    ('sent_bytes', 'token', int),
+    ('request', 'quoted', None),
+    ('user_agent', 'quoted', None),
+    ('ssl_cipher', 'token', None),
+    ('ssl_protocol', 'token', None),
+], required=13)
+'''Describes the access logs of a classic load balancer.'''
+
+ALB = LogFormat('alb', [
+    ('type', 'token', None),
+    ('time', 'token', None),
+    ('elb', 'token', None),
+    ('client', 'token', None),
+    ('target', 'token', None),
+    ('request_processing_time', 'token', float),
+    ('target_processing_time', 'token', float),
+    ('response_processing_time', 'token', float),
+    ('elb_status_code', 'token', int),
+    ('target_status_code', 'token', int),
+    ('received_bytes', 'token', int),
+    ('sent_bytes', 'token', int),
+    ('request', 'quoted', None),
+    ('user_agent', 'quoted', None),
+    ('ssl_cipher', 'token', None),
+    ('ssl_protocol', 'token', None),
+    ('target_group_arn', 'token', None),
+    ('trace_id', 'quoted', None),
+    ('domain_name', 'quoted', None),
+    ('chosen_cert_arn', 'quoted', None),
+    ('matched_rule_priority', 'token', int),
+    ('request_creation_time', 'token', None),
+    ('actions_executed', 'quoted', None),
+    ('redirect_url', 'quoted', None),
+    ('error_reason', 'quoted', None),
+], required=17)
+'''Describes the access logs of an application load balancer.'''
+
+S3 = LogFormat('s3', [
+    ('bucket_owner', 'token', None),
+    ('bucket', 'token', None),
+    ('time', 'bracketed', None),
+    ('remote_ip', 'token', None),
+    ('requester', 'token', None),
+    ('request_id', 'token', None),
+    ('operation', 'token', None),
+    ('key', 'token', None),
+    ('request_uri', 'quoted', None),
+    ('http_status', 'token', int),
+    ('error_code', 'token', None),
+    ('bytes_sent', 'token', int),
+    ('object_size', 'token', int),
+    ('total_time', 'token', int),
+    ('turn_around_time', 'token', int),
+    ('referrer', 'quoted', None),
+    ('user_agent', 'quoted', None),
+    ('version_id', 'token', None),
+    ('host_id', 'token', None),
+    ('signature_version', 'token', None),
+    ('cipher_suite', 'token', None),
+    ('authentication_type', 'token', None),
+    ('host_header', 'token', None),
+    ('tls_version', 'token', None),
+], required=17, time_key=lambda text: _s3_time(text))
+'''Describes S3 server access logs.'''
+
+FORMATS = [ALB, ELB, S3]
+'''Describes the formats tried when detecting the format of a line.'''
+
+class LogParser(object):
+    '''Parses lines into records, detecting the format when necessary.
+
+    Once a line is parsed in some format, following lines are expected to be in the same format,
+    so the format is only detected again upon a line that does not parse (e.g. at the start of a
+    file from another source).
+
+    :param formats: the :class:`LogFormat` objects to try (a single format to only parse that one)
+    '''
+
+    def __init__(self, formats=FORMATS):
+        self._formats = formats if isinstance(formats, list) else [formats]
+        self._current = self._formats[0]
+
+    def parse(self, line):
+        '''Get a record for the `line` (or ``None`` if it is not in any of the formats).'''
+        record = self._current.parse(line)
+        if record is not None:
+            return record
+        for log_format in self._formats:
+            if log_format is not self._current:
+                record = log_format.parse(line)
+                if record is not None:
+                    _logger.debug('Parsing lines as %s', log_format.name)
+                    self._current = log_format
+                    return record
+        return None
+
+def find_format(name):
+    '''Get the format with the `name` (or all formats, to be detected, for ``auto``).'''
+    if name == 'auto':
+        return FORMATS
+    for log_format in FORMATS:
+        if log_format.name == name:
+            return log_format
+    raise ValueError('Unknown log format: ' + name)
+
+def record_formatter(output, log_format=None):
+    '''Get a function converting a record to text for the `output` style.
+
+    The style is one of ``json``, ``tsv``, or ``fields=NAME,...`` to list only the values of the
+    named fields, separated by tabs (fields missing from a record's format are shown as ``-``).
+    When the `log_format` (or a list of them) is given, a ``ValueError`` is raised for any named
+    field that none of them have.
+    '''
+    if output == 'json':
+        return lambda record: json.dumps(record._asdict())
+    if output == 'tsv':
+        return lambda record: '\t'.join(_tsv_value(v) for v in record)
+    if output.startswith('fields='):
+        names = output[len('fields='):].split(',')
+        log_formats = log_format if isinstance(log_format, list) else [log_format]
+        for name in names:
+            if log_format and not any(name in f.fields for f in log_formats):
+                raise ValueError('Unknown field in %s logs: %s' %
+                                 ('/'.join(f.name for f in log_formats), name))
+        return lambda record: '\t'.join(_tsv_value(getattr(record, n, None)) for n in names)
+    raise ValueError('Unknown output: ' + output)
+
+######################################################################
+# private
+
+_MONTHS = dict((name, '%02d' % (i + 1)) for i, name in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']))
+
+def _iso_time(text):
+    return text[:-1] if text.endswith('Z') else text
+
+def _s3_time(text):
+    # e.g. 06/Feb/2019:00:00:38 +0000 (always logged in UTC)
+    return '%s-%s-%sT%s' % (text[7:11], _MONTHS.get(text[3:6], '00'), text[0:2], text[12:20])
+
+def _tsv_value(value):
+    if value is None:
+        return '-'
+    return str(value).replace('\t', '\\t')
@@ -0,0 +1,192 @@
+from builtins import object
+
+import heapq
+import logging
+
+from datetime import datetime, timedelta
+from itertools import chain, count
+
+from .log_parser import FORMATS, LogParser
+from .time_range import LAYOUTS, TimeRange, key_layout, key_time
+
+_logger = logging.getLogger(__name__)
+
+class Merger(object):
+    '''Merges the lines of several keys into a single stream ordered by the time of each line.
+
+    Load balancers write one key per node for each interval, so reading keys in the order they are
+    listed jumps back and forth in time. Instead, a merger keeps a heap of the keys being read,
+    ordered by the time of each key's next line, and always takes the earliest line (a k-way merge).
+    Lines are parsed to find their time: those that do not parse keep the position of the line
+    before them.
+
+    Only the keys that might hold the next line are open at once, keeping memory bounded no matter
+    how many keys are merged. Keys are provided in the order of the time in their names, which for
+    logs is when the key was written (i.e. after its last line). So a key is not opened until the
+    merge reaches the `window` of time before that, and the output is strictly ordered as long as
+    no key holds lines from further back than its `window`. Keys without a time in their name are
+    opened right away.
+
+    Iterating over a merger yields ``(item, line_num, line, record)`` tuples, where `record` is the
+    parsed line (or ``None`` when it did not parse). The number of keys opened and the most open at
+    once are kept in :attr:`opened` and :attr:`peak_open`.
+
+    :param entries: an iterable of ``(when, item)`` tuples ordered by `when`, the time in the name
+           of each key (or ``None``), where `item` is anything `open_lines` accepts (see
+           :func:`ordered_keys`)
+    :param open_lines: a function called with an `item` when it is time to open it, returning an
+           iterable of ``(line_num, line)`` tuples (or ``None`` to skip it)
+    :param formats: the :class:`.log_parser.LogFormat` objects used to parse lines (a single format
+           to only parse that one)
+    :param window: a ``timedelta`` of how far back from the time in its name a key may hold lines
+    :param line_filter: a function called with each line, returning a "truthy" value for lines that
+           should be merged (others are dropped before they are parsed)
+    '''
+
+    WINDOW = timedelta(minutes=5)
+    '''Describes the default window of time held by a key, the shortest interval of ELB logs.'''
+
+    def __init__(self, entries, open_lines, formats=FORMATS, window=WINDOW, line_filter=None):
+        self._entries = entries
+        self._open_lines = open_lines
+        self._formats = formats
+        self._window = window
+        self._line_filter = line_filter
+        self.opened = 0
+        self.peak_open = 0
+
+    def __iter__(self):
+        entries = iter(self._entries)
+        heap = []
+        order = count() # (breaks ties, so streams are never compared and equal times stay in order)
+        upcoming = self._next_entry(entries)
+        try:
+            while True:
+                while upcoming and (not heap or upcoming[0] <= heap[0][0]):
+                    stream = self._open(upcoming[1])
+                    if stream and stream.advance():
+                        heapq.heappush(heap, (stream.time, next(order), stream))
+                        self.peak_open = max(self.peak_open, len(heap))
+                    upcoming = self._next_entry(entries)
+                if not heap:
+                    return
+                stream = heap[0][2]
+                yield stream.item, stream.line_num, stream.line, stream.record
+                if stream.advance():
+                    heapq.heapreplace(heap, (stream.time, next(order), stream))
+                else:
+                    heapq.heappop(heap)
+        finally:
+            for _, _, stream in heap:
+                stream.close()
+
+    ######################################################################
+    # private
+
+    def _next_entry(self, entries):
+        '''Get the next item along with the time of the merge at which to open it.'''
+        entry = next(entries, None)
+        if entry is None:
+            return None
+        when, item = entry
+        if when is None:
+            return '', item # (sorts before any time)
+        return (when - self._window).strftime('%Y-%m-%dT%H:%M:%S'), item
+
+    def _open(self, item):
+        lines = self._open_lines(item)
+        if lines is None:
+            return None
+        self.opened += 1
+        return self._Stream(item, lines, LogParser(self._formats), self._line_filter)
+
+    class _Stream(object):
+        def __init__(self, item, lines, parser, line_filter):
+            self.item = item
+            self.time = ''
+            self.line_num = None
+            self.line = None
+            self.record = None
+            self._lines = iter(lines)
+            self._parser = parser
+            self._line_filter = line_filter
+
+        def advance(self):
+            for self.line_num, self.line in self._lines:
+                if self._line_filter and not self._line_filter(self.line):
+                    continue
+                self.record = self._parser.parse(self.line)
+                if self.record is not None:
+                    self.time = self.record.log_format.time_key(self.record)
+                return True
+            return False
+
+        def close(self):
+            close = getattr(self._lines, 'close', None)
+            if close:
+                close()
+
+def stem_listings(list_keys, prefix, layouts=LAYOUTS):
+    '''Split the keys under a prefix into listings of the keys sharing each naming stem.
+
+    S3 lists keys by name, so the keys of several logs under one prefix (e.g. two load balancers
+    writing into the same daily directory) are listed one log after the other, not in time order.
+    The keys sharing a stem are, though, so each stem gets a listing of its own. Stems are found by
+    listing the first key of each (jumping past the rest of them with a marker), while the rest of
+    a stem's keys are not listed until they are reached. Keys without a stem are listed on their
+    own. Keys named in a deeper directory of a stem are listed with it, and so might be out of order
+    (see :func:`ordered_keys`).
+
+    :param list_keys: a function called with a prefix and a marker, returning an iterable of the
+           keys after that marker (listed only as it is iterated)
+    :param prefix: the prefix of the keys to list
+    :param layouts: the :class:`.time_range.KeyLayout` objects used to find the stem of a name
+    '''
+    listings = []
+    marker = None
+    while True:
+        for key in list_keys(prefix, marker):
+            layout, match = key_layout(key.name, layouts)
+            if not layout:
+                listings.append([key])
+                continue
+            stem = match.group('stem')
+            # (a prefix reaching into the timestamp already lists a single stem)
+            stem_prefix = stem if stem.startswith(prefix) else prefix
+            listings.append(chain([key], _listed_later(list_keys, stem_prefix, key.name)))
+            marker = stem + TimeRange.PAST_STEM
+            break # list again from past this stem
+        else:
+            return listings
+
+def ordered_keys(listings, layouts=LAYOUTS):
+    '''Merge several listings of keys into one ordered by the time in each key's name.
+
+    Each listing is expected to already be in that order, as S3 lists keys sharing a naming stem
+    (see :func:`stem_listings`). A warning is logged when a listing goes back in time, as the keys
+    following are merged late. Keys without a time in their name come first. Generates
+    ``(when, key)`` tuples suitable for a :class:`Merger`.
+
+    :param listings: iterables of keys (e.g. the stems of different prefixes or buckets)
+    :param layouts: the :class:`.time_range.KeyLayout` objects used to find the time in a name
+    '''
+    def timed(source, keys):
+        latest = None
+        for i, key in enumerate(keys):
+            when = key_time(key.name, layouts)
+            if when and latest and when < latest:
+                _logger.warning('Listing went back in time from %s to %s (%s): lines may be out '
+                                'of order', latest, when, key.name)
+            latest = max(when, latest) if when and latest else when or latest
+            yield (when or datetime.min, source, i), when, key
+    merged = heapq.merge(*[timed(source, keys) for source, keys in enumerate(listings)])
+    for _, when, key in merged:
+        yield when, key
+
+######################################################################
+# private
+
+def _listed_later(list_keys, prefix, marker):
+    '''List the keys after `marker` only once the first of them is wanted.'''
+    for key in list_keys(prefix, marker):
+        yield key
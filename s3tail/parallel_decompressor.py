@@ -0,0 +1,217 @@
+from builtins import object
+
+import zlib
+import mmap
+import logging
+
+from collections import deque
+from queue import Queue, Full
+from threading import Thread
+
+_logger = logging.getLogger(__name__)
+
+class ParallelDecompressor(object):
+    '''Decompresses a gzip file using several threads while reading the result in order.
+
+    A file made of several concatenated gzip members holds independent streams that can each be
+    inflated on their own (zlib releases the GIL while it works). Members are located by searching
+    the compressed bytes for gzip headers. Such a header may also appear by chance inside a member,
+    so each one found is only a candidate: its result is used when the member before it ends exactly
+    there and is otherwise discarded.
+
+    When an `index` is provided, the file is instead split at each of its checkpoints, allowing a
+    single member written with checkpoints to be inflated concurrently as well.
+
+    Each segment is inflated in pieces of no more than :attr:`PIECE_SIZE` bytes, and only a few
+    pieces are held ahead of the reader, so memory use does not depend on the size of a member.
+
+    A file without more than one member or checkpoint is inflated on the calling thread as usual.
+    The file is memory-mapped and not examined until first read.
+
+    :param reader: an open file holding the gzip content
+    :param threads: the number of threads used to inflate members concurrently
+    :param index: a :class:`s3tail.gzip_index.GzipIndex` for the file (or ``None``)
+    '''
+
+    HEADER = b'\x1f\x8b\x08'
+    '''Describes the leading bytes of a gzip member using the deflate method.'''
+
+    READ_SIZE = 1024 * 1024
+    '''Describes the number of compressed bytes given to zlib at a time.'''
+
+    PIECE_SIZE = 1024 * 1024
+    '''Describes the most decompressed bytes produced at a time.'''
+
+    PIECES_AHEAD = 4
+    '''Describes the most pieces of each segment inflated ahead of being read.'''
+
+    def __init__(self, reader, threads, index=None):
+        self.name = getattr(reader, 'name', None)
+        self._reader = reader
+        self._threads = threads
+        self._index = index
+        self._data = None
+        self._chunks = None
+        self._buffer = b''
+        self._offset = 0
+
+    def read(self, size=-1):
+        if self._chunks is None:
+            self._chunks = self._generate()
+        if size < 1:
+            data = self._buffer[self._offset:] + b''.join(self._chunks)
+            self._buffer = b''
+            self._offset = 0
+            return data
+        while self._offset >= len(self._buffer):
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return b''
+            self._offset = 0
+        data = self._buffer[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+    def close(self):
+        if self._chunks is not None:
+            self._chunks.close()
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        self._reader.close()
+
+    ######################################################################
+    # private
+
+    def _generate(self):
+        self._data = mmap.mmap(self._reader.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._data)
+        if self._index and self._index.checkpoints:
+            starts = [0] + [c for _, c in self._index.checkpoints]
+            ends = starts[1:] + [size]
+            segments = [(s, e, -zlib.MAX_WBITS) for s, e in zip(starts, ends)]
+            segments[0] = (0, ends[0], 16 + zlib.MAX_WBITS)
+            speculative = False
+        else:
+            segments = [(s, size, 16 + zlib.MAX_WBITS) for s in self._find_headers()]
+            speculative = True
+
+        if len(segments) < 2:
+            for data in self._stream(0, size):
+                yield data
+            return
+
+        _logger.debug('Inflating %d segments of %s using %d threads',
+                      len(segments), self.name, self._threads)
+        segments = iter(segments)
+        active = deque()
+        pos = 0
+        try:
+            while True:
+                while len(active) < self._threads:
+                    segment = next(segments, None)
+                    if segment is None:
+                        break
+                    active.append(self._Segment(self._data, segment, self.READ_SIZE,
+                                                self.PIECE_SIZE, self.PIECES_AHEAD))
+                if not active:
+                    return
+                segment = active.popleft()
+                if speculative and segment.start != pos:
+                    # a header-like sequence inside the member before (or after the last)
+                    segment.cancel()
+                    continue
+                for data in segment.pieces():
+                    yield data
+                pos = segment.end
+        finally:
+            for segment in active:
+                segment.cancel()
+
+    def _find_headers(self):
+        found = self._data.find(self.HEADER)
+        if found != 0:
+            return [0] # not multi-member gzip (let zlib report the problem when streaming)
+        starts = []
+        while found > -1:
+            starts.append(found)
+            found = self._data.find(self.HEADER, found + 1)
+        return starts
+
+    def _stream(self, start, end):
+        decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        pos = start
+        while pos < end:
+            chunk = self._data[pos:min(pos + self.READ_SIZE, end)]
+            pos += len(chunk)
+            data = decompressor.decompress(chunk)
+            while decompressor.unused_data: # the start of another member
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+                data += decompressor.decompress(chunk)
+            if data:
+                yield data
+        data = decompressor.flush()
+        if data:
+            yield data
+
+    class _Segment(object):
+        '''Inflates one segment on its own thread, holding only a few pieces ahead of the reader.'''
+
+        def __init__(self, data, segment, read_size, piece_size, pieces_ahead):
+            self.start, self._stop, self._wbits = segment
+            self.end = None
+            self._data = data
+            self._read_size = read_size
+            self._piece_size = piece_size
+            self._pieces = Queue(pieces_ahead)
+            self._error = None
+            self._cancelled = False
+            thread = Thread(target=self._run, name='inflate-%d' % self.start)
+            thread.daemon = True
+            thread.start()
+
+        def pieces(self):
+            '''Generate the inflated pieces in order, raising any error once reached.'''
+            while True:
+                piece = self._pieces.get()
+                if piece is None:
+                    break
+                yield piece
+            if self._error:
+                raise self._error # the segment could not be inflated
+
+        def cancel(self):
+            self._cancelled = True
+
+        def _run(self):
+            decompressor = zlib.decompressobj(self._wbits)
+            pos = self.start
+            try:
+                while pos < self._stop and not decompressor.unused_data:
+                    chunk = self._data[pos:min(pos + self._read_size, self._stop)]
+                    pos += len(chunk)
+                    while chunk and not decompressor.unused_data:
+                        piece = decompressor.decompress(chunk, self._piece_size)
+                        chunk = decompressor.unconsumed_tail
+                        if piece and not self._put(piece):
+                            return
+                end = pos - len(decompressor.unused_data) # (before flushing adds any tail to it)
+                piece = decompressor.flush()
+                if piece and not self._put(piece):
+                    return
+                self.end = end
+            except Exception as exc: # (including reading from a file closed while cancelled)
+                self._error = exc
+            self._put(None)
+
+        def _put(self, piece):
+            '''Wait for room to hold a piece, unless cancelled (reporting if it was held).'''
+            while not self._cancelled:
+                try:
+                    self._pieces.put(piece, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
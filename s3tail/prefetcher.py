@@ -0,0 +1,97 @@
+from builtins import range
+from builtins import object
+
+import logging
+
+from collections import deque
+from queue import Queue
+from threading import Thread, Event
+
+_logger = logging.getLogger(__name__)
+
+class Prefetcher(object):
+    '''Fetches upcoming keys in background threads while earlier keys are being processed.
+
+    Iterating over a prefetcher yields ``(key, result)`` tuples in exactly the order the keys were
+    provided, where `result` is whatever the `fetch` function returned for that key. At most
+    `count` keys beyond the one currently being consumed are fetched ahead of time.
+
+    :param keys: an iterable of keys to fetch
+    :param fetch: a function called from a worker thread with a key, returning its result
+    :param count: the number of keys to fetch ahead (and the number of worker threads to use)
+    '''
+
+    def __init__(self, keys, fetch, count):
+        self._keys = iter(keys)
+        self._fetch = fetch
+        self._count = count
+        self._jobs = Queue()
+        self._pending = deque()
+        self._workers = []
+        self._exhausted = False
+
+    def __iter__(self):
+        for i in range(self._count):
+            worker = Thread(target=self._work, name='prefetch-%d' % i)
+            worker.daemon = True # never hold up process exit on a slow download
+            worker.start()
+            self._workers.append(worker)
+        try:
+            self._fill()
+            while self._pending:
+                job = self._pending.popleft()
+                self._fill()
+                yield job.key, job.result()
+        finally:
+            self.stop()
+
+    def stop(self):
+        '''Discard any keys not yet fetched and let the worker threads exit.'''
+        while self._pending:
+            self._pending.popleft().cancelled = True
+        for _ in self._workers:
+            self._jobs.put(None)
+        self._workers = []
+
+    ######################################################################
+    # private
+
+    def _fill(self):
+        while not self._exhausted and len(self._pending) < self._count:
+            try:
+                key = next(self._keys)
+            except StopIteration:
+                self._exhausted = True
+                return
+            job = self._Job(key)
+            self._pending.append(job)
+            self._jobs.put(job)
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            job.run(self._fetch)
+
+    class _Job(object):
+        def __init__(self, key):
+            self.key = key
+            self.cancelled = False
+            self._done = Event()
+            self._result = None
+            self._error = None
+
+        def run(self, fetch):
+            if not self.cancelled:
+                try:
+                    self._result = fetch(self.key)
+                except Exception as exc:
+                    self._error = exc
+            self._done.set()
+
+        def result(self):
+            self._done.wait()
+            if self._error:
+                raise self._error
+            return self._result
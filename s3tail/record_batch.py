@@ -0,0 +1,270 @@
+from builtins import zip
+from builtins import object
+
+import re
+import math
+import logging
+
+from array import array
+from collections import defaultdict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_logger = logging.getLogger(__name__)
+
+class RecordBatch(object):
+    '''Holds a number of parsed records as columns, one per field.
+
+    Numeric fields become ``array('d')`` columns (or NumPy ``float64`` arrays when `use_numpy` is
+    set) with missing values as ``NaN``. Other fields are lists. Records are transposed into columns
+    at once (using ``zip``), rather than appending each field of each record.
+
+    :param log_format: the :class:`.log_parser.LogFormat` of the records
+    :param records: a list of records of that format
+    :param use_numpy: build NumPy arrays (requires NumPy to be installed)
+    '''
+
+    def __init__(self, log_format, records, use_numpy=False):
+        self.log_format = log_format
+        self.fields = log_format.fields
+        self.columns = {}
+        if not records:
+            self.columns = dict((name, []) for name in self.fields)
+            self.size = 0
+            return
+        self.size = len(records)
+        for name, values in zip(self.fields, zip(*records)):
+            if name in log_format.numeric:
+                values = [_NAN if v is None else v for v in values]
+                if use_numpy:
+                    values = numpy.array(values, dtype=numpy.float64)
+                else:
+                    values = array('d', values)
+            else:
+                values = list(values)
+            self.columns[name] = values
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+class Batcher(object):
+    '''Collects records into :class:`RecordBatch` objects of up to `size` records.
+
+    Suitable for use as the `line_handler` of :class:`.s3tail.S3Tail` when parsing records. A batch
+    is handed to the `batch_handler` when full, when a record of a different format arrives, or
+    upon a :func:`Batcher.flush`. A result returned by the `batch_handler` (i.e. if it is not
+    ``None``) is returned in turn.
+
+    :param size: the most records to put in each batch
+    :param batch_handler: a function called with the line number (or location) of the last record
+           collected and each batch
+    :param use_numpy: build the batches' columns as NumPy arrays
+    '''
+
+    SIZE = 10000
+    '''Describes the default number of records in each batch.'''
+
+    def __init__(self, batch_handler, size=SIZE, use_numpy=False):
+        if use_numpy and not numpy:
+            raise ImportError('NumPy is required for NumPy batches')
+        self._batch_handler = batch_handler
+        self._size = size
+        self._use_numpy = use_numpy
+        self._records = []
+        self._record_type = None
+        self._line_num = None
+
+    def __call__(self, line_num, record):
+        result = None
+        if type(record) is not self._record_type:
+            result = self.flush()
+            self._record_type = type(record)
+        self._records.append(record)
+        self._line_num = line_num
+        if result is None and len(self._records) >= self._size:
+            result = self.flush()
+        return result
+
+    def flush(self):
+        '''Hand any records collected so far to the `batch_handler`.'''
+        if not self._records:
+            return None
+        batch = RecordBatch(self._record_type.log_format, self._records, self._use_numpy)
+        self._records = []
+        return self._batch_handler(self._line_num, batch)
+
+class GroupStats(object):
+    '''Aggregates batches of records by group, reporting the count and value statistics of each.
+
+    Each record's group is made from the values of the `group_by` fields. A time field may be given
+    as ``NAME:minute`` or ``NAME:hour`` to group by the minute (or hour) of its timestamp. For each
+    of the `fields` (numeric fields only), the mean, maximum, and the `percentiles` of the values
+    are reported (missing values are ignored). Percentiles are exact, so the values are kept until
+    reported.
+
+    When NumPy is installed, each batch is grouped and split using vectorized operations.
+
+    :param group_by: the names of the fields to group by
+    :param fields: the names of the numeric fields to report on
+    :param percentiles: the percentiles of each field's values to report
+    :param log_format: the :class:`.log_parser.LogFormat` (or a list of them, when detected) of the
+           records to be added, raising a ``ValueError`` up front for fields that none of them have
+           (or have as numeric, for `fields`); records of a format without some field are grouped as
+           ``-`` and have no values for it
+    '''
+
+    PERCENTILES = (50, 90, 99)
+    '''Describes the default percentiles reported for each field.'''
+
+    TRUNCATIONS = {
+        'minute': re.compile(r'(\d\d:\d\d):\d\d(?:\.\d+)?(?=Z|\s|$)'),
+        'hour': re.compile(r'(\d\d):\d\d:\d\d(?:\.\d+)?(?=Z|\s|$)'),
+    }
+    '''Describes how timestamps are truncated for each of the time units a group may use.'''
+
+    def __init__(self, group_by=(), fields=(), percentiles=PERCENTILES, log_format=None):
+        self._group_by = [self._group_field(name) for name in group_by]
+        self._fields = list(fields)
+        if log_format is not None:
+            self._check(log_format if isinstance(log_format, list) else [log_format])
+        self._percentiles = percentiles
+        self._counts = defaultdict(int)
+        self._values = defaultdict(lambda: defaultdict(list)) # group => field => value chunks
+
+    def __call__(self, batch):
+        '''Add the records in a batch (e.g. passed along by a `batch_handler`).'''
+        if not len(batch):
+            return
+        labels = self._labels(batch)
+        if numpy:
+            self._add_vectorized(batch, labels)
+        else:
+            self._add(batch, labels)
+
+    def header(self):
+        '''Get the names of the columns reported for each group.'''
+        names = [name for name, _ in self._group_by] + ['count']
+        for field in self._fields:
+            names += ['%s_%s' % (field, stat) for stat in self._stat_names()]
+        return names
+
+    def report(self):
+        '''Get a row of values for each group (in the order of :func:`GroupStats.header`).'''
+        rows = []
+        for label in sorted(self._counts):
+            row = list(label) + [self._counts[label]]
+            for field in self._fields:
+                row += self._summarize(self._values[label][field])
+            rows.append(row)
+        return rows
+
+    ######################################################################
+    # private
+
+    def _group_field(self, name):
+        name, _, unit = name.partition(':')
+        if unit and unit not in self.TRUNCATIONS:
+            raise ValueError('Unknown time unit: ' + unit)
+        return name, self.TRUNCATIONS.get(unit)
+
+    def _check(self, log_formats):
+        names = '/'.join(log_format.name for log_format in log_formats)
+        for name, _ in self._group_by:
+            if not any(name in log_format.fields for log_format in log_formats):
+                raise ValueError('Unknown field in %s logs: %s' % (names, name))
+        for name in self._fields:
+            if not any(name in log_format.numeric for log_format in log_formats):
+                raise ValueError('Not a numeric field in %s logs: %s' % (names, name))
+
+    def _stat_names(self):
+        return ['mean', 'max'] + ['p%s' % p for p in self._percentiles]
+
+    def _labels(self, batch):
+        '''Get the group of each record in a batch, as a tuple of text values.'''
+        columns = []
+        for name, truncation in self._group_by:
+            column = batch.columns.get(name)
+            if column is None:
+                column = ['-'] * len(batch)
+            elif name in batch.log_format.numeric:
+                column = [_label(v) for v in column]
+            elif truncation:
+                column = [truncation.sub(r'\1', v or '-') for v in column]
+            else:
+                column = ['-' if v is None else v for v in column]
+            columns.append(column)
+        if not columns:
+            return [()] * len(batch)
+        return list(zip(*columns))
+
+    def _add(self, batch, labels):
+        for label in labels:
+            self._counts[label] += 1
+        for field in self._numeric_fields(batch):
+            chunks = {}
+            for label, value in zip(labels, batch[field]):
+                if value == value: # skip NaN
+                    chunk = chunks.get(label)
+                    if chunk is None:
+                        chunk = chunks[label] = array('d')
+                    chunk.append(value)
+            for label, chunk in chunks.items():
+                self._values[label][field].append(chunk)
+
+    def _add_vectorized(self, batch, labels):
+        unique, inverse = numpy.unique(numpy.array(['\x00'.join(l) for l in labels]),
+                                       return_inverse=True)
+        counts = numpy.bincount(inverse)
+        order = numpy.argsort(inverse, kind='stable')
+        firsts = numpy.searchsorted(inverse[order], numpy.arange(len(unique)))
+        group_labels = [labels[order[first]] for first in firsts]
+        for label, count in zip(group_labels, counts):
+            self._counts[label] += int(count)
+        for field in self._numeric_fields(batch):
+            values = numpy.asarray(batch[field], dtype=numpy.float64)[order]
+            for label, chunk in zip(group_labels, numpy.split(values, firsts[1:])):
+                chunk = chunk[~numpy.isnan(chunk)]
+                if len(chunk):
+                    self._values[label][field].append(chunk)
+
+    def _numeric_fields(self, batch):
+        return [field for field in self._fields if field in batch.log_format.numeric]
+
+    def _summarize(self, chunks):
+        if numpy:
+            values = numpy.concatenate(chunks) if chunks else numpy.empty(0)
+            if not len(values):
+                return [None] * len(self._stat_names())
+            return [float(values.mean()), float(values.max())] + \
+                [float(p) for p in numpy.percentile(values, self._percentiles)]
+        values = sorted(v for chunk in chunks for v in chunk)
+        if not values:
+            return [None] * len(self._stat_names())
+        return [math.fsum(values) / len(values), values[-1]] + \
+            [_percentile(values, p) for p in self._percentiles]
+
+######################################################################
+# private
+
+_NAN = float('nan')
+
+def _label(value):
+    '''Get the text of a numeric value (as logged) for use in a group label.'''
+    if value != value:
+        return '-'
+    if value == int(value):
+        return '%d' % value
+    return repr(value)
+
+def _percentile(values, percent):
+    '''Get the linearly interpolated percentile of sorted values (as NumPy does by default).'''
+    position = (len(values) - 1) * percent / 100.0
+    low = int(math.floor(position))
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
@@ -0,0 +1,133 @@
+from __future__ import division
+from builtins import object
+
+import time
+import logging
+
+from collections import defaultdict
+from threading import Thread, Event, Lock
+
+_logger = logging.getLogger(__name__)
+
+class RunStats(object):
+    '''Collects counters and timers describing where the time of a run goes.
+
+    Values are named by phase and measure (e.g. ``fetch_bytes`` and ``fetch_seconds``). Counters are
+    added to from any thread, so they are updated under a lock: callers should add to them once per
+    chunk or key, never once per line. The values collected include:
+
+    * ``keys_listed``, ``list_wait_seconds``: keys found and time spent waiting for the listing
+    * ``keys_read``, ``keys_cached``, ``keys_skipped``: keys read (and found in cache) or skipped
+    * ``fetch_bytes``, ``fetch_seconds``: bytes requested from S3 and time spent reading them
+    * ``fetch_retries``, ``fetch_backoff_seconds``: throttled fetches retried and time spent waiting
+    * ``cache_bytes``: bytes of cached files read in place of requesting them from S3
+    * ``decompress_bytes``, ``decompress_seconds``: bytes decompressed and time spent doing so
+    * ``cache_write_stalls``, ``cache_write_stall_seconds``: waits for cache writes to catch up
+    * ``lines_read``, ``lines_emitted``, ``read_seconds``: lines split out, lines handled, and the
+      time spent reading keys overall (including all of the above)
+    * ``lines_unparsed``: lines skipped as not in the log format (when parsing records)
+    * ``output_bytes``, ``output_seconds``: bytes written as output and time spent writing them
+    * ``merge_max_open_keys``: the most keys read at once when merging
+    '''
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = Lock()
+        self._values = defaultdict(int)
+
+    def count(self, name, amount=1):
+        '''Add an `amount` (of a count, bytes, or seconds) to a value.'''
+        with self._lock:
+            self._values[name] += amount
+
+    def peak(self, name, value):
+        '''Keep the largest `value` seen.'''
+        with self._lock:
+            if value > self._values[name]:
+                self._values[name] = value
+
+    def timed(self, reader, phase):
+        '''Wrap a `reader`, counting the bytes read and the time taken as the named `phase`.'''
+        return self._Timed(self, reader, phase)
+
+    def to_dict(self):
+        '''Get all the values collected, along with the ``elapsed_seconds`` so far.'''
+        with self._lock:
+            values = dict(self._values)
+        values['elapsed_seconds'] = time.time() - self.started
+        return values
+
+    def summary(self):
+        '''Get a line describing each value, including the rate of each phase's bytes.'''
+        values = self.to_dict()
+        lines = []
+        for name in sorted(values):
+            lines.append('%s: %s' % (name, _format(values[name])))
+            if name.endswith('_bytes'):
+                seconds = values.get(name[:-len('bytes')] + 'seconds')
+                if seconds:
+                    lines.append('%smb_per_sec: %.2f' %
+                                 (name[:-len('bytes')], values[name] / seconds / 1e6))
+        return lines
+
+    def progress(self):
+        '''Get a brief line describing the progress of the run so far.'''
+        values = self.to_dict()
+        elapsed = values['elapsed_seconds'] or 1
+        return ('%d keys read (%d cached), %.1f MB fetched, %d lines (%d/sec) in %d seconds' % (
+            values.get('keys_read', 0), values.get('keys_cached', 0),
+            values.get('fetch_bytes', 0) / 1e6, values.get('lines_read', 0),
+            values.get('lines_read', 0) / elapsed, elapsed))
+
+    ######################################################################
+    # private
+
+    class _Timed(object):
+        def __init__(self, stats, reader, phase):
+            self.name = getattr(reader, 'name', None)
+            self._stats = stats
+            self._reader = reader
+            self._bytes = phase + '_bytes'
+            self._seconds = phase + '_seconds'
+
+        def open(self, *args, **kwargs):
+            return self._reader.open(*args, **kwargs)
+
+        def read(self, size=-1):
+            started = time.time()
+            data = self._reader.read(size)
+            self._stats.count(self._seconds, time.time() - started)
+            self._stats.count(self._bytes, len(data))
+            return data
+
+        def close(self):
+            self._reader.close()
+
+class Progress(Thread):
+    '''Reports the progress of a run periodically, in the background.
+
+    :param stats: the :class:`RunStats` of the run
+    :param interval: the number of seconds between reports
+    :param report: a function called with each progress line (logs them by default)
+    '''
+
+    def __init__(self, stats, interval, report=None):
+        super(Progress, self).__init__(name='progress')
+        self.daemon = True
+        self._stats = stats
+        self._interval = interval
+        self._report = report or _logger.info
+        self._stopped = Event()
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self._report(self._stats.progress())
+
+    def stop(self):
+        self._stopped.set()
+
+######################################################################
+# private
+
+def _format(value):
+    return '%.3f' % value if isinstance(value, float) else str(value)
@@ -5,16 +5,26 @@ from builtins import range
 from builtins import object
 
 import os
+import time
 import logging
 
+from functools import partial
+from tempfile import TemporaryFile
+
 from boto import connect_s3
 from boto.s3 import connect_to_region
 
 from .cache import Cache
-
-# TODO: consider ability to search concurrently in cases where the timing isn't important (i.e. i'm
-# just looking for matches, don't care about relative times). this would be faster to get w/
-# multiple threads
+from .follower import Follower, S3EventQueue
+from .line_reader import LineReader
+from .lister import Lister, KeyQueue
+from .log_parser import FORMATS, LogParser
+from .merger import Merger, ordered_keys, stem_listings
+from .prefetcher import Prefetcher
+from .record_batch import Batcher
+from .run_stats import RunStats
+from .searcher import Searcher
+from .time_range import TimeRange
 
 _logger = logging.getLogger(__name__)
 
@@ -25,16 +35,69 @@ class S3Tail(object):
     of downloading files from S3 (or, opening them from the local file system cache) and invoking
     the provided `line_handler` to allow the caller to process each line in the file.
 
+    As it runs, the tail collects counters and timers for each phase (listing, fetching, reading
+    from the cache, decompressing, and splitting lines) in :attr:`stats`, a
+    :class:`.run_stats.RunStats` (only the phases run in this process are included when using
+    `jobs`).
+
     :param config: the configuration wrapper for saving bookmarks
     :param bucket_name: the name of the S3 bucket from which files will be downloaded
     :param prefix: what objects in the S3 bucket should be matched
     :param line_handler: a function that will expect to be called for each line found in the
            downloaded files
-    :param key_handler: a function that will expect to be called for each file
+    :param key_handler: a function called with the name of each key listed (along with its cache
+           pathname and whether it is cached), returning a "truthy" value for keys to be read
     :param bookmark: a location or name for where to pick up from a previous run
     :param region: a region to use when connection to the S3 bucket
     :param cache_path: the path for where the cache should live (None will disable caching)
     :param hours: the number of hours to keep files in the cache (0 will disable caching)
+    :param cache_compress: store files in the cache compressed, decompressing them when read
+    :param cache_max_bytes: the most bytes to keep in the cache, removing the least recently used
+           files first (0 will not limit the size)
+    :param cache_checkpoint_bytes: when storing files compressed, record a checkpoint every number
+           of bytes where reading can begin without decompressing what comes before (0 will not)
+    :param decompress_threads: the number of threads used to decompress the members (or checkpointed
+           segments) of gzip files read from the cache concurrently (0 will use only one)
+    :param prefetch: the number of upcoming keys to download in the background while the current
+           key is processed (0 will disable prefetching)
+    :param jobs: the number of worker processes used to search keys concurrently, without regard
+           to their order (0 will process keys in order)
+    :param line_filter: a function called with each line, returning a "truthy" value for lines that
+           should be passed to the `line_handler` (must be picklable when using `jobs`)
+    :param pattern: a :class:`.line_reader.FixedString` or :class:`.line_reader.Regex` searched for
+           in each chunk read, where only lines that match are split out and handled
+    :param since: only read keys named with a time at or after this UTC ``datetime``
+    :param until: only read keys named with a time before this UTC ``datetime``
+    :param follow: after reading all the keys, keep watching for new keys to read
+    :param idle_handler: a function called each time following has read all the keys found so far
+           and is about to wait for more (e.g. to flush buffered output); when searching with
+           `jobs`, it is called whenever the workers have found nothing for a while instead
+    :param start_handler: a function called with the name of each key as reading it begins (the
+           `key_handler` is consulted well before when keys are fetched ahead)
+    :param follow_queue: an SQS queue (or a stand-in with the same methods) receiving S3 event
+           notifications for the bucket, used to find new keys in place of listing when following
+    :param list_threads: the number of list calls made concurrently, splitting the keys by their
+           sub-prefixes (listing always runs in the background, ahead of the keys being read)
+    :param log_format: a :class:`.log_parser.LogFormat` (or a list of them to detect from) used to
+           parse each line, passing the resulting record to the `line_handler` in place of the line
+           (lines that do not parse are skipped)
+    :param batch_size: when parsing with a `log_format`, collect this many records into each
+           :class:`.record_batch.RecordBatch` passed to the `line_handler` in place of the records
+           (0 will pass each record)
+    :param chunk_handler: a function called with the number of the last line and the bytes of each
+           run of whole lines read (newlines included), used in place of the `line_handler` when
+           lines are not filtered, searched, or parsed
+    :param async_fetch: fetch the `prefetch` keys ahead from an asyncio event loop, retrying
+           requests throttled by S3 with backoff (see :class:`.async_fetcher.AsyncFetcher`),
+           allowing hundreds of keys to be prefetched at once (requires Python 3.7)
+    :param merge: read the keys of the `prefix` (and of any `sources`) together, merging their lines
+           into a single stream ordered by the time of each line (see :class:`.merger.Merger`)
+    :param sources: a list of ``(bucket_name, prefix)`` tuples of other keys to read along with
+           those of the `prefix` when merging
+    :param merge_window: a ``timedelta`` of how far back from the time in its name a key may hold
+           lines when merging (see :attr:`.merger.Merger.WINDOW`)
+    :param connection: an S3 connection (or a stand-in with a ``get_bucket`` method) to use in place
+           of connecting to the `region` (not used by the worker processes of `jobs`)
     '''
 
     BUFFER_SIZE = 1 * (1024*1024) # MiB
@@ -48,9 +111,19 @@ class S3Tail(object):
         pass
 
     def __init__(self, config, bucket_name, prefix, line_handler,
-                 key_handler=None, bookmark=None, region=None, cache_path=None, hours=24):
+                 key_handler=None, bookmark=None, region=None, cache_path=None, hours=24,
+                 cache_compress=False, cache_max_bytes=0, cache_checkpoint_bytes=0,
+                 decompress_threads=0, prefetch=0, jobs=0, line_filter=None, pattern=None,
+                 since=None, until=None, follow=False, idle_handler=None, start_handler=None,
+                 follow_queue=None, list_threads=1, log_format=None, batch_size=0,
+                 chunk_handler=None, async_fetch=False, merge=False, sources=None,
+                 merge_window=Merger.WINDOW, connection=None):
         self._config = config
-        if region:
+        self._bucket_name = bucket_name
+        self._region = region
+        if connection:
+            self._conn = connection
+        elif region:
             self._conn = connect_to_region(region)
         else:
             self._conn = connect_s3()
@@ -60,9 +133,45 @@ class S3Tail(object):
         self._key_handler = key_handler or (lambda k,c,e: True)
         self._set_bookmark(bookmark)
         self._marker = None
-        self._buffer = None
         self._line_num = None
-        self._cache = Cache(cache_path, hours)
+        self._lines = None
+        self._cache_path = cache_path
+        self._hours = hours
+        self._cache_options = dict(compress=cache_compress, max_bytes=cache_max_bytes,
+                                   checkpoint_bytes=cache_checkpoint_bytes,
+                                   decompress_threads=decompress_threads)
+        self.stats = RunStats()
+        self._cache = Cache(cache_path, hours, stats=self.stats, **self._cache_options)
+        self._prefetch = prefetch
+        self._async_fetch = async_fetch
+        self._jobs = jobs
+        self._line_filter = line_filter
+        self._pattern = pattern
+        self._time_range = TimeRange(since, until) if since or until else None
+        self._follow = follow
+        self._idle_handler = idle_handler
+        self._start_handler = start_handler or (lambda key_name: None)
+        self._follow_queue = follow_queue
+        self._follower = None
+        self._list_threads = list_threads
+        self._log_format = log_format
+        self._parser = LogParser(log_format) if log_format else None
+        self._chunk_handler = None
+        if not (line_filter or pattern or log_format):
+            self._chunk_handler = chunk_handler
+        self._merge = merge
+        self._sources = sources or []
+        self._merge_window = merge_window
+        if merge and (jobs > 0 or follow):
+            raise ValueError('Merging is not supported along with jobs or following')
+        if self._sources and not merge:
+            raise ValueError('Other sources are only read when merging')
+        self._batcher = None
+        if batch_size > 0:
+            if not self._parser:
+                raise ValueError('Batches require a log format to parse records')
+            self._batcher = Batcher(line_handler, batch_size)
+            self._line_handler = self._batcher
 
     def watch(self):
         '''Begin watching and reporting lines read from S3.
@@ -70,36 +179,64 @@ class S3Tail(object):
         This call will not return until all the files are read and processed or until a callback
         indicates the need to terminate processing early.
 
-        Before reading each file, the optional `key_handler` provided when created will be invoked
-        with the name of the S3 key. If the `key_handler` returns a "falsey" value the key will be
-        skipped and the tail will move on to the next key.
+        As each file is listed (before it is fetched ahead or read), the optional `key_handler`
+        provided when created will be invoked with the name of the S3 key. If the `key_handler`
+        returns a "falsey" value the key will be skipped and the tail will move on to the next key.
+        The optional `start_handler` is invoked with the name once reading the key begins.
 
         For every line parsed from the files found in S3, the `line_handler` provided when created
         will be invoked passing along the line number and line to the callback. If the
         `line_handler` returns a result (i.e. if it is not ``None``), processessing is terminated
         and the result will be returned from the call to `watch`.
+
+        When created with a `prefetch` count, that many upcoming keys are downloaded in the
+        background while the current key is processed. Keys are still handled strictly in order.
+        Downloads are kept on disk (in the cache, or in a temporary file without one) rather than
+        in memory, so the count may be high without holding that many keys in memory.
+
+        When created with a `jobs` count, keys are instead searched concurrently by that many
+        worker processes and lines are reported as each key completes, regardless of order. Since
+        the line number alone is then ambiguous, the `line_handler` is passed a ``key:line``
+        string naming the key holding the line in its place. This is not a bookmark (which names
+        the key listed before the one to pick up from), and the tail's own bookmark is not advanced
+        in this mode.
+
+        When created to `follow`, the call does not return after reading all the keys but instead
+        keeps looking for new keys after the last one found (see :class:`.follower.Follower`) until
+        stopped.
+
+        When created to `merge`, keys from the `prefix` and any other `sources` are opened as the
+        merge reaches them and their lines are reported in order of the time parsed from each line.
+        As with `jobs`, the `line_handler` is passed a ``key:line`` string naming the key holding
+        the line in place of the line number (bookmarks are neither used nor advanced in this mode).
+
+        When created with a `batch_size`, the `line_handler` is invoked with each batch of records
+        (passing the line number of the last record collected) and any partial batch is handled
+        before returning.
         '''
-        self._stopped = False
-        for key in self._bucket.list(prefix=self._prefix, marker=self._bookmark_key):
-            if self._stopped:
-                break
-            self._bookmark_key = None
-            cache_pn, cached = self._cache.lookup(key.name)
-            result = self._key_handler(key.name, cache_pn, cached)
-            if not result:
-                continue
-            result = self._read(key)
-            if result is not None:
-                return result
-            self._marker = key.name # marker always has to be _previous_ entry, not current
-            self._line_num = 0
+        result = self._watch()
+        if self._batcher:
+            flushed = self._batcher.flush()
+            if result is None:
+                result = flushed
+        return result
 
     def get_bookmark(self):
-        '''Get a bookmark to represent the current location.'''
+        '''Get a bookmark to represent the current location.
+
+        Bookmarks look like ``key:line@offset`` where the `key` is the one listed before the key
+        being read (the marker to list from) and the `offset` is the number of bytes into the file
+        where the line starts, allowing a later run to jump straight to it.
+        '''
         if self._marker:
-            return self._marker + ':' + str(self._line_num)
-        if self._line_num:
-            return ':' + str(self._line_num)
+            bookmark = self._marker + ':' + str(self._line_num)
+        elif self._line_num:
+            bookmark = ':' + str(self._line_num)
+        else:
+            return None
+        if self._line_num and self._lines and self._lines.offset:
+            bookmark += '@' + str(self._lines.offset)
+        return bookmark
 
     def stop(self, *args):
         '''Request that a running watch should terminate processing at the next earliest convenience.
@@ -111,6 +248,8 @@ class S3Tail(object):
             signal.signal(signal.SIGPIPE, tail.stop)
         '''
         self._stopped = True
+        if self._follower:
+            self._follower.stop()
 
     def cleanup(self):
         '''Wait on any threads remaining and cleanup any unflushed state or configuration.'''
@@ -120,19 +259,48 @@ class S3Tail(object):
     ######################################################################
     # private
 
+    def _watch(self):
+        self._stopped = False
+        if self._follow:
+            notifications = None
+            if self._follow_queue:
+                notifications = S3EventQueue(self._follow_queue, self._bucket, self._prefix)
+            self._follower = Follower(self._list_keys, self._bookmark_key,
+                                      notifications=notifications)
+        if self._jobs > 0:
+            return self._search()
+        if self._merge:
+            return self._merge_keys()
+        if self._follower:
+            passes = self._follower.passes()
+        else:
+            passes = [self._list_keys(self._bookmark_key)]
+        for keys in passes:
+            result = self._watch_keys(keys)
+            if result is None and self._follower:
+                # don't hold records (or output) while waiting for new keys
+                if self._batcher:
+                    result = self._batcher.flush()
+                if self._idle_handler:
+                    self._idle_handler()
+            if result is not None or self._stopped:
+                return result
+
     def _set_bookmark(self, bookmark):
         self._bookmark_name = None
         self._bookmark_key = None
         self._bookmark_line_num = 0
+        self._bookmark_offset = 0
         if not bookmark:
             return
         if ':' in bookmark:
-            # an explicit key:line bookmark
-            self._bookmark_key, self._bookmark_line_num = bookmark.split(':')
+            # an explicit key:line bookmark (optionally including the line's byte offset)
+            self._bookmark_key, location = bookmark.rsplit(':', 1)
             if len(self._bookmark_key) == 0:
                 self._bookmark_key = None
-            else:
-                self._bookmark_line_num = int(self._bookmark_line_num)
+            line_num, _, offset = location.partition('@')
+            self._bookmark_line_num = int(line_num)
+            self._bookmark_offset = int(offset or 0)
         else:
             # a named bookmark
             self._lookup_bookmark_name(bookmark)
@@ -160,57 +328,267 @@ class S3Tail(object):
         self._config.save()
         _logger.debug('Saved %s bookmark: %s', self._bookmark_name, bookmark)
 
-    def _read(self, key):
-        reader = self._open_reader(key)
-        while not reader.closed:
+    def _watch_keys(self, keys):
+        # (the key handler is consulted first, so skipped keys are never fetched)
+        keys = self._prefetched(self._wanted(self._listed(keys)),
+                                lambda wanted: self._fetch(*wanted))
+        try:
+            for (key, cached), prefetched in keys:
+                if self._stopped:
+                    break
+                self._bookmark_key = None
+                self._start_handler(key.name)
+                self.stats.count('keys_read')
+                if cached and prefetched is None: # (a prefetched key may have just been cached)
+                    self.stats.count('keys_cached')
+                result = self._read(key, prefetched, cached)
+                if result is not None:
+                    return result
+                self._marker = key.name # marker always has to be _previous_ entry, not current
+                self._line_num = 0
+        finally:
+            if hasattr(keys, 'stop'):
+                keys.stop()
+
+    def _read(self, key, prefetched=None, cached=None):
+        started = time.time()
+        self._line_num = 0
+        lines = self._lines = self._open_lines(key, prefetched, cached)
+        self._bookmark_line_num = 0
+        self._bookmark_offset = 0
+        first_line_num = lines.line_num
+        try:
+            if self._chunk_handler:
+                return self._read_chunks(lines)
+            return self._read_lines(lines)
+        finally:
+            self.stats.count('lines_read', lines.line_num - first_line_num)
+            self.stats.count('read_seconds', time.time() - started)
+
+    def _read_lines(self, lines):
+        emitted = 0
+        unparsed = 0
+        try:
+            for self._line_num, line in lines:
+                if self._stopped:
+                    return self.stop
+                if self._line_filter and not self._line_filter(line):
+                    continue
+                if self._parser:
+                    line = self._parser.parse(line)
+                    if line is None:
+                        unparsed += 1
+                        continue
+                emitted += 1
+                result = self._line_handler(self._line_num, line)
+                if result is not None:
+                    return result
+        finally:
+            self.stats.count('lines_emitted', emitted)
+            if unparsed:
+                self.stats.count('lines_unparsed', unparsed)
+        self._line_num = lines.line_num
+        self._lines = None
+
+    def _read_chunks(self, lines):
+        first_line_num = lines.line_num
+        try:
+            for self._line_num, data in lines.chunks():
+                if self._stopped:
+                    return self.stop
+                result = self._chunk_handler(self._line_num, data)
+                if result is not None:
+                    return result
+        finally:
+            self.stats.count('lines_emitted', lines.line_num - first_line_num)
+        self._line_num = lines.line_num
+        self._lines = None
+
+    def _open_lines(self, key, prefetched, cached):
+        if self._bookmark_line_num > 0 and self._bookmark_offset > 0:
+            # jump directly to the bookmarked line, if possible
+            if prefetched is not None and hasattr(prefetched, 'seek'):
+                reader = prefetched
+                reader.seek(self._bookmark_offset)
+            else:
+                if prefetched is not None:
+                    prefetched.close() # (stored compressed, so jump in through the cache instead)
+                    prefetched = None
+                reader = self._cache.open_at(key.name, key, self._bookmark_offset, key.etag,
+                                             key.size, key.bucket.name, cached)
+            if reader:
+                return LineReader(reader, self.BUFFER_SIZE, self.MAX_BUFFER_SIZE,
+                                  pattern=self._pattern, line_num=self._bookmark_line_num - 1,
+                                  offset=self._bookmark_offset)
+        reader = self._open_reader(key, cached) if prefetched is None else prefetched
+        return LineReader(reader, self.BUFFER_SIZE, self.MAX_BUFFER_SIZE,
+                          skip=self._bookmark_line_num, pattern=self._pattern)
+
+    def _merge_keys(self):
+        sources = [(self._bucket, self._prefix)]
+        sources += [(self._conn.get_bucket(name), prefix) for name, prefix in self._sources]
+        listings = []
+        for bucket, prefix in sources:
+            # (each stem is listed on its own, as only those keys are listed in time order)
+            stems = stem_listings(partial(self._list_stem, bucket), prefix)
+            listings += [self._listed(keys) for keys in stems]
+        wanted = self._wanted(ordered_keys(listings), lambda entry: entry[1])
+        entries = self._prefetched(wanted, lambda wanted: self._fetch(wanted[0][1], wanted[1]))
+        merger = Merger(((when, (key, cached, prefetched))
+                         for ((when, key), cached), prefetched in entries),
+                        self._open_merged, formats=self._log_format or FORMATS,
+                        window=self._merge_window, line_filter=self._line_filter)
+        emitted = 0
+        unparsed = 0
+        try:
+            for (key, _, _), line_num, line, record in merger:
+                if self._stopped:
+                    return self.stop
+                if self._parser:
+                    if record is None:
+                        unparsed += 1
+                        continue
+                    line = record
+                emitted += 1
+                result = self._line_handler('%s:%d' % (key.name, line_num), line)
+                if result is not None:
+                    return result
+        finally:
+            self.stats.count('lines_emitted', emitted)
+            if unparsed:
+                self.stats.count('lines_unparsed', unparsed)
+            self.stats.peak('merge_max_open_keys', merger.peak_open)
+            if hasattr(entries, 'stop'):
+                entries.stop()
+
+    def _open_merged(self, item):
+        key, cached, prefetched = item
+        self._start_handler(key.name)
+        self.stats.count('keys_read')
+        if cached and prefetched is None:
+            self.stats.count('keys_cached')
+        reader = self._open_reader(key, cached) if prefetched is None else prefetched
+        return self._counted(LineReader(reader, self.BUFFER_SIZE, self.MAX_BUFFER_SIZE,
+                                        pattern=self._pattern))
+
+    def _counted(self, lines):
+        '''Count the lines read once all of them are.'''
+        for line_num, line in lines:
+            yield line_num, line
+        self.stats.count('lines_read', lines.line_num)
+
+    def _search(self):
+        searcher = Searcher(self._bucket_name, self._region, self._cache_path, self._hours,
+                            self._jobs, self.BUFFER_SIZE, self.MAX_BUFFER_SIZE,
+                            line_filter=self._line_filter, pattern=self._pattern,
+                            cache_options=self._cache_options,
+                            # (don't hold output while waiting for new keys)
+                            idle_handler=self._idle_handler if self._follower else None)
+        results = searcher.search(self._search_tasks())
+        emitted = 0
+        unparsed = 0
+        try:
+            for key_name, matches in results:
+                if not matches:
+                    self._start_handler(key_name) # (sent as a worker opens the key)
+                for line_num, line in matches:
+                    if self._stopped:
+                        return self.stop
+                    if self._parser:
+                        line = self._parser.parse(line)
+                        if line is None:
+                            unparsed += 1
+                            continue
+                    emitted += 1
+                    result = self._line_handler('%s:%d' % (key_name, line_num), line)
+                    if result is not None:
+                        return result
+        finally:
+            self.stats.count('lines_emitted', emitted)
+            if unparsed:
+                self.stats.count('lines_unparsed', unparsed)
+            searcher.stop()
+
+    def _search_tasks(self):
+        keys = self._listed(self._follower or self._list_keys(self._bookmark_key))
+        for key in keys:
             if self._stopped:
-                return self.stop
-            line = self._next_line(reader)
-            if not line: # normal closed reader with nothing else in the buffer
-                break
-            self._line_num += 1
-            if self._line_num < self._bookmark_line_num:
-                continue
+                return
+            cache_pn, cached = self._cache.lookup(key.name, key.etag, key.size)
+            if self._key_handler(key.name, cache_pn, cached):
+                self.stats.count('keys_read')
+                yield key.name, key.etag, key.size, self._bookmark_line_num, cached
+            else:
+                self.stats.count('keys_skipped')
             self._bookmark_line_num = 0
-            result = self._line_handler(self._line_num, line)
-            if result is not None:
-                return result
-        self._bookmark_line_num = 0 # safety in case bookmark count was larger than actual lines
 
-    def _open_reader(self, key):
-        self._buffer = ''
-        self._line_num = 0
-        return self._cache.open(key.name, key)
-
-    # TODO: convert this into a wrapper that yields lines!
-    def _next_line(self, reader):
-        newline = self._find_newline_index(reader)
-        if newline:
-            line = self._buffer[0:newline]
-            self._buffer = self._buffer[newline+1:]
-        else:
-            if len(self._buffer) == 0 and reader.closed:
-                return None
-            _logger.warn('Unable to locate newline in %s after line %d', reader.name, self._line_num)
-            line = self._buffer
-            self._buffer = ''
-        return line
-
-    def _find_newline_index(self, reader):
-        i = self._buffer.find("\n")
-        if i > -1:
-            return i
-        while True:
-            buflen = len(self._buffer)
-            if buflen + self.BUFFER_SIZE > self.MAX_BUFFER_SIZE:
-                break
-            more_data = reader.read(self.BUFFER_SIZE)
-            if len(more_data) > 0:
-                self._buffer += more_data
-                i = more_data.find("\n")
-                if i > -1:
-                    return buflen + i
+    def _list_keys(self, marker, bucket=None, prefix=None):
+        bucket = bucket or self._bucket
+        prefix = self._prefix if prefix is None else prefix
+        if self._time_range:
+            # only list the keys named within the time range (see TimeRange for how)
+            return KeyQueue(self._time_range.keys(bucket, prefix, marker), Lister.QUEUE_SIZE)
+        return Lister(bucket, prefix, marker, threads=self._list_threads)
+
+    def _list_stem(self, bucket, prefix, marker):
+        '''List keys as they are iterated, rather than in the background (see stem_listings).'''
+        if self._time_range:
+            return self._time_range.keys(bucket, prefix, marker)
+        return bucket.list(prefix=prefix, marker=marker or '')
+
+    def _wanted(self, entries, key_of=lambda entry: entry):
+        '''Generate ``(entry, cached)`` tuples for the entries of keys the key handler wants.'''
+        for entry in entries:
+            key = key_of(entry)
+            cache_pn, cached = self._cache.lookup(key.name, key.etag, key.size)
+            if self._key_handler(key.name, cache_pn, cached):
+                yield entry, cached
             else:
-                reader.close()
-                break
-        return None
+                self.stats.count('keys_skipped')
+
+    def _listed(self, keys):
+        '''Count the keys listed and the time spent waiting on the listing for each.'''
+        keys = iter(keys)
+        while True:
+            started = time.time()
+            try:
+                key = next(keys)
+            except StopIteration:
+                return
+            self.stats.count('list_wait_seconds', time.time() - started)
+            self.stats.count('keys_listed')
+            yield key
+
+    def _prefetched(self, keys, fetch):
+        '''Generate ``(key, prefetched)`` tuples, fetching upcoming keys when prefetching.'''
+        if self._prefetch > 0 and self._async_fetch:
+            from .async_fetcher import AsyncFetcher # (only available with Python 3.7)
+            return AsyncFetcher(keys, fetch, self._prefetch, stats=self.stats)
+        if self._prefetch > 0:
+            return Prefetcher(keys, fetch, self._prefetch)
+        return ((key, None) for key in keys)
+
+    def _open_reader(self, key, cached=None):
+        return self._cache.open(key.name, key, key.etag, key.size, key.bucket.name, cached)
+
+    def _fetch(self, key, cached):
+        '''Download a key to disk ahead of it being read, returning a reader of the local copy.'''
+        if cached:
+            return None # already local, so there is nothing to gain by reading it early
+        if self._cache.enabled:
+            return self._cache.fetch(key.name, key, key.etag, key.size, key.bucket.name, cached)
+        reader = self._open_reader(key, cached)
+        spooled = TemporaryFile() # (removed as soon as it is closed)
+        try:
+            while True:
+                chunk = reader.read(self.BUFFER_SIZE)
+                if not chunk:
+                    break
+                spooled.write(chunk)
+        except:
+            spooled.close()
+            raise
+        finally:
+            reader.close()
+        spooled.seek(0)
+        return spooled
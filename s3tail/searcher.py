@@ -0,0 +1,177 @@
+from builtins import object
+
+import signal
+import logging
+
+from queue import Empty
+from threading import Thread
+from multiprocessing import Pool, Queue
+
+from boto import connect_s3
+from boto.s3 import connect_to_region
+
+from .cache import Cache
+from .line_reader import LineReader
+
+_logger = logging.getLogger(__name__)
+
+class Searcher(object):
+    '''Searches many keys at once using a pool of worker processes.
+
+    Each worker opens its own connection to the bucket, downloads (or reads from the cache) the keys
+    it is handed, splits them into lines and keeps only those accepted by the `line_filter`. Matches
+    are sent back in chunks through a bounded queue as they are found (so a worker never holds all
+    the matches of a large key, and is held up while the chunks already sent are not reported), so
+    the order of keys is not preserved.
+
+    :param bucket_name: the name of the S3 bucket from which files will be downloaded
+    :param region: a region to use when connection to the S3 bucket
+    :param cache_path: the path for where the cache should live (None will disable caching)
+    :param hours: the number of hours to keep files in the cache (0 will disable caching)
+    :param jobs: the number of worker processes to use
+    :param buffer_size: the number of bytes to read into memory when parsing lines
+    :param max_buffer_size: the maximum amount of buffer to read into memory when parsing lines
+    :param line_filter: a picklable function called with each line, returning a "truthy" value for
+           lines that should be reported (None reports every line)
+    :param pattern: a :class:`.line_reader.FixedString` or :class:`.line_reader.Regex` that lines
+           must match to be reported (checked against whole chunks before lines are split)
+    :param cache_options: any additional keyword arguments for creating each worker's
+           :class:`.cache.Cache`
+    :param idle_handler: a function called whenever nothing was found for :attr:`IDLE_SECONDS`
+           (e.g. to flush buffered output while waiting on keys still to be found)
+    '''
+
+    CHUNK_LINES = 1000
+    '''Describes the most matching lines a worker sends back at once.'''
+
+    QUEUE_SIZE = 64
+    '''Describes the most chunks of matches sent back before workers wait for them to be read.'''
+
+    IDLE_SECONDS = 1
+    '''Describes how long to wait for matches before calling the idle handler.'''
+
+    def __init__(self, bucket_name, region, cache_path, hours, jobs, buffer_size, max_buffer_size,
+                 line_filter=None, pattern=None, cache_options=None, idle_handler=None):
+        self._jobs = jobs
+        self._idle_handler = idle_handler
+        self._init_args = (bucket_name, region, cache_path, hours, buffer_size, max_buffer_size,
+                           line_filter, pattern, cache_options or {})
+        self._pool = None
+        self._queue = None
+        self._completed = 0
+        self._finished = False
+        self._error = None
+
+    def search(self, tasks):
+        '''Search each task, yielding ``(key_name, matches)`` as the matches of any key are found.
+
+        Each task is a ``(key_name, etag, size, skip)`` tuple describing the key (optionally with
+        whether it was found in the cache, so workers need not look it up again). The `matches`
+        are a list of up to :attr:`CHUNK_LINES` ``(line_num, line)`` tuples: those of each key are
+        yielded in the order found in the key (though between those of other keys), beginning with
+        an empty list as the key is opened. Line numbers less than `skip` are not considered.
+        '''
+        self._queue = Queue(self.QUEUE_SIZE)
+        self._pool = Pool(self._jobs, _init_worker,
+                          self._init_args + (self._queue, self.CHUNK_LINES))
+        results = self._pool.imap_unordered(_search_key, tasks)
+        counter = Thread(target=self._count, args=(results,), name='search-results')
+        counter.daemon = True
+        counter.start()
+        done = 0
+        try:
+            while True:
+                try:
+                    key_name, matches = self._queue.get(timeout=self.IDLE_SECONDS)
+                except Empty:
+                    if self._idle_handler:
+                        self._idle_handler()
+                    continue
+                if matches is not None:
+                    yield key_name, matches
+                    continue
+                if key_name is not None:
+                    done += 1
+                elif self._error:
+                    raise self._error
+                if self._finished and done >= self._completed:
+                    break
+            self._pool.close()
+        finally:
+            self.stop()
+
+    def stop(self):
+        '''Abandon any outstanding keys and stop the worker processes.'''
+        if self._pool:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._queue:
+            self._queue.cancel_join_thread() # (nothing is left to read what was put)
+            self._queue = None
+
+    ######################################################################
+    # private
+
+    def _count(self, results):
+        '''Count the keys completed, waking the search once all are (or one has failed).'''
+        try:
+            for _ in results:
+                self._completed += 1
+        except Exception as exc:
+            self._error = exc
+        self._finished = True
+        queue = self._queue
+        if queue:
+            queue.put((None, None))
+
+######################################################################
+# private (run in worker processes)
+
+_worker = None
+
+def _init_worker(*args):
+    global _worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # interrupts are handled by the parent
+    _worker = _Worker(*args)
+
+def _search_key(task):
+    return _worker.search(*task)
+
+class _Worker(object):
+    def __init__(self, bucket_name, region, cache_path, hours, buffer_size, max_buffer_size,
+                 line_filter, pattern, cache_options, queue, chunk_lines):
+        if region:
+            conn = connect_to_region(region)
+        else:
+            conn = connect_s3()
+        self._bucket = conn.get_bucket(bucket_name, validate=False)
+        self._cache = Cache(cache_path, hours, clean=False, # parent owns removing old files
+                            **cache_options)
+        self._buffer_size = buffer_size
+        self._max_buffer_size = max_buffer_size
+        self._line_filter = line_filter
+        self._pattern = pattern
+        self._queue = queue
+        self._chunk_lines = chunk_lines
+
+    def search(self, key_name, etag, size, skip, cached=None):
+        self._queue.put((key_name, [])) # (reading has begun)
+        matches = []
+        for num, line in self._open_lines(key_name, etag, size, skip, cached):
+            if self._line_filter and not self._line_filter(line):
+                continue
+            matches.append((num, line))
+            if len(matches) >= self._chunk_lines:
+                self._queue.put((key_name, matches))
+                matches = []
+        if matches:
+            self._queue.put((key_name, matches))
+        self._cache.cleanup() # finish writing into the cache before reporting this key as done
+        self._queue.put((key_name, None))
+
+    def _open_lines(self, key_name, etag, size, skip, cached):
+        reader = self._cache.open(key_name, self._bucket.new_key(key_name), etag, size,
+                                  self._bucket.name, cached)
+        return LineReader(reader, self._buffer_size, self._max_buffer_size, skip=skip,
+                          pattern=self._pattern)
@@ -0,0 +1,187 @@
+from builtins import object
+
+import re
+import logging
+
+from datetime import datetime, timedelta
+
+_logger = logging.getLogger(__name__)
+
+class KeyLayout(object):
+    '''Describes a key naming scheme that includes when each object was written.
+
+    Keys sharing the same `stem` (everything before the timestamp) are listed by S3 in the order
+    they were written, which allows a listing to jump straight to a point in time using a marker.
+
+    :param name: a short name of the layout used in log messages
+    :param regex: a regular expression matching key names, capturing the `stem` and the timestamp
+           (`ts`), along with the `base` before any daily ``YYYY/MM/DD/`` directories
+    :param ts_format: the ``strftime`` format of the timestamp
+    '''
+
+    DAY_FORMAT = '%Y/%m/%d/'
+    '''Describes the daily directories used by layouts grouping keys by date.'''
+
+    def __init__(self, name, regex, ts_format):
+        self.name = name
+        self.ts_format = ts_format
+        self._regex = re.compile(regex)
+
+    def match(self, key_name):
+        return self._regex.match(key_name)
+
+    def parse(self, match):
+        '''Get the time described by the timestamp in a key `match`.'''
+        return datetime.strptime(match.group('ts'), self.ts_format)
+
+    def format(self, when):
+        return when.strftime(self.ts_format)
+
+    def day_prefixes(self, match, prefix, since, until):
+        '''Get the prefixes of each daily directory from `since` to `until` within `prefix`.
+
+        Returns ``None`` when the layout does not have daily directories, or when `prefix` does not
+        reach the directory holding them (as other such directories might exist beside it), or when
+        it already names a single day.
+        '''
+        base = match.groupdict().get('base')
+        if base is None or not prefix.startswith(base) or \
+           len(prefix) >= len(base) + len(since.strftime(self.DAY_FORMAT)):
+            return None
+        day = datetime(since.year, since.month, since.day)
+        prefixes = []
+        while day < until:
+            day_prefix = base + day.strftime(self.DAY_FORMAT)
+            if day_prefix.startswith(prefix):
+                prefixes.append(day_prefix)
+            day += timedelta(days=1)
+        return prefixes
+
+ELB = KeyLayout('elb', r'(?P<stem>(?P<base>.*/)\d{4}/\d\d/\d\d/'
+                r'[^/]*_elasticloadbalancing_[^/]*_)(?P<ts>\d{8}T\d{4}Z)_', '%Y%m%dT%H%MZ')
+'''Describes ELB (and ALB) access logs, named like:
+``..._elasticloadbalancing_REGION_NAME_YYYYMMDDTHHMMZ_...``'''
+
+CLOUDTRAIL = KeyLayout('cloudtrail', r'(?P<stem>(?P<base>.*/)\d{4}/\d\d/\d\d/'
+                       r'[^/]*_CloudTrail_[^/]*_)(?P<ts>\d{8}T\d{4}Z)_', '%Y%m%dT%H%MZ')
+'''Describes CloudTrail logs: ``..._CloudTrail_REGION_YYYYMMDDTHHMMZ_...``'''
+
+S3_ACCESS = KeyLayout('s3', r'(?P<stem>.*?)(?P<ts>\d{4}-\d\d-\d\d-\d\d-\d\d-\d\d)-[0-9A-Z]+$',
+                      '%Y-%m-%d-%H-%M-%S')
+'''Describes S3 access logs: ``PREFIXYYYY-MM-DD-HH-MM-SS-UNIQUE``'''
+
+LAYOUTS = [ELB, CLOUDTRAIL, S3_ACCESS]
+'''Describes the layouts recognized when listing keys.'''
+
+class TimeRange(object):
+    '''Lists only the keys written within a range of time, based on the timestamps in their names.
+
+    Rather than listing everything under a prefix and skipping keys outside of the range, the
+    listing is narrowed in two ways. For layouts grouping keys into daily directories, only the
+    directories of the days in the range are listed. Then, for each stem of keys found, the listing
+    jumps (using a marker) directly to the first key at or after `since` and jumps past the rest of
+    the stem upon finding a key at or after `until`. Since the layouts describe how a time appears
+    in a key, the marker is computed directly rather than searched for.
+
+    Keys with names not matching any known layout are never skipped.
+
+    :param since: the earliest time (inclusive, in UTC) of keys to list (or ``None``)
+    :param until: the latest time (exclusive, in UTC) of keys to list (or ``None``)
+    :param layouts: the :class:`KeyLayout` objects to recognize
+    '''
+
+    PAST_STEM = '~'
+    '''Describes a suffix sorted after any timestamp, used to skip the rest of a stem's keys.'''
+
+    def __init__(self, since=None, until=None, layouts=LAYOUTS):
+        self.since = since
+        self.until = until
+        self._layouts = layouts
+
+    def keys(self, bucket, prefix, marker=None):
+        '''Generate the keys in the range found in the `bucket` under `prefix` (after `marker`).'''
+        for list_prefix in self._prefixes(bucket, prefix, marker):
+            list_marker = marker if marker and marker > list_prefix else None
+            for key in self._list(bucket, list_prefix, list_marker):
+                yield key
+
+    ######################################################################
+    # private
+
+    def _prefixes(self, bucket, prefix, marker):
+        '''Get the narrowest prefixes to list, based on the layout of the first key.'''
+        if not self.since:
+            return [prefix]
+        first = bucket.get_all_keys(prefix=prefix, marker=marker, max_keys=1)
+        if not first:
+            return [prefix]
+        layout, match = key_layout(first[0].name, self._layouts)
+        if not layout:
+            return [prefix]
+        until = self.until or datetime.utcnow() + timedelta(days=1)
+        prefixes = layout.day_prefixes(match, prefix, self.since, until)
+        if prefixes is None:
+            return [prefix]
+        if marker:
+            prefixes = [p for p in prefixes if marker < p + self.PAST_STEM]
+        _logger.debug('Listing %d daily prefixes of %s keys', len(prefixes), layout.name)
+        return prefixes
+
+    def _list(self, bucket, prefix, marker):
+        while True:
+            for key in bucket.list(prefix=prefix, marker=marker):
+                in_range, jump = self._check(key.name)
+                if jump:
+                    _logger.debug('Skipping from %s to %s', key.name, jump)
+                    marker = jump
+                    break # list again from the new marker
+                marker = key.name
+                if in_range:
+                    yield key
+            else:
+                return
+
+    def _check(self, key_name):
+        '''Report if a key is in range and, when not, a marker past it and the keys like it.'''
+        layout, match = key_layout(key_name, self._layouts)
+        if not layout:
+            return True, None
+        when = layout.parse(match)
+        if self.since and when < self.since:
+            jump = match.group('stem') + layout.format(self.since)
+        elif self.until and when >= self.until:
+            jump = match.group('stem') + self.PAST_STEM
+        else:
+            return True, None
+        return False, jump if jump > key_name else None
+
+def key_layout(key_name, layouts=LAYOUTS):
+    '''Get the layout matching a key name, along with the match (or ``(None, None)`` if none do).'''
+    for layout in layouts:
+        match = layout.match(key_name)
+        if match:
+            return layout, match
+    return None, None
+
+def key_time(key_name, layouts=LAYOUTS):
+    '''Get the time described by the timestamp in a key name (or ``None`` if no layout matches).'''
+    layout, match = key_layout(key_name, layouts)
+    return layout.parse(match) if layout else None
+
+def parse_time(text, now=None):
+    '''Get the UTC time described by `text`.
+
+    Either an absolute time (e.g. ``2016-08-04T10:30:00Z``, ``2016-08-04 10:30`` or ``2016-08-04``)
+    or a time relative to `now` (e.g. ``15m``, ``2h``, or ``1d`` ago) is accepted.
+    '''
+    relative = re.match(r'^(\d+)([smhd])$', text)
+    if relative:
+        unit = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}[relative.group(2)]
+        return (now or datetime.utcnow()) - timedelta(**{unit: int(relative.group(1))})
+    text = text.rstrip('Z').replace('T', ' ')
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Unable to parse time: ' + text)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""
+conftest
+----------------------------------
+
+Fakes of boto's S3 objects shared by the tests.
+"""
+
+import bisect
+import hashlib
+
+from itertools import islice
+
+from boto.s3.prefix import Prefix
+
+
+class FakeKey(object):
+    '''A key holding its `data` in memory, read (optionally from a byte range) like a boto key.'''
+
+    def __init__(self, name, data=b'', bucket=None):
+        self.name = name
+        self.bucket = bucket
+        self.data = data
+        self.size = len(data)
+        self.etag = '"%s"' % hashlib.md5(data).hexdigest()
+        self.opened = 0
+        self._pos = None
+        self._end = None
+
+    def open(self, headers=None):
+        self.opened += 1
+        self._pos = 0
+        self._end = len(self.data)
+        if headers and 'Range' in headers:
+            start, end = headers['Range'][len('bytes='):].split('-')
+            self._pos = int(start)
+            if end:
+                self._end = min(int(end) + 1, self._end)
+
+    def read(self, size=-1):
+        if self._pos is None:
+            self.open()
+        end = self._end if size is None or size < 0 else min(self._pos + size, self._end)
+        data = self.data[self._pos:end]
+        self._pos = max(end, self._pos)
+        return data
+
+    def close(self, fast=False):
+        self._pos = None
+
+
+class FakeBucket(object):
+    '''Lists keys in order (like S3), rolling up those past a delimiter into prefixes.
+
+    Each prefix listed is recorded in :attr:`prefixes` (and each marker passed to :func:`list_keys`
+    in :attr:`markers`), while :attr:`listed` counts the keys returned. Keys are added with
+    :func:`add`, optionally holding data to be read. Pages of keys hold up to :attr:`page_size`.
+    '''
+
+    name = 'my-logs'
+    page_size = 1000
+
+    def __init__(self, names=(), contents=None, name=None):
+        if name:
+            self.name = name
+        self.contents = dict((n, b'') for n in names)
+        self.contents.update(contents or {})
+        self.prefixes = []
+        self.markers = []
+        self.listed = 0
+
+    @property
+    def names(self):
+        return sorted(self.contents)
+
+    def add(self, name, data=b''):
+        self.contents[name] = data
+
+    def list(self, prefix='', delimiter='', marker=''):
+        self.prefixes.append(prefix)
+        names = self.names
+        start = bisect.bisect_right(names, marker) if marker else bisect.bisect_left(names, prefix)
+        last = None
+        for name in names[start:]:
+            if not name.startswith(prefix):
+                if name > prefix:
+                    return # (sorted, so nothing further can match)
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                common = prefix + rest[:rest.index(delimiter) + 1]
+                if common != last:
+                    last = common
+                    yield Prefix(name=common)
+            else:
+                self.listed += 1
+                yield self.new_key(name)
+
+    def list_keys(self, marker):
+        '''List every key after `marker` at once (as a follower's listing function).'''
+        self.markers.append(marker)
+        return list(self.list(marker=marker or ''))
+
+    def get_all_keys(self, prefix='', marker='', delimiter='', max_keys=None):
+        '''Get a page of keys, listing all those in it before any prefixes (as S3 does).'''
+        max_keys = max_keys or self.page_size
+        items = (item for item in self.list(prefix=prefix, delimiter=delimiter, marker=marker)
+                 if item.name != marker) # (a prefix is not listed again after being the marker)
+        items = list(islice(items, max_keys + 1))
+        page = FakePage(item for item in items[:max_keys] if not isinstance(item, Prefix))
+        page += [item for item in items[:max_keys] if isinstance(item, Prefix)]
+        page.is_truncated = len(items) > max_keys
+        page.next_marker = items[max_keys - 1].name if page.is_truncated and delimiter else None
+        return page
+
+    def get_key(self, name):
+        return self.new_key(name) if name in self.contents else None
+
+    def new_key(self, name):
+        return FakeKey(name, self.contents.get(name, b''), self)
+
+
+class FakePage(list):
+    '''Holds a page of listed keys, like boto's result set.'''
+
+    is_truncated = False
+    next_marker = None
+
+
+class FakeConnection(object):
+    '''Connects to :class:`FakeBucket` objects by name.'''
+
+    def __init__(self, *buckets):
+        self.buckets = dict((bucket.name, bucket) for bucket in buckets)
+
+    def get_bucket(self, bucket_name):
+        return self.buckets[bucket_name]
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_async_fetcher
+----------------------------------
+
+Tests for `s3tail.async_fetcher` module.
+"""
+
+import sys
+import time
+import random
+import pytest
+
+from threading import Lock
+
+if sys.version_info < (3, 7):
+    pytest.skip('requires Python 3.7 (for asyncio.all_tasks)', allow_module_level=True)
+
+from s3tail.async_fetcher import AsyncFetcher
+from s3tail.run_stats import RunStats
+
+
+class Throttled(Exception):
+    def __init__(self, status=503, error_code='SlowDown'):
+        super(Throttled, self).__init__('%d %s' % (status, error_code))
+        self.status = status
+        self.error_code = error_code
+
+
+class FlakyFetch(object):
+    '''Refuses the first `failures` attempts to fetch each key.'''
+
+    def __init__(self, failures, error=Throttled):
+        self.attempts = {}
+        self._failures = failures
+        self._error = error
+        self._lock = Lock()
+
+    def __call__(self, key):
+        with self._lock:
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            attempt = self.attempts[key]
+        if attempt <= self._failures:
+            raise self._error()
+        return key * 2
+
+
+class TestAsyncFetcher(object):
+
+    def test_preserves_order(self):
+        def fetch(key):
+            time.sleep(random.random() / 100)
+            return key * 2
+        results = list(AsyncFetcher(range(20), fetch, 4))
+        assert results == [(k, k * 2) for k in range(20)]
+
+    def test_fetch_errors_are_raised_in_order(self):
+        def fetch(key):
+            if key == 3:
+                raise ValueError(key)
+            return key
+        seen = []
+        with pytest.raises(ValueError):
+            for key, _ in AsyncFetcher(range(10), fetch, 2):
+                seen.append(key)
+        assert seen == [0, 1, 2]
+
+    def test_fetches_concurrently(self):
+        def fetch(key):
+            time.sleep(0.05)
+            return key
+        started = time.time()
+        results = list(AsyncFetcher(range(200), fetch, 200))
+        assert [k for k, _ in results] == list(range(200))
+        assert time.time() - started < 200 * 0.05 / 10
+
+    def test_retries_throttled_fetches(self):
+        fetch = FlakyFetch(2)
+        stats = RunStats()
+        results = list(AsyncFetcher(range(5), fetch, 5, backoff=0.001, stats=stats))
+        assert results == [(k, k * 2) for k in range(5)]
+        assert fetch.attempts == dict((k, 3) for k in range(5))
+        assert stats.to_dict()['fetch_retries'] == 10
+
+    def test_gives_up_after_retries(self):
+        fetch = FlakyFetch(10)
+        with pytest.raises(Throttled):
+            list(AsyncFetcher(range(3), fetch, 3, retries=2, backoff=0.001))
+        assert fetch.attempts[0] == 3
+
+    def test_other_errors_are_not_retried(self):
+        fetch = FlakyFetch(1, error=lambda: Throttled(403, 'AccessDenied'))
+        with pytest.raises(Throttled):
+            list(AsyncFetcher(range(3), fetch, 3, backoff=0.001))
+        assert fetch.attempts[0] == 1
+
+    def test_throttled(self):
+        assert AsyncFetcher.throttled(Throttled(503, 'SlowDown'))
+        assert AsyncFetcher.throttled(Throttled(500, 'InternalError'))
+        assert not AsyncFetcher.throttled(Throttled(404, 'NoSuchKey'))
+        assert not AsyncFetcher.throttled(ValueError())
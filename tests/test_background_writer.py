@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_background_writer
+----------------------------------
+
+Tests for `s3tail.background_writer` module.
+"""
+
+import time
+import pytest
+
+from io import BytesIO
+
+from s3tail.background_writer import BackgroundWriter
+
+
+class SlowWriter(BytesIO):
+    name = 'slow'
+
+    def __init__(self):
+        super(SlowWriter, self).__init__()
+        self.sizes = []
+
+    def write(self, data):
+        time.sleep(0.001)
+        self.sizes.append(len(data))
+        return super(SlowWriter, self).write(data)
+
+
+class FullWriter(SlowWriter):
+    def write(self, data):
+        raise IOError('No space left on device')
+
+
+class TestBackgroundWriter(object):
+
+    def test_queue_is_bounded_by_high_water(self):
+        sink = SlowWriter()
+        writer = BackgroundWriter(sink, high_water=64, coalesce_size=0)
+        writer.start()
+        for i in range(100):
+            writer.write(b'x' * 16)
+        writer.join()
+        assert sink.getvalue() == b'x' * 1600
+        assert writer.max_queued_bytes <= 64 + 16
+        assert writer.stalls > 0
+
+    def test_small_chunks_are_coalesced(self):
+        sink = SlowWriter()
+        writer = BackgroundWriter(sink, high_water=1024, coalesce_size=40)
+        writer.start()
+        data = [(b'%02d' % i) * 5 for i in range(50)]
+        for chunk in data:
+            writer.write(chunk)
+        writer.join()
+        assert sink.getvalue() == b''.join(data)
+        assert max(sink.sizes) <= 40
+        assert writer.writes == len(sink.sizes) < len(data)
+
+    def test_done_callback_and_write_after_done(self):
+        done = []
+        writer = BackgroundWriter(SlowWriter(), done.append)
+        writer.start()
+        writer.write(b'abc')
+        writer.join()
+        assert done[0].getvalue() == b'abc'
+        with pytest.raises(BackgroundWriter.WriteAfterDone):
+            writer.write(b'more')
+
+    def test_write_errors_are_raised(self):
+        done = []
+        writer = BackgroundWriter(FullWriter(), done.append, high_water=64)
+        writer.start()
+        with pytest.raises(IOError):
+            for i in range(100):
+                writer.write(b'x' * 16)
+        with pytest.raises(IOError):
+            writer.join()
+        assert done and writer.error
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cache
+----------------------------------
+
+Tests for `s3tail.cache` module.
+"""
+
+import os
+import bz2
+import time
+import gzip
+import lzma
+import sqlite3
+import binascii
+import threading
+
+import pytest
+
+from io import BytesIO
+
+from s3tail import compression
+from s3tail import cache as cache_module
+from s3tail.background_writer import BackgroundWriter
+from s3tail.cache import Cache
+from s3tail.cache_index import CacheIndex
+from s3tail.gzip_index import GzipIndex
+
+
+class FakeKey(BytesIO):
+    def __init__(self, name, data):
+        super(FakeKey, self).__init__(data)
+        self.name = name
+        self.ranges = []
+        self._end = None
+
+    def open(self, headers=None):
+        self.seek(0)
+        self._end = None
+        if headers and 'Range' in headers:
+            self.ranges.append(headers['Range'])
+            start, end = headers['Range'][len('bytes='):].split('-')
+            self.seek(int(start))
+            self._end = int(end) + 1 if end else None
+
+    def read(self, size=-1):
+        if self._end is not None:
+            remaining = max(self._end - self.tell(), 0)
+            size = remaining if size < 0 else min(size, remaining)
+        return super(FakeKey, self).read(size)
+
+    def close(self):
+        pass # like a boto key, it may be opened again
+
+
+def read_all(reader):
+    data = b''
+    while True:
+        chunk = reader.read(7)
+        if not chunk:
+            break
+        data += chunk
+    reader.close()
+    return data
+
+
+LOG = b''.join(b'line %d of a very repetitive log\n' % i for i in range(500))
+NOISE = b''.join(b'%s\n' % binascii.hexlify(os.urandom(32)) for _ in range(500))
+
+
+class TestCache(object):
+
+    def test_stores_decompressed_by_default(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        assert read_all(cache.open('a.gz', FakeKey('a.gz', gzip.compress(LOG)))) == LOG
+        cache.cleanup()
+        cache_pn, cached = cache.lookup('a.gz')
+        assert cached
+        assert open(cache_pn, 'rb').read() == LOG
+
+    def test_compressed_keys_are_stored_as_is(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1, compress=True)
+        raw = gzip.compress(LOG)
+        assert read_all(cache.open('a.gz', FakeKey('a.gz', raw))) == LOG
+        cache.cleanup()
+        cache_pn, _ = cache.lookup('a.gz')
+        assert open(cache_pn, 'rb').read() == raw
+        assert read_all(cache.open('a.gz', None)) == LOG
+
+    def test_plain_keys_are_compressed(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1, compress=True)
+        assert read_all(cache.open('a.log', FakeKey('a.log', LOG))) == LOG
+        cache.cleanup()
+        cache_pn, _ = cache.lookup('a.log')
+        stored = open(cache_pn, 'rb').read()
+        assert len(stored) < len(LOG) / 5
+        assert gzip.decompress(stored) == LOG
+        assert read_all(cache.open('a.log', None)) == LOG
+
+    def test_least_recently_used_are_evicted(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1, max_bytes=len(LOG) * 2)
+        for name in ('a.log', 'b.log'):
+            read_all(cache.open(name, FakeKey(name, LOG)))
+            cache.cleanup()
+        read_all(cache.open('a.log', None)) # now b.log is the least recently used
+        read_all(cache.open('c.log', FakeKey('c.log', LOG)))
+        cache.cleanup()
+        assert [cache.lookup(n)[1] for n in ('a.log', 'b.log', 'c.log')] == [True, False, True]
+
+    def test_files_cached_by_an_older_version_are_removed(self, tmpdir):
+        path = str(tmpdir.join('cache'))
+        cache = Cache(path, 1)
+        for name in ('a.log', 'b.log'):
+            read_all(cache.open(name, FakeKey(name, LOG)))
+        cache.cleanup()
+        cache_pn = cache.lookup('a.log')[0]
+        db = sqlite3.connect(os.path.join(path, CacheIndex.FILENAME))
+        db.execute('PRAGMA user_version = 0')
+        db.close()
+        cache = Cache(path, 1, clean=False)
+        assert not cache.lookup('a.log')[1]
+        assert not os.path.exists(cache_pn)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG)))
+        cache.cleanup()
+        cache = Cache(path, 1, clean=False)
+        assert cache.lookup('a.log')[1] # (only removed once)
+        cache.cleanup()
+
+    def test_files_are_addressed_by_how_they_are_stored(self, tmpdir):
+        path = str(tmpdir.join('cache'))
+        cache = Cache(path, 1)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG), '"abc"', len(LOG)))
+        cache.cleanup()
+        for options in ({'compress': True}, {'compress': True, 'checkpoint_bytes': 1024}):
+            cache = Cache(path, 1, clean=False, **options)
+            assert not cache.lookup('a.log', '"abc"', len(LOG))[1]
+            read_all(cache.open('a.log', FakeKey('a.log', LOG), '"abc"', len(LOG)))
+            cache.cleanup()
+            assert cache.lookup('a.log', '"abc"', len(LOG))[1]
+        assert Cache(path, 1, clean=False).lookup('a.log', '"abc"', len(LOG))[1]
+
+    def test_lookup_uses_index(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG)))
+        cache.cleanup()
+        cache_pn, cached = cache.lookup('a.log')
+        assert cached
+        os.remove(cache_pn)
+        assert cache.lookup('a.log')[1] # not checked on disk until opened
+        assert read_all(cache.open('a.log', FakeKey('a.log', LOG))) == LOG
+        cache.cleanup()
+        assert os.path.exists(cache_pn)
+
+    def test_old_files_expire_without_walking(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG)))
+        cache.cleanup()
+        cache_pn, _ = cache.lookup('a.log')
+        index = CacheIndex(cache.path)
+        assert index.expire(1) == 0
+        remove = index._remove
+        def unlocked_remove(pathname):
+            assert not index._lock.locked() # (others need not wait on the file system)
+            remove(pathname)
+        index._remove = unlocked_remove
+        assert index.expire(0) == 1
+        assert not os.path.exists(cache_pn)
+        assert not cache.lookup('a.log')[1]
+
+    def test_files_used_are_recorded_together(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(CacheIndex, 'TOUCH_BATCH', 3)
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG)))
+        cache.cleanup()
+        cache_pn, cached = cache.lookup('a.log')
+        index = CacheIndex(cache.path)
+        accessed = lambda: sqlite3.connect(index.pathname).execute(
+            'SELECT accessed FROM entries').fetchone()[0]
+        placed = accessed()
+        index.touch(cache_pn)
+        index.touch(cache_pn, 'a.log')
+        assert accessed() == placed
+        index.touch(cache_pn, 'b.log')
+        assert accessed() > placed
+        index.touch(cache_pn)
+        index.close()
+        assert [name for name, _ in index.find(None, '')] == ['a.log', 'b.log']
+
+    def test_files_failing_to_be_written_are_removed(self, tmpdir, monkeypatch):
+        class FullWriter(BackgroundWriter):
+            def __init__(self, writer, done_callback):
+                super(FullWriter, self).__init__(writer, done_callback)
+                self._writer = self
+            def write(self, data):
+                if threading.current_thread() is not self:
+                    return super(FullWriter, self).write(data)
+                raise IOError('No space left on device')
+        monkeypatch.setattr(cache_module, 'BackgroundWriter', FullWriter)
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        reader = cache.open('a.log', FakeKey('a.log', LOG))
+        assert reader.read(10) == LOG[:10]
+        time.sleep(0.1) # (for the write to fail)
+        with pytest.raises(IOError):
+            reader.read(10)
+        reader.close()
+        cache.cleanup()
+        assert not cache.lookup('a.log')[1]
+        assert not Cache.readers
+        assert not [f for d in tmpdir.join('cache').listdir() if d.isdir() for f in d.listdir()]
+
+    def test_files_failing_to_start_writing_are_removed(self, tmpdir, monkeypatch):
+        class StuckWriter(BackgroundWriter):
+            def start(self):
+                raise RuntimeError("can't start new thread")
+        monkeypatch.setattr(cache_module, 'BackgroundWriter', StuckWriter)
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        with pytest.raises(RuntimeError):
+            cache.open('a.log', FakeKey('a.log', LOG))
+        assert not [f for d in tmpdir.join('cache').listdir() if d.isdir() for f in d.listdir()]
+        with sqlite3.connect(cache._index.pathname) as db:
+            assert db.execute('SELECT COUNT(*) FROM temps').fetchone()[0] == 0
+
+    def test_abandoned_temporary_files_expire(self, tmpdir, monkeypatch):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        cache_pn, _ = cache.lookup('a.log')
+        tempfile = cache._temporary(cache_pn) # (as left by a process that died writing it)
+        tempfile.close()
+        index = CacheIndex(cache.path)
+        index.expire(1)
+        assert os.path.exists(tempfile.name) # (might still be written)
+        monkeypatch.setattr(CacheIndex, 'ABANDONED_HOURS', 0)
+        index.expire(1)
+        assert not os.path.exists(tempfile.name)
+
+    def test_lookups_are_passed_along(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG)))
+        cache.cleanup()
+        cache.lookup = None # (must not be looked up again)
+        assert read_all(cache.open('a.log', None, cached=True)) == LOG
+        assert read_all(cache.fetch('a.log', None, cached=True)) == LOG
+        cache.cleanup()
+
+    def test_same_content_is_stored_once(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        read_all(cache.open('x/a.log', FakeKey('x/a.log', LOG), '"abc"', len(LOG)))
+        cache.cleanup()
+        cache_pn, cached = cache.lookup('y/a.log', '"abc"', len(LOG))
+        assert cached
+        assert cache_pn == cache.lookup('x/a.log', '"abc"', len(LOG))[0]
+
+    def test_rewritten_key_is_not_served_stale(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG), '"abc"', len(LOG)))
+        cache.cleanup()
+        assert not cache.lookup('a.log', '"def"', len(LOG))[1]
+        assert not cache.lookup('a.log', '"abc"', len(LOG) + 1)[1]
+        assert read_all(cache.open('a.log', FakeKey('a.log', b'new\n'), '"def"', 4)) == b'new\n'
+
+    def test_partial_reads_are_resumed_with_a_range(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        reader = cache.open('a.log', FakeKey('a.log', LOG), '"abc"', len(LOG))
+        start = reader.read(100)
+        cache.cleanup() # stopped early (e.g. piped to head)
+        cache_pn, cached = cache.lookup('a.log', '"abc"', len(LOG))
+        assert not cached
+        assert open(cache_pn + Cache.PARTIAL_SUFFIX, 'rb').read() == start
+        key = FakeKey('a.log', LOG)
+        assert read_all(cache.open('a.log', key, '"abc"', len(LOG))) == LOG
+        cache.cleanup()
+        assert key.ranges == ['bytes=100-']
+        assert cache.lookup('a.log', '"abc"', len(LOG))[1]
+        assert open(cache_pn, 'rb').read() == LOG
+        assert not os.path.exists(cache_pn + Cache.PARTIAL_SUFFIX)
+
+    def test_partial_reads_are_not_kept_without_an_etag(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        cache.open('a.log', FakeKey('a.log', LOG)).read(100)
+        cache.cleanup()
+        cache_pn, _ = cache.lookup('a.log')
+        assert os.listdir(os.path.dirname(cache_pn)) == []
+        key = FakeKey('a.log', b'rewritten\n')
+        assert read_all(cache.open('a.log', key)) == b'rewritten\n'
+        assert key.ranges == []
+
+    def test_decompressed_partial_reads_are_not_kept(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        raw = gzip.compress(NOISE)
+        cache.open('a.gz', FakeKey('a.gz', raw), '"abc"', len(raw)).read(100)
+        cache.cleanup()
+        cache_pn, _ = cache.lookup('a.gz', '"abc"', len(raw))
+        assert os.listdir(os.path.dirname(cache_pn)) == []
+
+    def test_compressed_partial_reads_are_resumed(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1, compress=True)
+        raw = gzip.compress(NOISE)
+        cache.open('a.gz', FakeKey('a.gz', raw), '"abc"', len(raw)).read(100)
+        cache.cleanup()
+        cache_pn, _ = cache.lookup('a.gz', '"abc"', len(raw))
+        offset = os.path.getsize(cache_pn + Cache.PARTIAL_SUFFIX)
+        assert 0 < offset < len(raw)
+        key = FakeKey('a.gz', raw)
+        assert read_all(cache.open('a.gz', key, '"abc"', len(raw))) == NOISE
+        cache.cleanup()
+        assert key.ranges == ['bytes=%d-' % offset]
+        assert open(cache_pn, 'rb').read() == raw
+
+    def test_open_at_seeks_into_cached_files(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG)))
+        cache.cleanup()
+        assert read_all(cache.open_at('a.log', None, 1000)) == LOG[1000:]
+
+    def test_open_at_uses_a_range_when_not_cached(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        key = FakeKey('a.log', LOG)
+        assert read_all(cache.open_at('a.log', key, 1000, '"abc"', len(LOG))) == LOG[1000:]
+        assert key.ranges == ['bytes=0-5', 'bytes=1000-'] # only the start is read to detect a codec
+
+    def test_open_at_without_a_size_makes_no_range_requests(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        key = FakeKey('a.log', LOG)
+        assert cache.open_at('a.log', key, 1000, '"abc"') is None
+        assert key.ranges == []
+
+    def test_open_at_refuses_to_decompress(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1, compress=True)
+        read_all(cache.open('a.log', FakeKey('a.log', LOG)))
+        cache.cleanup()
+        assert cache.open_at('a.log', None, 1000) is None
+        assert cache.open_at('b', FakeKey('b', gzip.compress(LOG)), 1000) is None
+
+    def test_open_at_starts_from_a_checkpoint(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1, compress=True, checkpoint_bytes=4096)
+        raw = gzip.compress(NOISE)
+        read_all(cache.open('a.gz', FakeKey('a.gz', raw)))
+        cache.cleanup()
+        cache_pn, _ = cache.lookup('a.gz')
+        assert os.path.exists(cache_pn + GzipIndex.SUFFIX)
+        assert read_all(cache.open('a.gz', None)) == NOISE
+        assert read_all(cache.open_at('a.gz', None, 10000)) == NOISE[10000:]
+        assert cache.open_at('a.gz', None, 100) is None # before the first checkpoint
+        cache._index.expire(0)
+        assert not os.path.exists(cache_pn + GzipIndex.SUFFIX)
+
+    def test_multiple_members_are_all_read(self, tmpdir):
+        raw = gzip.compress(LOG) + gzip.compress(NOISE)
+        for threads in (0, 2):
+            cache = Cache(str(tmpdir.join('cache%d' % threads)), 1, compress=True,
+                          decompress_threads=threads)
+            assert read_all(cache.open('a.gz', FakeKey('a.gz', raw))) == LOG + NOISE
+            cache.cleanup()
+            assert read_all(cache.open('a.gz', None)) == LOG + NOISE
+
+    def test_streams_ending_on_a_read_boundary_are_continued(self):
+        for compress in (bz2.compress, lzma.compress, gzip.compress):
+            first = compress(LOG)
+            raw = first + compress(NOISE)
+            reader = Cache._Decompressor(BytesIO(raw), compression.detect(raw))
+            data = b''
+            while True:
+                chunk = reader.read(len(first))
+                if not chunk:
+                    break
+                data += chunk
+            assert data == LOG + NOISE
+
+    def test_peeked_reads_are_no_larger_than_requested(self):
+        raw = gzip.compress(LOG)
+        peeked = Cache._Peeked(FakeKey('a.gz', raw))
+        assert peeked.codec is compression.GZIP
+        assert peeked.read(2) == raw[:2]
+        assert peeked.read(2) == raw[2:4]
+        assert peeked.read() == raw[4:]
+
+    def test_codec_is_detected_from_content(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        assert read_all(cache.open('a.log', FakeKey('a.log', bz2.compress(LOG)))) == LOG
+        assert read_all(cache.open('b.gz', FakeKey('b.gz', LOG))) == LOG
+        cache.cleanup()
+        assert open(cache.lookup('a.log')[0], 'rb').read() == LOG
+
+    def test_other_codecs_are_stored_as_is(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1, compress=True)
+        raw = lzma.compress(LOG)
+        assert read_all(cache.open('a.log', FakeKey('a.log', raw))) == LOG
+        cache.cleanup()
+        assert open(cache.lookup('a.log')[0], 'rb').read() == raw
+        assert read_all(cache.open('a.log', None)) == LOG
+
+    def test_stats_count_fetched_and_cached_bytes(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        raw = gzip.compress(LOG)
+        assert read_all(cache.open('a.gz', FakeKey('a.gz', raw))) == LOG
+        cache.cleanup()
+        assert read_all(cache.open('a.gz', None)) == LOG
+        values = cache.stats.to_dict()
+        assert values['fetch_bytes'] == len(raw)
+        assert values['decompress_bytes'] == len(LOG)
+        assert values['cache_bytes'] == len(LOG)
+
+    def test_fetch_stores_keys_before_returning_a_reader_of_the_file(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1, compress=True)
+        raw = gzip.compress(LOG)
+        reader = cache.fetch('a.gz', FakeKey('a.gz', raw))
+        cache_pn, cached = cache.lookup('a.gz')
+        assert cached and open(cache_pn, 'rb').read() == raw
+        assert read_all(reader) == LOG
+        assert read_all(cache.fetch('a.gz', None)) == LOG # (already stored)
+        cache.cleanup()
+        assert Cache(None, 1).fetch('a.gz', FakeKey('a.gz', raw)) is None
+
+    def test_index_finds_cached_keys_by_prefix(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        for name in ('logs/b', 'logs/a', 'other/c'):
+            read_all(cache.open(name, FakeKey(name, LOG), bucket='my-logs'))
+        cache.cleanup()
+        found = CacheIndex(str(tmpdir.join('cache'))).find('my-logs', 'logs/')
+        assert [name for name, _ in found] == ['logs/a', 'logs/b']
+        assert found[0][1] == cache.lookup('logs/a')[0]
+
+    def test_index_finds_keys_sharing_a_file_in_their_own_bucket(self, tmpdir):
+        cache = Cache(str(tmpdir.join('cache')), 1)
+        etag = '"abc"'
+        read_all(cache.open('logs/a', FakeKey('logs/a', LOG), etag, len(LOG), 'my-logs'))
+        cache.cleanup() # (wait for the file to be placed)
+        read_all(cache.open('logs/b', None, etag, len(LOG), 'my-logs')) # (found in cache)
+        read_all(cache.open('logs/a', None, etag, len(LOG), 'other-logs'))
+        cache.cleanup()
+        index = CacheIndex(str(tmpdir.join('cache')))
+        found = index.find('my-logs', 'logs/')
+        assert [name for name, _ in found] == ['logs/a', 'logs/b']
+        assert found[0][1] == found[1][1]
+        assert [name for name, _ in index.find('other-logs', 'logs/')] == ['logs/a']
+        assert index.find('missing', 'logs/') == []
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_compression
+----------------------------------
+
+Tests for `s3tail.compression` module.
+"""
+
+import bz2
+import gzip
+import lzma
+import zlib
+import pytest
+
+from s3tail import compression
+
+
+DATA = b''.join(b'line %d\n' % i for i in range(1000))
+
+
+class TestCompression(object):
+
+    def test_detects_by_content(self):
+        assert compression.detect(gzip.compress(DATA)) is compression.GZIP
+        assert compression.detect(bz2.compress(DATA)).name == 'bzip2'
+        assert compression.detect(lzma.compress(DATA)).name == 'xz'
+        assert compression.detect(b'\x28\xb5\x2f\xfd\x00').name == 'zstd'
+        assert compression.detect(DATA) is None
+        assert compression.detect(b'') is None
+
+    def test_decompressors_are_streaming(self):
+        for compress in (gzip.compress, bz2.compress, lzma.compress):
+            compressed = compress(DATA)
+            decompressor = compression.detect(compressed).decompressor()
+            parts = [decompressor.decompress(compressed[i:i+100])
+                     for i in range(0, len(compressed), 100)]
+            assert b''.join(parts) == DATA
+
+    def test_registered_codecs_are_detected(self):
+        codec = compression.Codec('test', b'TEST', lambda: zlib.decompressobj(-zlib.MAX_WBITS))
+        compression.register(codec)
+        try:
+            assert compression.detect(b'TEST...') is codec
+            assert compression.magic_size() == 6
+        finally:
+            compression._codecs.remove(codec)
+
+    @pytest.mark.skipif(compression.zstandard is not None, reason='zstandard is installed')
+    def test_missing_package_is_reported(self):
+        with pytest.raises(compression.MissingCodecError):
+            compression.detect(b'\x28\xb5\x2f\xfd\x00').decompressor()
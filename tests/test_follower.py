@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_follower
+----------------------------------
+
+Tests for `s3tail.follower` module.
+"""
+
+import json
+
+from s3tail.follower import Follower, S3EventQueue
+
+from .conftest import FakeBucket
+
+
+class Message(object):
+    def __init__(self, body):
+        self._body = body
+
+    def get_body(self):
+        return self._body
+
+
+class LocalQueue(object):
+    '''A stand-in for an SQS queue.'''
+
+    def __init__(self):
+        self.messages = []
+        self.waits = []
+        self.deleted = []
+
+    def get_messages(self, num_messages=1, wait_time_seconds=None):
+        self.waits.append(wait_time_seconds)
+        messages, self.messages = self.messages[:num_messages], self.messages[num_messages:]
+        return messages
+
+    def delete_message(self, message):
+        self.deleted.append(message)
+
+    def announce(self, *names, **kwargs):
+        records = [{'eventName': kwargs.get('event', 'ObjectCreated:Put'),
+                    's3': {'bucket': {'name': kwargs.get('bucket', 'my-logs')},
+                           'object': {'key': name, 'size': 10, 'eTag': 'abc'}}} for name in names]
+        self.messages.append(Message(json.dumps({'Records': records})))
+
+
+class TestFollower(object):
+
+    def test_new_keys_are_listed_after_the_last(self):
+        bucket = FakeBucket(['a', 'b'])
+        follower = Follower(bucket.list_keys, min_interval=0.001, max_interval=0.001)
+        found = []
+        for key in follower:
+            found.append(key.name)
+            if key.name == 'b':
+                bucket.add('c')
+            elif key.name == 'c':
+                follower.stop()
+        assert found == ['a', 'b', 'c']
+        assert bucket.markers[:2] == [None, 'b']
+
+    def test_interval_grows_while_idle(self):
+        bucket = FakeBucket()
+        queue = LocalQueue()
+        follower = Follower(bucket.list_keys, min_interval=1, max_interval=4,
+                            notifications=S3EventQueue(queue, bucket, 'logs/'))
+        passes = follower.passes()
+        for _ in range(5):
+            list(next(passes))
+        queue.announce('logs/x')
+        assert [k.name for k in next(passes)] == ['logs/x']
+        list(next(passes))
+        assert queue.waits == [2, 4, 4, 4, 4, 1] # after the first pass listing nothing
+
+    def test_notifications_are_filtered(self):
+        bucket = FakeBucket()
+        queue = LocalQueue()
+        queue.announce('logs/b%3Dc', 'logs/a', 'other/x')
+        queue.announce('logs/d', bucket='other-bucket')
+        queue.announce('logs/e', event='ObjectRemoved:Delete')
+        keys = S3EventQueue(queue, bucket, 'logs/').receive(5)
+        assert [k.name for k in keys] == ['logs/a', 'logs/b=c']
+        assert (keys[0].size, keys[0].etag) == (10, '"abc"')
+
+    def test_notified_keys_already_listed_are_skipped(self):
+        bucket = FakeBucket(['logs/a', 'logs/b'])
+        queue = LocalQueue()
+        queue.announce('logs/b', 'logs/c')
+        follower = Follower(bucket.list_keys, notifications=S3EventQueue(queue, bucket, 'logs/'))
+        passes = follower.passes()
+        assert [k.name for k in next(passes)] == ['logs/a', 'logs/b']
+        assert [k.name for k in next(passes)] == ['logs/c']
+        assert bucket.markers == [None]
+
+    def test_notified_keys_are_reported_in_any_order_once(self):
+        bucket = FakeBucket(['logs/b'])
+        queue = LocalQueue()
+        queue.announce('logs/a', 'logs/c')
+        queue.announce('logs/c')
+        follower = Follower(bucket.list_keys, notifications=S3EventQueue(queue, bucket, 'logs/'))
+        passes = follower.passes()
+        assert [k.name for k in next(passes)] == ['logs/b']
+        assert [k.name for k in next(passes)] == ['logs/a', 'logs/c']
+        assert follower.marker == 'logs/c'
+
+    def test_messages_are_deleted_once_their_keys_are_handled(self):
+        bucket = FakeBucket()
+        queue = LocalQueue()
+        queue.announce('logs/a')
+        follower = Follower(bucket.list_keys, notifications=S3EventQueue(queue, bucket, 'logs/'))
+        passes = follower.passes()
+        list(next(passes))
+        assert [k.name for k in next(passes)] == ['logs/a']
+        assert not queue.deleted
+        list(next(passes))
+        assert len(queue.deleted) == 1
+
+    def test_waiting_for_notifications_stops_soon(self):
+        queue = LocalQueue()
+        notifications = S3EventQueue(queue, FakeBucket(), 'logs/')
+        assert notifications.receive(60, lambda: True) == []
+        assert queue.waits == [S3EventQueue.MAX_WAIT]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_gzip_index
+----------------------------------
+
+Tests for `s3tail.gzip_index` module.
+"""
+
+import os
+import gzip
+import zlib
+import binascii
+
+from s3tail.gzip_index import GzipIndex, CheckpointCompressor
+
+
+DATA = b''.join(b'%s\n' % binascii.hexlify(os.urandom(20)) for _ in range(2000))
+
+
+def compress(data, interval, chunk_size=777):
+    compressor = CheckpointCompressor(1, interval)
+    parts = [compressor.compress(data[i:i+chunk_size]) for i in range(0, len(data), chunk_size)]
+    parts.append(compressor.flush())
+    return b''.join(parts), compressor.index
+
+
+class TestGzipIndex(object):
+
+    def test_output_is_gzip(self):
+        compressed, _ = compress(DATA, 10000)
+        assert gzip.decompress(compressed) == DATA
+
+    def test_decompression_starts_at_each_checkpoint(self):
+        compressed, index = compress(DATA, 10000)
+        assert len(index.checkpoints) == len(DATA) // 10000
+        for offset, compressed_offset in index.checkpoints:
+            assert offset % 10000 == 0
+            inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+            assert inflater.decompress(compressed[compressed_offset:]) == DATA[offset:]
+
+    def test_find_and_persist(self, tmpdir):
+        index = GzipIndex([(100, 10), (200, 25), (300, 33)])
+        assert index.find(99) is None
+        assert index.find(100) == (100, 10)
+        assert index.find(299) == (200, 25)
+        assert index.find(5000) == (300, 33)
+        pathname = str(tmpdir.join('idx'))
+        index.save(pathname)
+        assert GzipIndex.load(pathname).checkpoints == index.checkpoints
+        assert GzipIndex.load(pathname + 'missing') is None
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_line_reader
+----------------------------------
+
+Tests for `s3tail.line_reader` module.
+"""
+
+import pickle
+
+from io import BytesIO
+
+from s3tail.line_reader import LineReader, Excluding, FixedString, Regex
+
+
+class FakeReader(BytesIO):
+    name = 'fake'
+
+
+def read_lines(data, buffer_size=4, max_buffer_size=16, skip=0):
+    return list(LineReader(FakeReader(data), buffer_size, max_buffer_size, skip=skip))
+
+
+class TestLineReader(object):
+
+    def test_splits_across_chunks(self):
+        lines = read_lines(b'one\ntwo\n\nthree\n')
+        assert lines == [(1, b'one'), (2, b'two'), (3, b''), (4, b'three')]
+
+    def test_trailing_partial_line(self):
+        assert read_lines(b'one\ntwo') == [(1, b'one'), (2, b'two')]
+
+    def test_overlong_line_is_reported(self):
+        lines = read_lines(b'x' * 20 + b'\nend\n')
+        assert lines[-1] == (lines[-1][0], b'end')
+        assert b''.join(l for _, l in lines[:-1]) == b'x' * 20
+
+    def test_skip_counts_without_yielding(self):
+        lines = read_lines(b'a\nb\nc\nd\n', skip=3)
+        assert lines == [(3, b'c'), (4, b'd')]
+
+    def test_closes_reader_at_eof(self):
+        reader = FakeReader(b'a\n')
+        list(LineReader(reader, 4, 16))
+        assert reader.closed
+
+    def test_fixed_string_yields_only_matching_lines(self):
+        data = b'alpha\nbeta needle\ngamma\nneedle\ndelta\n'
+        lines = list(LineReader(FakeReader(data), 8, 64, pattern=FixedString(b'needle')))
+        assert lines == [(2, b'beta needle'), (4, b'needle')]
+
+    def test_pattern_counts_lines_across_chunks(self):
+        data = b''.join(b'line %d\n' % i for i in range(1, 101))
+        lines = list(LineReader(FakeReader(data), 7, 64, pattern=FixedString(b'line 5')))
+        assert lines == [(5, b'line 5')] + [(n, b'line %d' % n) for n in range(50, 60)]
+
+    def test_regex_match_must_lie_within_a_line(self):
+        data = b'foo\nbar\nfoo bar\n'
+        reader = LineReader(FakeReader(data), 64, 128, pattern=Regex(br'foo\s+bar'))
+        assert list(reader) == [(3, b'foo bar')]
+        assert reader.line_num == 3
+
+    def test_regex_anchors_match_line_boundaries(self):
+        data = b'xa\nab\nb\n'
+        lines = list(LineReader(FakeReader(data), 64, 128, pattern=Regex(b'^a')))
+        assert lines == [(2, b'ab')]
+
+    def test_excluding_accepts_lines_not_matching(self):
+        lines = [b'foo 200', b'bar 500', b'200 baz']
+        assert [l for l in lines if Excluding(Regex(b'^foo|baz$'))(l)] == [b'bar 500']
+        assert [l for l in lines if Excluding(FixedString(b' 200'))(l)] == lines[1:]
+        assert pickle.loads(pickle.dumps(Excluding(Regex(b'x'))))(b'y') # (for worker processes)
+
+    def test_pattern_with_skip_and_partial_line(self):
+        data = b'hit\nmiss\nhit\nhit'
+        lines = list(LineReader(FakeReader(data), 3, 64, skip=2, pattern=FixedString(b'hit')))
+        assert lines == [(3, b'hit'), (4, b'hit')]
+
+    def test_offset_allows_resuming_at_a_line(self):
+        data = b'one\ntwo\nthree\nfour\n'
+        reader = LineReader(FakeReader(data), 4, 16)
+        for num, line in reader:
+            if line == b'three':
+                break
+        resumed = LineReader(FakeReader(data[reader.offset:]), 4, 16,
+                             line_num=num - 1, offset=reader.offset)
+        assert list(resumed) == [(3, b'three'), (4, b'four')]
+        assert resumed.offset == data.index(b'four')
+
+    def test_chunks_yield_runs_of_whole_lines(self):
+        data = b'one\ntwo\n\nthree\nfour'
+        reader = LineReader(FakeReader(data), 6, 32)
+        chunks = list(reader.chunks())
+        assert b''.join(run for _, run in chunks) == data + b'\n'
+        assert all(run.endswith(b'\n') for _, run in chunks)
+        assert chunks[-1] == (5, b'four\n')
+        assert reader.line_num == 5
+
+    def test_chunks_skip_and_offset(self):
+        data = b'a\nb\nc\nd\n'
+        reader = LineReader(FakeReader(data), 64, 128, skip=3)
+        assert list(reader.chunks()) == [(4, b'c\nd\n')]
+        assert reader.offset == data.index(b'd')
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_line_writer
+----------------------------------
+
+Tests for `s3tail.line_writer` module.
+"""
+
+from io import BytesIO
+
+from s3tail.line_writer import LineWriter
+
+
+class FakeStream(BytesIO):
+    def __init__(self):
+        super(FakeStream, self).__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super(FakeStream, self).write(data)
+
+
+class TestLineWriter(object):
+
+    def test_collects_lines_into_large_writes(self):
+        stream = FakeStream()
+        writer = LineWriter(stream, buffer_size=10)
+        for line in [b'one', b'two', b'three', b'four']:
+            writer.write_line(line)
+        assert stream.writes == 1
+        assert stream.getvalue() == b'one\ntwo\nthree\n'
+        writer.flush()
+        assert stream.getvalue() == b'one\ntwo\nthree\nfour\n'
+
+    def test_mixes_lines_and_runs(self):
+        stream = FakeStream()
+        writer = LineWriter(stream, buffer_size=64)
+        writer.write_line(b'one')
+        writer.write_lines(b'two\nthree\n')
+        writer.write_line(b'four')
+        writer.flush()
+        assert stream.writes == 1
+        assert stream.getvalue() == b'one\ntwo\nthree\nfour\n'
+
+    def test_writes_large_runs_directly(self):
+        stream = FakeStream()
+        writer = LineWriter(stream, buffer_size=4)
+        writer.write_lines(b'a long line\n')
+        assert stream.getvalue() == b'a long line\n'
+        writer.flush()
+        assert stream.writes == 1
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_lister
+----------------------------------
+
+Tests for `s3tail.lister` module.
+"""
+
+import time
+import pytest
+
+from s3tail.lister import Lister, KeyQueue
+
+from .conftest import FakeBucket
+
+
+NAMES = ['logs/top.log'] + ['logs/2016/08/%02d/%03d.log' % (d, i)
+                            for d in range(1, 8) for i in range(50)] + ['logs/zzz.log']
+
+
+class TestLister(object):
+
+    def test_split_listing_keeps_order(self):
+        bucket = FakeBucket(NAMES)
+        assert [k.name for k in Lister(bucket, 'logs/', threads=1)] == sorted(NAMES)
+        days = [n for n in sorted(NAMES) if n.startswith('logs/2016/08/')]
+        assert [k.name for k in Lister(bucket, 'logs/2016/08/', threads=3)] == days
+        assert [k.name for k in Lister(bucket, 'logs/', threads=3)] == sorted(NAMES)
+
+    def test_split_listing_orders_each_page(self):
+        names = ['logs/%s.log' % c for c in 'abcdefgh'] + ['logs/a/1.log', 'logs/c/1.log',
+                                                           'logs/f/1.log', 'logs/z/1.log']
+        bucket = FakeBucket(names)
+        bucket.page_size = 3 # (e.g. a.log, b.log, a/ then c.log, d.log, c/ ...)
+        assert [k.name for k in Lister(bucket, 'logs/', threads=3)] == sorted(names)
+
+    def test_split_listing_honors_marker(self):
+        bucket = FakeBucket(NAMES)
+        marker = 'logs/2016/08/05/010.log'
+        expected = [n for n in sorted(NAMES) if n > marker and n.startswith('logs/2016/')]
+        listed = [k.name for k in Lister(bucket, 'logs/2016/08/', marker, threads=4)]
+        assert listed == expected
+        assert 'logs/2016/08/03/' not in bucket.prefixes
+
+    def test_keys_are_drawn_ahead(self):
+        drawn = []
+        def keys():
+            for i in range(10):
+                drawn.append(i)
+                yield i
+        queue = iter(KeyQueue(keys(), 5))
+        assert next(queue) == 0
+        time.sleep(0.1)
+        assert len(drawn) >= 5
+        assert list(queue) == list(range(1, 10))
+
+    def test_listing_errors_are_raised(self):
+        def keys():
+            yield 1
+            raise IOError('denied')
+        queue = iter(KeyQueue(keys(), 5))
+        assert next(queue) == 1
+        with pytest.raises(IOError):
+            next(queue)
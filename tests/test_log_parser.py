@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_log_parser
+----------------------------------
+
+Tests for `s3tail.log_parser` module.
+"""
+
+import json
+import pytest
+
+from s3tail import log_parser
+from s3tail.log_parser import LogParser, record_formatter
+
+
+ELB_LINE = (b'2015-05-13T23:39:43.945958Z my-loadbalancer 192.168.131.39:2817 10.0.0.1:80 '
+            b'0.000073 0.001048 0.000057 200 200 0 29 "GET http://www.example.com:80/ HTTP/1.1" '
+            b'"curl/7.38.0" - -')
+
+ALB_LINE = (b'http 2018-07-02T22:23:00.186641Z app/my-loadbalancer/50dc6c495c0c9188 '
+            b'192.168.131.39:2817 10.0.0.1:80 0.000 0.001 0.000 200 200 34 366 '
+            b'"GET http://www.example.com:80/ HTTP/1.1" "curl/7.46.0" - - '
+            b'arn:aws:elasticloadbalancing:us-east-2:123456789012:targetgroup/my-targets/73e2d6bc24d8a067 '
+            b'"Root=1-58337262-36d228ad5d99923122bbe354" "-" "-" 0 2018-07-02T22:22:48.364000Z '
+            b'"forward" "-" "-" "10.0.0.1:80" "200" "-" "-"')
+
+S3_LINE = (b'79a59df900b949e55d96a1e698fbacedfd6e09d98eacf8f8d5218e7cd47ef2be awsexamplebucket1 '
+           b'[06/Feb/2019:00:00:38 +0000] 192.0.2.3 '
+           b'79a59df900b949e55d96a1e698fbacedfd6e09d98eacf8f8d5218e7cd47ef2be 3E57427F3EXAMPLE '
+           b'REST.GET.VERSIONING - "GET /awsexamplebucket1?versioning HTTP/1.1" 200 - 113 - 7 - '
+           b'"-" "S3Console/0.4" - s9lzHYrFp76ZVxRcpX9+5cjAnEH2ROuNkd2BHfIa6UkFVdtjf5mKR3/eTPFvsiP/'
+           b'XV/VLi31234= SigV4 ECDHE-RSA-AES128-GCM-SHA256 AuthHeader awsexamplebucket1.s3.us-west-1.amazonaws.com TLSV1.1')
+
+
+class TestLogParser(object):
+
+    def test_elb(self):
+        record = log_parser.ELB.parse(ELB_LINE)
+        assert record.elb == 'my-loadbalancer'
+        assert record.request_processing_time == 0.000073
+        assert (record.elb_status_code, record.sent_bytes) == (200, 29)
+        assert record.request == 'GET http://www.example.com:80/ HTTP/1.1'
+        assert record.ssl_cipher == '-'
+
+    def test_alb(self):
+        record = log_parser.ALB.parse(ALB_LINE)
+        assert record.type == 'http'
+        assert record.target_status_code == 200
+        assert record.trace_id == 'Root=1-58337262-36d228ad5d99923122bbe354'
+        assert record.matched_rule_priority == 0
+        assert record.error_reason == '-'
+
+    def test_s3(self):
+        record = log_parser.S3.parse(S3_LINE)
+        assert record.time == '06/Feb/2019:00:00:38 +0000'
+        assert record.request_id == '3E57427F3EXAMPLE'
+        assert record.http_status == 200
+        assert (record.bytes_sent, record.object_size) == (113, None)
+        assert record.tls_version == 'TLSV1.1'
+
+    def test_time_keys_sort_across_formats(self):
+        elb = log_parser.ELB.parse(ELB_LINE)
+        alb = log_parser.ALB.parse(ALB_LINE)
+        s3 = log_parser.S3.parse(S3_LINE)
+        assert elb.log_format.time_key(elb) == '2015-05-13T23:39:43.945958'
+        assert alb.log_format.time_key(alb) == '2018-07-02T22:23:00.186641'
+        assert s3.log_format.time_key(s3) == '2019-02-06T00:00:38'
+
+    def test_missing_trailing_fields_are_none(self):
+        record = log_parser.S3.parse(S3_LINE[:S3_LINE.index(b' - s9lz')])
+        assert record.user_agent == 'S3Console/0.4'
+        assert record.version_id is None
+        assert log_parser.S3.parse(S3_LINE[:100]) is None
+
+    def test_format_is_detected_and_kept(self):
+        parser = LogParser()
+        assert type(parser.parse(ELB_LINE)).__name__ == 'ELBRecord'
+        assert type(parser.parse(S3_LINE)).__name__ == 'S3Record'
+        assert type(parser.parse(ALB_LINE)).__name__ == 'ALBRecord'
+        assert parser.parse(b'not a log line') is None
+        assert LogParser(log_parser.S3).parse(ELB_LINE) is None
+
+    def test_quoted_fields_may_hold_escaped_quotes(self):
+        line = ELB_LINE.replace(b'"curl/7.38.0"', b'"curl \\"quoted\\""')
+        assert log_parser.ELB.parse(line).user_agent == 'curl \\"quoted\\"'
+
+    def test_formatters(self):
+        record = log_parser.ELB.parse(ELB_LINE)
+        assert json.loads(record_formatter('json')(record))['elb_status_code'] == 200
+        assert record_formatter('tsv')(record).split('\t')[7] == '200'
+        assert record_formatter('fields=elb,sent_bytes,nope')(record) == 'my-loadbalancer\t29\t-'
+        with pytest.raises(ValueError):
+            record_formatter('xml')
+        record_formatter('fields=elb,target', log_parser.FORMATS)
+        with pytest.raises(ValueError):
+            record_formatter('fields=elb,target', log_parser.ELB)
+        with pytest.raises(ValueError):
+            record_formatter('fields=nope', log_parser.FORMATS)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_merger
+----------------------------------
+
+Tests for `s3tail.merger` module.
+"""
+
+import random
+
+from datetime import datetime, timedelta
+
+from s3tail.merger import Merger, ordered_keys, stem_listings
+
+from .conftest import FakeBucket, FakeKey
+
+
+LINE = '%s my-lb 192.168.131.39:2817 10.0.0.1:80 0.1 0.2 0.3 200 200 0 29 "GET / HTTP/1.1" "curl" - -'
+
+START = datetime(2016, 8, 4, 10, 0)
+
+
+def make_key(name, lines=()):
+    return FakeKey(name, ''.join(line + '\n' for line in lines).encode('utf-8'))
+
+
+def elb_key(end, node, lines=()):
+    return make_key('elb/2016/08/04/123_elasticloadbalancing_us-west-2_lb_%s_10.0.0.%d_abc.log' %
+                    (end.strftime('%Y%m%dT%H%MZ'), node), lines)
+
+
+def elb_keys(intervals, nodes, count=20):
+    '''Make the keys of several nodes for each 5 minute interval, holding sorted random times.'''
+    keys = []
+    for interval in range(intervals):
+        end = START + timedelta(minutes=5 * (interval + 1))
+        for node in range(nodes):
+            times = sorted(end - timedelta(seconds=random.uniform(0, 300)) for _ in range(count))
+            keys.append(elb_key(end, node, [LINE % t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                                            for t in times]))
+    return keys
+
+
+def open_lines(key):
+    return enumerate(key.data.decode('utf-8').splitlines(), 1)
+
+
+def times(merged):
+    return [line.split(' ')[0] for _, _, line, _ in merged]
+
+
+def key_times(keys):
+    return sorted(line.split(' ')[0] for k in keys for _, line in open_lines(k))
+
+
+class TestMerger(object):
+
+    def test_lines_are_ordered_by_time(self):
+        keys = elb_keys(4, 3)
+        merger = Merger(ordered_keys([keys]), open_lines)
+        merged = list(merger)
+        assert times(merged) == key_times(keys)
+        assert all(record is not None for _, _, _, record in merged)
+        assert merger.opened == 12
+
+    def test_only_keys_within_the_window_are_open(self):
+        merger = Merger(ordered_keys([elb_keys(6, 4)]), open_lines)
+        list(merger)
+        assert merger.peak_open <= 8
+
+    def test_listings_are_merged_by_key_time(self):
+        first, second = elb_keys(3, 1), elb_keys(3, 1)
+        merged = list(ordered_keys([first, second]))
+        assert [key for _, key in merged] == [first[0], second[0], first[1], second[1],
+                                              first[2], second[2]]
+        assert merged[0][0] == START + timedelta(minutes=5)
+
+    def test_unparsed_lines_keep_their_place(self):
+        key = elb_key(START, 0, [LINE % '2016-08-04T09:59:00Z', 'garbage',
+                                 LINE % '2016-08-04T09:59:30Z'])
+        other = elb_key(START, 1, [LINE % '2016-08-04T09:59:10Z'])
+        merged = list(Merger(ordered_keys([[key, other]]), open_lines))
+        assert [(k, n) for k, n, _, _ in merged] == [(key, 1), (key, 2), (other, 1), (key, 3)]
+        assert merged[1][3] is None
+
+    def test_skipped_keys_and_filtered_lines(self):
+        keys = elb_keys(2, 2, count=5)
+        merger = Merger(ordered_keys([keys]),
+                        lambda key: None if key is keys[0] else open_lines(key),
+                        line_filter=lambda line: line.endswith('- -'))
+        merged = list(merger)
+        assert len(merged) == 15
+        assert keys[0] not in [key for key, _, _, _ in merged]
+
+    def test_keys_without_times_are_opened_first(self):
+        unknown = make_key('unknown', [LINE % '2016-08-04T10:07:00Z'])
+        keys = elb_keys(2, 1, count=5) + [unknown]
+        merger = Merger(ordered_keys([keys[:2], [unknown]]), open_lines)
+        merged = times(merger)
+        assert merged == sorted(merged)
+        assert len(merged) == 11
+
+    def test_load_balancers_sharing_a_prefix_are_merged_by_stem(self):
+        bucket = FakeBucket()
+        keys = elb_keys(3, 2, count=5)
+        for key in keys:
+            bucket.add(key.name, key.data)
+            name = key.name.replace('_lb_', '_other-lb_')
+            bucket.add(name, key.data.replace(b'my-lb', b'other-lb'))
+        listings = stem_listings(lambda prefix, marker: bucket.list(prefix=prefix, marker=marker),
+                                 'elb/')
+        assert len(listings) == 2
+        merged = times(Merger(ordered_keys(listings), open_lines))
+        assert merged == sorted(key_times(keys) * 2)
+        assert bucket.listed == 12 # (each key only once)
+
+    def test_listings_going_back_in_time_are_warned_of(self, caplog):
+        first, second = elb_keys(2, 1, count=1)
+        assert [key for _, key in ordered_keys([[second, first]])] == [second, first]
+        assert 'back in time' in caplog.text
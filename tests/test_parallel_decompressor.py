@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_parallel_decompressor
+----------------------------------
+
+Tests for `s3tail.parallel_decompressor` module.
+"""
+
+import os
+import gzip
+import zlib
+import binascii
+import pytest
+
+from s3tail.gzip_index import CheckpointCompressor
+from s3tail.parallel_decompressor import ParallelDecompressor
+
+
+PARTS = [b''.join(b'%d %s\n' % (p, binascii.hexlify(os.urandom(20))) for _ in range(300))
+         for p in range(8)]
+DATA = b''.join(PARTS)
+
+
+def read_all(reader, size=1000):
+    data = b''
+    while True:
+        chunk = reader.read(size)
+        if not chunk:
+            break
+        data += chunk
+    reader.close()
+    return data
+
+
+def write(tmpdir, data):
+    pathname = str(tmpdir.join('data.gz'))
+    with open(pathname, 'wb') as out:
+        out.write(data)
+    return open(pathname, 'rb')
+
+
+class TestParallelDecompressor(object):
+
+    def test_members_are_joined_in_order(self, tmpdir):
+        compressed = b''.join(gzip.compress(part) for part in PARTS)
+        assert read_all(ParallelDecompressor(write(tmpdir, compressed), 3)) == DATA
+
+    def test_header_found_inside_a_member_is_ignored(self, tmpdir):
+        # a stored (level 0) member holds its content as-is, including anything that looks a header
+        tricky = PARTS[0] + ParallelDecompressor.HEADER + PARTS[1]
+        compressed = gzip.compress(tricky, 0) + gzip.compress(PARTS[2])
+        assert read_all(ParallelDecompressor(write(tmpdir, compressed), 4)) == tricky + PARTS[2]
+
+    def test_single_member_is_streamed(self, tmpdir):
+        reader = ParallelDecompressor(write(tmpdir, gzip.compress(DATA)), 4)
+        assert read_all(reader) == DATA
+
+    def test_checkpoints_split_a_single_member(self, tmpdir):
+        compressor = CheckpointCompressor(1, 5000)
+        compressed = compressor.compress(DATA) + compressor.flush()
+        assert len(compressor.index.checkpoints) > 1
+        reader = ParallelDecompressor(write(tmpdir, compressed), 4, compressor.index)
+        assert read_all(reader) == DATA
+
+    def test_corrupt_member_is_reported(self, tmpdir):
+        second = bytearray(gzip.compress(PARTS[1]))
+        second[20:40] = b'\xff' * 20
+        compressed = gzip.compress(PARTS[0]) + bytes(second)
+        with pytest.raises(zlib.error):
+            read_all(ParallelDecompressor(write(tmpdir, compressed), 2))
+
+    def test_members_are_inflated_in_bounded_pieces(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(ParallelDecompressor, 'PIECE_SIZE', 4096)
+        compressed = b''.join(gzip.compress(b'\0' * 100000 + part) for part in PARTS[:3])
+        reader = ParallelDecompressor(write(tmpdir, compressed), 2)
+        pieces = []
+        while True:
+            piece = reader.read(1 << 30)
+            if not piece:
+                break
+            pieces.append(piece)
+        reader.close()
+        assert b''.join(pieces) == b''.join(b'\0' * 100000 + part for part in PARTS[:3])
+        assert max(len(piece) for piece in pieces) <= 4096
+
+    def test_closing_early_stops_inflating(self, tmpdir):
+        compressed = b''.join(gzip.compress(part) for part in PARTS)
+        reader = ParallelDecompressor(write(tmpdir, compressed), 3)
+        assert reader.read(10) == DATA[:10]
+        reader.close()
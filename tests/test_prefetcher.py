@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_prefetcher
+----------------------------------
+
+Tests for `s3tail.prefetcher` module.
+"""
+
+import time
+import random
+import pytest
+
+from s3tail.prefetcher import Prefetcher
+
+
+class TestPrefetcher(object):
+
+    def test_preserves_order(self):
+        def fetch(key):
+            time.sleep(random.random() / 100)
+            return key * 2
+        results = list(Prefetcher(range(20), fetch, 4))
+        assert results == [(k, k * 2) for k in range(20)]
+
+    def test_fetch_errors_are_raised_in_order(self):
+        def fetch(key):
+            if key == 3:
+                raise ValueError(key)
+            return key
+        seen = []
+        with pytest.raises(ValueError):
+            for key, _ in Prefetcher(range(10), fetch, 2):
+                seen.append(key)
+        assert seen == [0, 1, 2]
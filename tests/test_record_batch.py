@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_record_batch
+----------------------------------
+
+Tests for `s3tail.record_batch` module.
+"""
+
+import math
+import pytest
+
+from array import array
+
+from s3tail import log_parser, record_batch
+from s3tail.record_batch import RecordBatch, Batcher, GroupStats
+
+
+def elb_line(time, status, backend_time):
+    return ('%s my-loadbalancer 192.168.131.39:2817 10.0.0.1:80 0.000073 %s 0.000057 %d 200 0 29 '
+            '"GET http://www.example.com:80/ HTTP/1.1" "curl/7.38.0" - -' %
+            (time, backend_time, status))
+
+def elb_records(*specs):
+    return [log_parser.ELB.parse(elb_line(*spec)) for spec in specs]
+
+S3_LINE = ('79a59df900b949e55d96a1e698fbacedfd6e09d98eacf8f8d5218e7cd47ef2be awsexamplebucket1 '
+           '[06/Feb/2019:00:00:38 +0000] 192.0.2.3 - 3E57427F3EXAMPLE REST.GET.VERSIONING - '
+           '"GET /awsexamplebucket1?versioning HTTP/1.1" 200 - 113 - 7 - "-" "S3Console/0.4"')
+
+
+class TestRecordBatch(object):
+
+    def test_columns(self):
+        records = elb_records(('2015-05-13T23:39:43.945958Z', 200, '0.5'),
+                              ('2015-05-13T23:39:44.000000Z', 503, '-'))
+        batch = RecordBatch(log_parser.ELB, records)
+        assert len(batch) == 2
+        assert batch['elb_status_code'] == array('d', [200, 503])
+        assert batch['backend_processing_time'][0] == 0.5
+        assert math.isnan(batch['backend_processing_time'][1])
+        assert batch['elb'] == ['my-loadbalancer'] * 2
+
+    def test_numpy_columns(self):
+        numpy = pytest.importorskip('numpy')
+        records = elb_records(('2015-05-13T23:39:43.945958Z', 200, '0.5'))
+        batch = RecordBatch(log_parser.ELB, records, use_numpy=True)
+        assert batch['elb_status_code'].dtype == numpy.float64
+
+
+class TestBatcher(object):
+
+    def test_sizes(self):
+        batches = []
+        batcher = Batcher(lambda num, batch: batches.append((num, len(batch))), size=2)
+        records = elb_records(*[('2015-05-13T23:39:43Z', 200, '0.1')] * 5)
+        for num, record in enumerate(records, 1):
+            batcher(num, record)
+        batcher.flush()
+        assert batches == [(2, 2), (4, 2), (5, 1)]
+
+    def test_splits_formats(self):
+        batches = []
+        batcher = Batcher(lambda num, batch: batches.append((num, batch.log_format)), size=10)
+        batcher(1, elb_records(('2015-05-13T23:39:43Z', 200, '0.1'))[0])
+        batcher(2, log_parser.S3.parse(S3_LINE))
+        batcher.flush()
+        assert batches == [(1, log_parser.ELB), (2, log_parser.S3)]
+
+    def test_result(self):
+        batcher = Batcher(lambda num, batch: 'done', size=2)
+        record = elb_records(('2015-05-13T23:39:43Z', 200, '0.1'))[0]
+        assert batcher(1, record) is None
+        assert batcher(2, record) == 'done'
+        assert batcher.flush() is None
+
+
+class TestGroupStats(object):
+
+    def test_group_by_minute(self):
+        stats = GroupStats(['time:minute', 'elb_status_code'], ['backend_processing_time'],
+                           percentiles=(50, 99))
+        stats(RecordBatch(log_parser.ELB, elb_records(
+            ('2015-05-13T23:39:43.945958Z', 200, '1'),
+            ('2015-05-13T23:39:59.000000Z', 200, '3'),
+            ('2015-05-13T23:40:01.000000Z', 200, '2'),
+            ('2015-05-13T23:40:02.000000Z', 503, '-'))))
+        assert stats.header() == ['time', 'elb_status_code', 'count',
+                                  'backend_processing_time_mean', 'backend_processing_time_max',
+                                  'backend_processing_time_p50', 'backend_processing_time_p99']
+        rows = stats.report()
+        assert rows[0][:4] == ['2015-05-13T23:39Z', '200', 2, 2.0]
+        assert rows[0][4:] == [3.0, 2.0, pytest.approx(2.98)]
+        assert rows[1] == ['2015-05-13T23:40Z', '200', 1, 2.0, 2.0, 2.0, 2.0]
+        assert rows[2] == ['2015-05-13T23:40Z', '503', 1, None, None, None, None]
+
+    def test_across_batches(self):
+        stats = GroupStats([], ['backend_processing_time'], percentiles=(50,))
+        for value in range(1, 6):
+            stats(RecordBatch(log_parser.ELB, elb_records(('2015-05-13T23:39:43Z', 200, value))))
+        assert stats.report() == [[5, 3.0, 5.0, 3.0]]
+
+    def test_s3_time(self):
+        stats = GroupStats(['time:hour'])
+        stats(RecordBatch(log_parser.S3, [log_parser.S3.parse(S3_LINE)]))
+        assert stats.report() == [['06/Feb/2019:00 +0000', 1]]
+
+    def test_unknown_unit(self):
+        with pytest.raises(ValueError):
+            GroupStats(['time:week'])
+
+    def test_fields_are_checked(self):
+        GroupStats(['backend'], ['backend_processing_time'], log_format=log_parser.FORMATS)
+        with pytest.raises(ValueError):
+            GroupStats(['nosuch'], log_format=log_parser.FORMATS)
+        with pytest.raises(ValueError):
+            GroupStats([], ['user_agent'], log_format=log_parser.FORMATS)
+        with pytest.raises(ValueError):
+            GroupStats([], ['backend_processing_time'], log_format=log_parser.ALB)
+
+    def test_fields_missing_from_a_format(self):
+        stats = GroupStats(['backend'], ['backend_processing_time'], percentiles=(50,),
+                           log_format=log_parser.FORMATS)
+        stats(RecordBatch(log_parser.S3, [log_parser.S3.parse(S3_LINE)]))
+        assert stats.report() == [['-', 1, None, None, None]]
+
+    def test_percentile(self):
+        assert record_batch._percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+        assert record_batch._percentile([7.0], 99) == 7.0
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_run_stats
+----------------------------------
+
+Tests for `s3tail.run_stats` module.
+"""
+
+import time
+
+from io import BytesIO
+
+from s3tail.run_stats import RunStats, Progress
+
+
+class TestRunStats(object):
+
+    def test_counts_and_peaks(self):
+        stats = RunStats()
+        stats.count('keys_read')
+        stats.count('keys_read', 2)
+        stats.peak('queued_bytes', 10)
+        stats.peak('queued_bytes', 5)
+        values = stats.to_dict()
+        assert values['keys_read'] == 3
+        assert values['queued_bytes'] == 10
+        assert values['elapsed_seconds'] >= 0
+
+    def test_timed_reader(self):
+        stats = RunStats()
+        reader = stats.timed(BytesIO(b'0123456789'), 'fetch')
+        assert reader.read(4) == b'0123'
+        assert reader.read() == b'456789'
+        values = stats.to_dict()
+        assert values['fetch_bytes'] == 10
+        assert values['fetch_seconds'] >= 0
+
+    def test_summary_includes_rates(self):
+        stats = RunStats()
+        stats.count('fetch_bytes', 2000000)
+        stats.count('fetch_seconds', 2.0)
+        summary = stats.summary()
+        assert 'fetch_bytes: 2000000' in summary
+        assert 'fetch_mb_per_sec: 1.00' in summary
+
+    def test_progress(self):
+        stats = RunStats()
+        stats.count('keys_read', 3)
+        stats.count('lines_read', 12)
+        lines = []
+        progress = Progress(stats, 0.01, lines.append)
+        progress.start()
+        time.sleep(0.1)
+        progress.stop()
+        progress.join()
+        assert lines
+        assert lines[0].startswith('3 keys read (0 cached), 0.0 MB fetched, 12 lines')
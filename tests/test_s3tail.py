@@ -8,13 +8,35 @@ test_s3tail
 Tests for `s3tail` module.
 """
 
+import sys
 import pytest
+import subprocess
 
 from contextlib import contextmanager
 from click.testing import CliRunner
 
 from s3tail import s3tail
 from s3tail import cli
+from s3tail import log_parser
+from s3tail.s3tail import S3Tail
+
+from .conftest import FakeBucket, FakeConnection
+
+
+ELB_LINE = ('%s my-loadbalancer 192.168.131.39:2817 10.0.0.1:80 0.000073 0.001048 0.000057 200 200 '
+            '0 29 "GET http://www.example.com:80/ HTTP/1.1" "curl/7.38.0" - -')
+
+
+def elb_data(count, minute=0):
+    return b''.join((ELB_LINE % ('2015-05-13T23:%02d:%02d.000000Z' % (minute, i))).encode('utf-8') +
+                    b'\n' for i in range(count))
+
+
+def watched(bucket, line_handler, **kwargs):
+    tail = S3Tail(None, bucket.name, 'logs/', line_handler, hours=0,
+                  connection=FakeConnection(bucket), **kwargs)
+    tail.watch()
+    return tail
 
 
 class TestS3tail(object):
@@ -34,6 +56,136 @@ class TestS3tail(object):
         assert help_result.exit_code == 0
         assert 'Show this message and exit.' in help_result.output
 
+    @pytest.mark.skipif(sys.version_info < (3, 7),
+                        reason='the package imports S3Tail eagerly before Python 3.7')
+    def test_command_line_starts_without_heavy_imports(self):
+        imported = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, s3tail.cli; print(" ".join(sorted(sys.modules)))']).decode().split()
+        assert 'boto' not in imported
+        assert 'configstruct' not in imported
+        assert 's3tail.s3tail' not in imported
+
     @classmethod
     def teardown_class(cls):
         pass
+
+
+class TestS3TailWatch(object):
+
+    def test_batches_are_passed_with_the_last_line_number(self):
+        bucket = FakeBucket(contents={'logs/a': elb_data(5)})
+        batches = []
+        watched(bucket, lambda num, batch: batches.append((num, len(batch))),
+                log_format=log_parser.ELB, batch_size=2)
+        assert batches == [(2, 2), (4, 2), (5, 1)]
+
+    def test_unparsed_lines_are_counted(self):
+        bucket = FakeBucket(contents={'logs/a': elb_data(2) + b'not a log line\n'})
+        records = []
+        tail = watched(bucket, lambda num, record: records.append(record),
+                       log_format=log_parser.ELB)
+        assert len(records) == 2
+        assert tail.stats.to_dict()['lines_unparsed'] == 1
+
+    def test_idle_handler_is_called_before_waiting_for_new_keys(self):
+        bucket = FakeBucket(contents={'logs/a': elb_data(3)})
+        events = []
+        tail = S3Tail(None, bucket.name, 'logs/', lambda num, line: events.append(num), hours=0,
+                      connection=FakeConnection(bucket), follow=True,
+                      idle_handler=lambda: (events.append('idle'), tail.stop()))
+        tail.watch()
+        assert events == [1, 2, 3, 'idle']
+
+    def test_cli_output_is_flushed_while_following(self, monkeypatch, tmpdir):
+        bucket = FakeBucket(contents={'logs/a': elb_data(3)})
+        flushed = []
+
+        class Tail(S3Tail):
+            def __init__(self, *args, **kwargs):
+                kwargs.update(connection=FakeConnection(bucket), hours=0)
+                super(Tail, self).__init__(*args, **kwargs)
+                flush = self._idle_handler
+                def idle():
+                    flush()
+                    flushed.append(sys.stdout.buffer.getvalue())
+                    self.stop()
+                self._idle_handler = idle
+
+        monkeypatch.setattr(s3tail, 'S3Tail', Tail)
+        monkeypatch.setattr(cli, '_check_region', lambda region: None)
+        monkeypatch.setattr(cli.signal, 'signal', lambda *args: None) # (leave pytest's handlers)
+        result = CliRunner().invoke(cli.main, ['-c', str(tmpdir.join('rc')), '--follow',
+                                               's3://my-logs/logs/'])
+        assert result.exit_code == 0
+        assert flushed == [elb_data(3)]
+
+    def test_merged_load_balancers_sharing_a_prefix(self):
+        name = ('logs/2015/05/13/123_elasticloadbalancing_us-west-2_%s_20150513T23%02dZ_'
+                '10.0.0.1_a.log')
+        bucket = FakeBucket(contents=dict((name % (lb, minute + 5), elb_data(2, minute))
+                                          for lb in ('a-lb', 'b-lb') for minute in (0, 5, 10)))
+        lines = []
+        watched(bucket, lambda num, line: lines.append(line), merge=True,
+                log_format=log_parser.ELB)
+        times = [record.time for record in lines]
+        assert len(times) == 12
+        assert times == sorted(times)
+
+    def test_prefetched_keys_are_read_from_disk(self, tmpdir):
+        contents = dict(('logs/%d' % i, elb_data(3, i)) for i in range(4))
+        expected = b''.join(contents[name] for name in sorted(contents))
+        for cache_path in (None, str(tmpdir.join('cache'))):
+            lines = []
+            tail = S3Tail(None, 'my-logs', 'logs/', lambda num, line: lines.append(line),
+                          cache_path=cache_path, hours=1, prefetch=2,
+                          connection=FakeConnection(FakeBucket(contents=contents)))
+            tail.watch()
+            tail.cleanup()
+            assert b''.join(bytes(line) + b'\n' for line in lines) == expected
+        assert tail.stats.to_dict()['cache_bytes'] == len(expected)
+
+    def test_skipped_keys_are_never_fetched_ahead(self):
+        contents = dict(('logs/%d' % i, elb_data(3, i)) for i in range(4))
+        events = []
+        def wanted(name, cache_pn, cached):
+            events.append(('wanted', name))
+            return name != 'logs/1'
+        tail = watched(FakeBucket(contents=contents), lambda num, line: None, prefetch=2,
+                       key_handler=wanted,
+                       start_handler=lambda name: events.append(('start', name)))
+        started = [name for event, name in events if event == 'start']
+        assert started == ['logs/0', 'logs/2', 'logs/3']
+        assert events.index(('wanted', 'logs/2')) < events.index(('start', 'logs/0'))
+        values = tail.stats.to_dict()
+        assert values['fetch_bytes'] == 3 * len(elb_data(3))
+        assert values['keys_skipped'] == 1
+
+    def test_cli_inverted_matches_are_filtered_per_line(self, monkeypatch, tmpdir):
+        bucket = FakeBucket(contents={'logs/a': b'one 200\ntwo 500\nthree 200\n'})
+
+        class Tail(S3Tail):
+            def __init__(self, *args, **kwargs):
+                kwargs.update(connection=FakeConnection(bucket), hours=0)
+                super(Tail, self).__init__(*args, **kwargs)
+
+        monkeypatch.setattr(s3tail, 'S3Tail', Tail)
+        monkeypatch.setattr(cli, '_check_region', lambda region: None)
+        monkeypatch.setattr(cli.signal, 'signal', lambda *args: None)
+        args = ['-c', str(tmpdir.join('rc')), '-v', 's3://my-logs/logs/']
+        assert CliRunner().invoke(cli.main, args).exit_code == 2 # (requires a pattern)
+        result = CliRunner().invoke(cli.main, args[:-1] + ['-F', '-g', ' 200'] + args[-1:])
+        assert result.exit_code == 0
+        assert result.output == 'two 500\n'
+
+    def test_cli_stats_fields_are_checked_up_front(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(cli, '_check_region', lambda region: None)
+        args = ['-c', str(tmpdir.join('rc')), 's3://my-logs/logs/']
+        for options in (['--stats', 'user_agent'], ['--stats', 'nosuch'], ['--group-by', 'nosuch'],
+                        ['--log-format', 'alb', '--stats', 'backend_processing_time'],
+                        ['--output', 'fields=elb,nosuch']):
+            result = CliRunner().invoke(cli.main, options + args)
+            assert result.exit_code == 2
+            assert 'field' in result.output
+        result = CliRunner().invoke(cli.main, ['--log-format', 'alb'] + args)
+        assert result.exit_code == 2 # (only used when parsing records)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_searcher
+----------------------------------
+
+Tests for `s3tail.searcher` module.
+"""
+
+import pytest
+import time
+
+from io import BytesIO
+
+from s3tail import searcher
+from s3tail.cache import Cache
+from s3tail.line_reader import LineReader
+
+
+KEYS = {
+    'a': b'one\nneedle two\nthree\n',
+    'b': b'four\nfive\n',
+    'c': b'needle six\nneedle seven\n',
+}
+
+
+class FakeWorker(searcher._Worker):
+    def __init__(self, *args):
+        self._cache = Cache(None, 0)
+        self._line_filter, self._queue, self._chunk_lines = args[6], args[9], args[10]
+
+    def _open_lines(self, key_name, etag, size, skip, cached):
+        return LineReader(BytesIO(KEYS[key_name]), 4, 64, skip=skip)
+
+
+def collect(results):
+    found = {}
+    for key_name, matches in results:
+        if not matches:
+            assert key_name not in found # (opening a key comes first)
+        found.setdefault(key_name, []).append(matches)
+    return found
+
+
+def has_needle(line):
+    return b'needle' in line
+
+
+class TestSearcher(object):
+
+    def test_reports_matches_for_every_key(self, monkeypatch):
+        monkeypatch.setattr(searcher, '_Worker', FakeWorker)
+        search = searcher.Searcher('bucket', None, None, 0, 2, 4, 64, has_needle)
+        results = collect(search.search((name, None, None, 0) for name in sorted(KEYS)))
+        assert results == {
+            'a': [[], [(2, b'needle two')]],
+            'b': [[]],
+            'c': [[], [(1, b'needle six'), (2, b'needle seven')]],
+        }
+
+    def test_skip_applies_to_its_key(self, monkeypatch):
+        monkeypatch.setattr(searcher, '_Worker', FakeWorker)
+        search = searcher.Searcher('bucket', None, None, 0, 2, 4, 64, has_needle)
+        results = collect(search.search([('c', None, None, 2), ('a', None, None, 0)]))
+        assert results == {'a': [[], [(2, b'needle two')]], 'c': [[], [(2, b'needle seven')]]}
+
+    def test_matches_are_sent_in_chunks(self, monkeypatch):
+        monkeypatch.setattr(searcher, '_Worker', FakeWorker)
+        monkeypatch.setattr(searcher.Searcher, 'CHUNK_LINES', 1)
+        search = searcher.Searcher('bucket', None, None, 0, 2, 4, 64, has_needle)
+        results = collect(search.search([('c', None, None, 0)]))
+        assert results == {'c': [[], [(1, b'needle six')], [(2, b'needle seven')]]}
+
+    def test_errors_are_raised(self, monkeypatch):
+        monkeypatch.setattr(searcher, '_Worker', FakeWorker)
+        search = searcher.Searcher('bucket', None, None, 0, 2, 4, 64, has_needle)
+        with pytest.raises(KeyError):
+            list(search.search([('a', None, None, 0), ('missing', None, None, 0)]))
+
+    def test_idle_handler_called_while_waiting_for_keys(self, monkeypatch):
+        monkeypatch.setattr(searcher, '_Worker', FakeWorker)
+        monkeypatch.setattr(searcher.Searcher, 'IDLE_SECONDS', 0.05)
+        idled = []
+        def slow_keys():
+            yield ('a', None, None, 0)
+            time.sleep(0.5) # (e.g. following, waiting for new keys)
+            yield ('c', None, None, 0)
+        search = searcher.Searcher('bucket', None, None, 0, 2, 4, 64, has_needle,
+                                   idle_handler=lambda: idled.append(True))
+        results = collect(search.search(slow_keys()))
+        assert sorted(results) == ['a', 'c']
+        assert idled
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_time_range
+----------------------------------
+
+Tests for `s3tail.time_range` module.
+"""
+
+import pytest
+
+from datetime import datetime, timedelta
+
+from s3tail.time_range import TimeRange, key_time, parse_time
+
+from .conftest import FakeBucket
+
+
+def minutes(start, count, step=5):
+    return [start + timedelta(minutes=i * step) for i in range(count)]
+
+
+START = datetime(2016, 8, 4)
+ELB_BASE = 'AWSLogs/123/elasticloadbalancing/us-west-2/'
+
+
+def elb_names(lb):
+    return [ELB_BASE + t.strftime('%Y/%m/%d/') + '123_elasticloadbalancing_us-west-2_' + lb +
+            t.strftime('_%Y%m%dT%H%MZ_10.0.0.1_abc.log') for t in minutes(START, 3 * 288)]
+
+
+def s3_names():
+    return ['logs/' + t.strftime('%Y-%m-%d-%H-%M-%S-61059F36E0DBF36E')
+            for t in minutes(START, 3 * 288)]
+
+
+class TestTimeRange(object):
+
+    def test_s3_access_logs_are_listed_from_since(self):
+        bucket = FakeBucket(s3_names())
+        time_range = TimeRange(datetime(2016, 8, 5, 10, 0), datetime(2016, 8, 5, 10, 15))
+        names = [k.name for k in time_range.keys(bucket, 'logs/')]
+        assert names == ['logs/2016-08-05-10-%02d-00-61059F36E0DBF36E' % m for m in (0, 5, 10)]
+        assert bucket.listed < 10
+
+    def test_elb_logs_are_listed_by_day_and_stem(self):
+        bucket = FakeBucket(elb_names('one') + elb_names('two') + [ELB_BASE + 'README'])
+        time_range = TimeRange(datetime(2016, 8, 5, 23, 50), datetime(2016, 8, 6, 0, 5))
+        names = [k.name for k in time_range.keys(bucket, ELB_BASE)]
+        assert [n.split('_')[3:5] for n in names] == [
+            ['one', '20160805T2350Z'], ['one', '20160805T2355Z'],
+            ['two', '20160805T2350Z'], ['two', '20160805T2355Z'],
+            ['one', '20160806T0000Z'], ['two', '20160806T0000Z'],
+        ]
+        assert sorted(set(bucket.prefixes[1:])) == [ELB_BASE + '2016/08/05/',
+                                                    ELB_BASE + '2016/08/06/']
+        assert bucket.listed < 20
+
+    def test_cloudtrail_logs_are_recognized(self):
+        name = ('AWSLogs/123/CloudTrail/us-east-1/2016/08/04/'
+                '123_CloudTrail_us-east-1_20160804T1005Z_abc.json.gz')
+        bucket = FakeBucket([name])
+        assert list(TimeRange(datetime(2016, 8, 4, 10, 6)).keys(bucket, '')) == []
+        assert len(list(TimeRange(datetime(2016, 8, 4, 10, 5)).keys(bucket, ''))) == 1
+
+    def test_marker_is_honored(self):
+        bucket = FakeBucket(s3_names())
+        time_range = TimeRange(datetime(2016, 8, 5, 10, 0), datetime(2016, 8, 5, 10, 15))
+        names = [k.name for k in time_range.keys(bucket, 'logs/',
+                                                 'logs/2016-08-05-10-05-00-61059F36E0DBF36E')]
+        assert names == ['logs/2016-08-05-10-10-00-61059F36E0DBF36E']
+
+    def test_unknown_names_are_not_skipped(self):
+        bucket = FakeBucket(['a', 'b'] + s3_names()[:3])
+        names = [k.name for k in TimeRange(until=datetime(2016, 8, 4, 0, 5)).keys(bucket, '')]
+        assert names == ['a', 'b', 'logs/2016-08-04-00-00-00-61059F36E0DBF36E']
+
+    def test_key_time(self):
+        assert key_time('logs/2016-08-04-00-00-00-61059F36E0DBF36E') == datetime(2016, 8, 4)
+        assert key_time('AWSLogs/123/elasticloadbalancing/us-west-2/2016/08/04/'
+                        '123_elasticloadbalancing_us-west-2_lb_20160804T1005Z_10.0.0.1_abc.log') == \
+            datetime(2016, 8, 4, 10, 5)
+        assert key_time('a') is None
+
+    def test_parse_time(self):
+        now = datetime(2016, 8, 4, 12, 0)
+        assert parse_time('15m', now) == datetime(2016, 8, 4, 11, 45)
+        assert parse_time('1d', now) == datetime(2016, 8, 3, 12, 0)
+        assert parse_time('2016-08-04T10:30:05Z') == datetime(2016, 8, 4, 10, 30, 5)
+        assert parse_time('2016-08-04 10:30') == datetime(2016, 8, 4, 10, 30)
+        assert parse_time('2016-08-04') == datetime(2016, 8, 4)
+        with pytest.raises(ValueError):
+            parse_time('yesterday')